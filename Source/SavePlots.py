@@ -1,84 +1,200 @@
-﻿import os
+﻿"""
+Grafici delle metriche (PSNR, MSE, SSIM) delle immagini rumorose e restaurate, salvati in Grafici/plot_<ID>/.
+
+I risultati vengono raggruppati per ID una sola volta e i grafici vengono disegnati in parallelo da un pool di
+processi con il backend Agg. Un grafico viene ridisegnato solo se sono cambiati i dati da cui dipende: l'hash del
+suo contenuto viene confrontato con quello salvato in Grafici/.plot_hashes.json.
+
+Esempio:
+    python SavePlots.py --workers 4
+"""
+import argparse
+import hashlib
+import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
-import matplotlib.pyplot as plt
 
-rumorose_df = pd.read_csv('Immagini_Rumorose/risultati_rumorose.csv')
-restaurate_df = pd.read_csv('Immagini_Restaurate/risultati_restaurate.csv')
+RUMOROSE_CSV = os.path.join('Immagini_Rumorose', 'risultati_rumorose.csv')
+RESTAURATE_CSV = os.path.join('Immagini_Restaurate', 'risultati_restaurate.csv')
+OUTPUT_ROOT = 'Grafici'
+HASHES_FILE = '.plot_hashes.json'
+
+# da incrementare quando cambia l'aspetto dei grafici, per ridisegnarli tutti
+PLOT_VERSION = 1
+
+METRICS = ['PSNR', 'MSE', 'SSIM']
+METRICS_COLORS = {'PSNR': 'blue', 'MSE': 'red', 'SSIM': 'orange'}
+
+
+def load_results(rumorose_csv=RUMOROSE_CSV, restaurate_csv=RESTAURATE_CSV):
+    """
+    Unisce i risultati delle immagini rumorose e restaurate e li raggruppa per ID.
 
-merged_df = pd.merge(rumorose_df, restaurate_df, on='ID', suffixes=('_rumorosa', '_restaurata'))
+    Returns:
+        Dizionario ID -> prima riga unita per quell'ID (il CSV delle restaurate ha una riga per filtro, con le
+        stesse metriche).
+    """
+    rumorose_df = pd.read_csv(rumorose_csv)
+    restaurate_df = pd.read_csv(restaurate_csv)
 
-def get_common_name_by_id(id_val):
-    id_data = merged_df[merged_df['ID'] == id_val]
-    if id_data.empty:
-        return "Nome Sconosciuto"
-    nome_completo = id_data['NomeFile_rumorosa'].values[0]
+    merged_df = pd.merge(rumorose_df, restaurate_df, on='ID', suffixes=('_rumorosa', '_restaurata'))
+    first_rows = merged_df.groupby('ID', sort=True).first()
+    return {int(id_val): row for id_val, row in first_rows.iterrows()}
+
+
+def get_common_name(row):
+    nome_completo = row['NomeFile_rumorosa']
     nome_modificato = re.sub(r'(_[^_]+){1}$', '', nome_completo)
     nome_modificato = re.sub(r'(_)', r'\1rumore_', nome_modificato, count=1)
     return nome_modificato
 
-def barplot_metrics_for_id(id_val, output_folder):
-    id_data = merged_df[merged_df['ID'] == id_val]
-    if id_data.empty:
-        print(f"ID {id_val} non trovato.")
-        return
 
-    metrics = ['PSNR', 'MSE', 'SSIM']
-    ranges = {
-        'PSNR': (10, 40 * 1.2),
-        'MSE': (0, id_data[['MSE_rumorosa', 'MSE_restaurata']].max().max() * 1.2),
-        'SSIM': (0, 1 * 1.2)
-    }
+def plot_jobs(id_val, row, output_root=OUTPUT_ROOT):
+    """
+    Grafici di un ID: un lineplot e un barplot per ogni metrica, ciascuno con i soli dati che disegna.
+    """
+    output_folder = os.path.join(output_root, f'plot_{id_val}')
+    nome_comune = get_common_name(row)
+    mse_max = max(float(row['MSE_rumorosa']), float(row['MSE_restaurata']))
+
+    jobs = []
+    for kind in ('lineplot', 'barplot'):
+        for metric in METRICS:
+            spec = {
+                'kind': kind,
+                'metric': metric,
+                'title': f'{metric} - {nome_comune}',
+                'values': [float(row[f'{metric}_rumorosa']), float(row[f'{metric}_restaurata'])],
+            }
+            if kind == 'barplot':
+                spec['ylim'] = {'PSNR': (10, 40 * 1.2), 'MSE': (0, mse_max * 1.2), 'SSIM': (0, 1 * 1.2)}[metric]
+            jobs.append((os.path.join(output_folder, f'{kind}_{metric}_ID_{id_val}.png'), spec))
+    return jobs
+
+
+def spec_hash(spec):
+    content = json.dumps({'version': PLOT_VERSION, 'spec': spec}, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
-    nome_comune = get_common_name_by_id(id_val)
 
-    for metric in metrics:
-        plt.figure(figsize=(10, 5))
-        values = [id_data[f'{metric}_rumorosa'].values[0], id_data[f'{metric}_restaurata'].values[0]]
+def _init_worker():
+    # backend non interattivo, scelto prima di importare pyplot in ogni processo
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_plot(path, spec):
+    import matplotlib.pyplot as plt
+
+    values = spec['values']
+    metric = spec['metric']
+
+    plt.figure(figsize=(10, 5))
+    if spec['kind'] == 'barplot':
+        ylim = spec['ylim']
         bars = plt.bar(['Rumorosa', 'Restaurata'], values, color=['#b22222', '#32cd32'])
 
         for bar, value in zip(bars, values):
-            plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 0.02 * ranges[metric][1], f'{value:.2f}', ha='center', va='bottom', fontsize=10, color='black', weight='bold')
+            plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 0.02 * ylim[1], f'{value:.2f}',
+                     ha='center', va='bottom', fontsize=10, color='black', weight='bold')
 
         plt.xlabel('Tipo Immagine')
         plt.ylabel(f'Valore della Metrica {metric}')
-        plt.ylim(ranges[metric])
-        plt.title(f'{metric} - {nome_comune}')
+        plt.ylim(ylim)
+        plt.title(spec['title'])
         plt.grid(axis='y')
-        plt.savefig(os.path.join(output_folder, f'barplot_{metric}_ID_{id_val}.png'))
-        plt.close()
-
-def lineplot_metrics_for_id(id_val, output_folder):
-    id_data = merged_df[merged_df['ID'] == id_val]
-    if id_data.empty:
-        print(f"ID {id_val} non trovato.")
-        return
-
-    metrics = ['PSNR', 'MSE', 'SSIM']
-    metrics_colors = {'PSNR': 'blue', 'MSE': 'red', 'SSIM': 'orange'}
-
-    nome_comune = get_common_name_by_id(id_val)
-
-    for metric in metrics:
-        plt.figure(figsize=(10, 5))
-        values = [id_data[f'{metric}_rumorosa'].values[0], id_data[f'{metric}_restaurata'].values[0]]
-        plt.plot(['Rumorosa', 'Restaurata'], values, marker='o', label=metric, color=metrics_colors[metric])
+    else:
+        plt.plot(['Rumorosa', 'Restaurata'], values, marker='o', label=metric, color=METRICS_COLORS[metric])
 
         for i, value in enumerate(values):
-            plt.text(i, value + (0.01 * value), f'{value:.2f}', ha='center', va='bottom', fontsize=10, color='black', weight='bold')
+            plt.text(i, value + (0.01 * value), f'{value:.2f}', ha='center', va='bottom', fontsize=10,
+                     color='black', weight='bold')
 
         plt.xlabel('Tipo Immagine')
         plt.ylabel(f'Valore della Metrica {metric}')
-        plt.title(f'{metric} - {nome_comune}')
+        plt.title(spec['title'])
         plt.grid(True)
-        plt.savefig(os.path.join(output_folder, f'lineplot_{metric}_ID_{id_val}.png'))
-        plt.close()
-
-for id_val in range(1, 13):
-    output_folder = os.path.join('Grafici', f'plot_{id_val}')
-    os.makedirs(output_folder, exist_ok=True)
-
-    lineplot_metrics_for_id(id_val, output_folder)
-    barplot_metrics_for_id(id_val, output_folder)
 
-print("Grafici salvati con successo per tutti gli ID da 1 a 12.")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    plt.savefig(path)
+    plt.close()
+    return path
+
+
+def _load_hashes(output_root):
+    try:
+        with open(os.path.join(output_root, HASHES_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_hashes(output_root, hashes):
+    os.makedirs(output_root, exist_ok=True)
+    with open(os.path.join(output_root, HASHES_FILE), 'w') as f:
+        json.dump(hashes, f, indent=1, sort_keys=True)
+
+
+def generate_plots(ids=None, rumorose_csv=RUMOROSE_CSV, restaurate_csv=RESTAURATE_CSV, output_root=OUTPUT_ROOT,
+                   workers=None, force=False):
+    """
+    Genera i grafici per gli ID richiesti (tutti quelli presenti nei CSV se ids e' None).
+
+    Args:
+        force: ridisegna anche i grafici i cui dati non sono cambiati.
+
+    Returns:
+        (grafici disegnati, grafici invariati)
+    """
+    results = load_results(rumorose_csv, restaurate_csv)
+    if ids is None:
+        ids = sorted(results)
+
+    jobs = []
+    for id_val in ids:
+        row = results.get(id_val)
+        if row is None:
+            print(f"ID {id_val} non trovato.")
+            continue
+        jobs.extend(plot_jobs(id_val, row, output_root))
+
+    hashes = _load_hashes(output_root)
+    pending = []
+    for path, spec in jobs:
+        key = os.path.relpath(path, output_root).replace(os.sep, '/')
+        digest = spec_hash(spec)
+        if force or hashes.get(key) != digest or not os.path.isfile(path):
+            pending.append((key, digest, path, spec))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [(key, digest, executor.submit(render_plot, path, spec)) for key, digest, path, spec in pending]
+            for key, digest, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Errore durante il salvataggio del grafico '{key}': {e}")
+                    continue
+                hashes[key] = digest
+        _save_hashes(output_root, hashes)
+
+    return len(pending), len(jobs) - len(pending)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera i grafici delle metriche in Grafici/plot_<ID>/.")
+    parser.add_argument("--ids", type=int, nargs='+', help="ID da disegnare (default: tutti quelli nei CSV)")
+    parser.add_argument("--workers", type=int, default=None, help="numero di processi")
+    parser.add_argument("--force", action='store_true', help="ridisegna anche i grafici invariati")
+    args = parser.parse_args(argv)
+
+    rendered, unchanged = generate_plots(args.ids, workers=args.workers, force=args.force)
+    print(f"Grafici salvati con successo: {rendered} aggiornati, {unchanged} invariati.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
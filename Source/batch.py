@@ -0,0 +1,150 @@
+﻿"""
+Elaborazione batch senza GUI: applica una configurazione salvata (FilterConfig/*.json) a tutte le immagini di una
+cartella o di un pattern glob, con un pool di processi. Non importa PyQt5.
+
+Esempio:
+    python batch.py FilterConfig/Homomorphic.json Test_Images --output-dir SavedImages/batch --workers 8
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from fft_engine import configure_fft
+from pipeline import run_chain
+from profiling import FilterProfiler, export_chrome_trace
+from results_store import ResultsStore, RESULTS_DB, RESULTS_CSV
+from image_io import save_image
+from metrics import compute_metrics
+from utils import load_filter_configuration, is_grayscale
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+def collect_images(source):
+    # cartella (tutte le immagini contenute) oppure pattern glob, es. "Immagini_Rumorose/*_gaussiano_*.jpg"
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path))
+
+
+def init_worker(threads_per_worker):
+    # un thread OpenCV/FFT per processo: il parallelismo viene dal pool
+    cv2.setNumThreads(threads_per_worker)
+    configure_fft(workers=threads_per_worker)
+    # ogni processo ha il suo stato casuale, altrimenti i rumori sarebbero uguali in tutti i processi
+    np.random.seed()
+
+
+def process_image(path, filters, output_dir, profile=False):
+    """
+    Carica un'immagine, applica la catena, salva il risultato e calcola le metriche rispetto all'originale.
+
+    Returns:
+        (nome del file salvato, (psnr, mse, ssim), numero di pixel, misure dei passi se profile=True altrimenti [])
+    """
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError(f"Immagine non caricata correttamente: {path}")
+
+    # stessa conversione della GUI al caricamento
+    if is_grayscale(image):
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    profiler = FilterProfiler() if profile else None
+    restored_image = run_chain(image, filters, profiler=profiler)
+
+    stem, extension = os.path.splitext(os.path.basename(path))
+    output_name = f"{stem}_restaurata{extension}"
+    save_image(restored_image, os.path.join(output_dir, output_name))
+
+    records = profiler.records if profiler is not None else []
+    return output_name, compute_metrics(image, restored_image), image.shape[0] * image.shape[1], records
+
+
+def run_batch(config_path, source, output_dir, csv_filename, workers, threads_per_worker=1, db_path=RESULTS_DB,
+              trace_path=None):
+    filters = load_filter_configuration(config_path)
+    if filters is None:
+        return 1
+
+    paths = collect_images(source)
+    if not paths:
+        print(f"Nessuna immagine trovata in: {source}")
+        return 1
+
+    os.makedirs(output_dir, exist_ok=True)
+    store = ResultsStore(db_path, csv_filename=csv_filename)
+    # un ID per immagine, riservati tutti insieme; le immagini non elaborate lasciano un buco nella sequenza
+    image_id = store.reserve_ids(len(paths))
+
+    print(f"{len(paths)} immagini, {workers} processi, configurazione: {config_path}")
+
+    start_time = time.perf_counter()
+    done = 0
+    failed = 0
+    total_pixels = 0
+    records = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(threads_per_worker,)) as executor:
+        futures = {executor.submit(process_image, path, filters, output_dir, trace_path is not None): path
+                   for path in paths}
+
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                output_name, metrics, pixels, image_records = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Errore durante l'elaborazione di '{path}': {e}")
+                continue
+
+            # i risultati vengono scritti dal processo principale, in blocchi
+            store.add_run(output_name, filters, metrics, run_id=image_id)
+            image_id += 1
+            done += 1
+            total_pixels += pixels
+            records.extend(image_records)
+
+            elapsed = time.perf_counter() - start_time
+            print(f"[{done + failed}/{len(paths)}] {output_name}  PSNR={metrics[0]:.2f}  "
+                  f"{done / elapsed:.2f} img/s  {total_pixels / 1e6 / elapsed:.2f} MP/s")
+
+    store.close()
+    if trace_path is not None:
+        export_chrome_trace(records, trace_path)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Completato: {done} immagini in {elapsed:.1f} s ({done / elapsed:.2f} img/s, "
+          f"{total_pixels / 1e6 / elapsed:.2f} MP/s), {failed} errori. Risultati in {csv_filename}")
+    return 0 if failed == 0 else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Applica una configurazione di filtri a una cartella di immagini.")
+    parser.add_argument("config", help="configurazione dei filtri (FilterConfig/*.json)")
+    parser.add_argument("source", help="cartella di immagini oppure pattern glob")
+    parser.add_argument("--output-dir", default=os.path.join("SavedImages", "batch"),
+                        help="cartella delle immagini restaurate")
+    parser.add_argument("--db", default=RESULTS_DB, help="archivio SQLite dei risultati (PSNR/MSE/SSIM)")
+    parser.add_argument("--csv", default=RESULTS_CSV, help="CSV dei risultati, aggiornato insieme all'archivio")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="numero di processi")
+    parser.add_argument("--trace", default=None,
+                        help="salva tempo e memoria di ogni filtro come trace JSON (chrome://tracing, Perfetto)")
+    parser.add_argument("--threads-per-worker", type=int, default=1,
+                        help="thread OpenCV/FFT per ogni processo")
+    args = parser.parse_args(argv)
+
+    return run_batch(args.config, args.source, args.output_dir, args.csv, args.workers, args.threads_per_worker,
+                     args.db, args.trace)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
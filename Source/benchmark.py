@@ -0,0 +1,383 @@
+﻿"""
+Benchmark di tutti i filtri e i rumori della pipeline su immagini sintetiche deterministiche (da 256x256 a
+4096x4096, in scala di grigi e a colori), con diversi numeri di thread per OpenCV, NumPy/BLAS e FFT.
+
+I parametri sono quelli delle configurazioni salvate in FilterConfig/ e, per i filtri che non vi compaiono, i valori
+iniziali dei dialog. I risultati vengono scritti in JSON; con --baseline vengono confrontati con un'esecuzione
+precedente e le regressioni oltre la soglia fanno terminare lo script con codice 1.
+
+Con --scaling-workers i filtri spaziali vengono eseguiti anche a tile su un pool di processi (run_chain_parallel),
+riportando speedup ed efficienza rispetto al primo numero di processi indicato. Con --box-kernels le somme su
+finestra quadrata (cv2.boxFilter, usato dalla media contro-armonica tramite power_box_sums) vengono confrontate con
+la convoluzione separabile con kernel di uni, che costa O(k) per pixel.
+
+Esempio:
+    python benchmark.py --sizes 256 512 1024 --threads 1 4 --output bench.json
+    python benchmark.py --sizes 256 512 1024 --threads 1 4 --baseline bench.json --threshold 0.15
+    python benchmark.py --sizes 2048 4096 --scaling-workers 1 2 4 8 16 32
+    python benchmark.py --sizes 1024 2048 --filters "Filtro Contra-Harmonic Mean" --box-kernels 3 15 31 63
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from box_engine import box_sum, power_box_sums
+from fft_engine import configure_fft
+from pipeline import FILTER_FUNCTIONS
+from tile_engine import THREAD_ENV_VARS, filter_halo, create_tile_pool, run_chain_parallel
+
+DEFAULT_SIZES = (256, 512, 1024, 2048, 4096)
+DEFAULT_CHANNELS = (1, 3)
+DEFAULT_REPEATS = 3
+
+# un caso che supera questo tempo non viene ripetuto e le dimensioni maggiori dello stesso filtro vengono saltate
+DEFAULT_MAX_SECONDS = 30.0
+
+# regressione: mediana oltre il (1 + soglia) della baseline
+DEFAULT_THRESHOLD = 0.2
+# ...e piu' lenta di almeno questo tempo, altrimenti e' rumore di misura (casi da pochi millisecondi)
+MIN_REGRESSION_SECONDS = 0.002
+
+# valori iniziali dei dialog, per i filtri che non compaiono nelle configurazioni salvate
+DIALOG_DEFAULT_PARAMS = {
+    "Filtro Mediano": 3,
+    "Filtro MedianBlur": 3,
+    "Filtro Media Aritmetica": 3,
+    "Filtro Media Geometrica": 3,
+    "Filtro Media Geometrica Logaritmica": 3,
+    "Filtro Gaussiano": {'kernel_size': 5, 'sigma': 1.0},
+    "Filtro Contra-Harmonic Mean": {'kernel_size': 3, 'Q': 1.0},
+    "Filtro Notch": {'d0': 30, 'u_k': [10, -10], 'v_k': [0, 0]},
+    "Filtro Shock": 10,
+    "Filtro Homomorphic": {'low': 0.5, 'high': 1.5, 'cutoff': 30},
+    "Diffusione Anisotropica": {'iterations': 10, 'k': 15, 'gamma': 0.1, 'option': 1},
+    "Deconvoluzione ℓ1-TV": {'iterations': 50, 'regularization_weight': 0.001},
+    "Deconvoluzione Wiener": {'kernel_size': 5, 'noise': 0.1},
+    "Filtro Crimmins Speckle Removal": 1,
+}
+
+
+def preset_params(config_dir='FilterConfig'):
+    """
+    Parametri rappresentativi per ogni voce di FILTER_FUNCTIONS: la prima occorrenza nelle configurazioni salvate,
+    altrimenti il valore iniziale del dialog (None per i rumori).
+    """
+    params = dict(DIALOG_DEFAULT_PARAMS)
+    presets = {}
+    for path in sorted(glob.glob(os.path.join(config_dir, '*.json'))):
+        try:
+            with open(path, 'r') as f:
+                filters = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for filter_name, param in filters:
+            # kernel_size 1 e' un caso degenere (nessun filtraggio): non e' rappresentativo
+            if isinstance(param, dict) and param.get('kernel_size') == 1:
+                continue
+            presets.setdefault(filter_name, param)
+    params.update(presets)
+    return {filter_name: params.get(filter_name) for filter_name in FILTER_FUNCTIONS}
+
+
+def make_image(size, channels, seed=0):
+    """
+    Immagine sintetica uint8 deterministica: gradienti, bordi netti, una texture periodica e un po' di rumore,
+    cosi' i filtri adattivi e quelli in frequenza lavorano su contenuti realistici.
+    """
+    rng = np.random.default_rng(seed + 1000 * size + channels)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+
+    layers = []
+    for channel in range(channels):
+        phase = channel * 2.0 * np.pi / 3.0
+        base = 110.0 + 60.0 * np.sin(2.0 * np.pi * (x + 0.5 * y) + phase)
+        base += 40.0 * ((x - 0.5) ** 2 + (y - 0.5) ** 2 < 0.09)  # disco: bordi netti
+        base += 15.0 * np.sign(np.sin(2.0 * np.pi * 24.0 * x))  # texture periodica
+        base += rng.normal(0.0, 8.0, size=(size, size))
+        layers.append(base)
+
+    image = np.clip(np.stack(layers, axis=-1), 0, 255).astype(np.uint8)
+    return image[:, :, 0] if channels == 1 else image
+
+
+def set_threads(threads):
+    cv2.setNumThreads(threads)
+    configure_fft(workers=threads)
+
+
+def time_case(filter_name, param, image, repeats):
+    filter_func = FILTER_FUNCTIONS[filter_name]
+    times = []
+    for _ in range(repeats):
+        np.random.seed(0)  # rumori riproducibili
+        start = time.perf_counter()
+        filter_func(image, param, None, None)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmarks(filter_names, params, sizes, channels_list, threads, repeats, max_seconds):
+    """
+    Esegue i benchmark nel processo corrente con un solo numero di thread.
+
+    Returns:
+        Lista di risultati (dict), uno per combinazione filtro/dimensione/canali.
+    """
+    set_threads(threads)
+    results = []
+    for channels in channels_list:
+        too_slow = set()
+        for size in sizes:
+            image = make_image(size, channels)
+            for filter_name in filter_names:
+                entry = {'function': filter_name, 'size': size, 'channels': channels, 'threads': threads,
+                         'params': params[filter_name]}
+                if filter_name in too_slow:
+                    entry['skipped'] = f"oltre {max_seconds} s su un'immagine piu' piccola"
+                    results.append(entry)
+                    continue
+
+                # riscaldamento (cache delle funzioni di trasferimento, import lazy, pagine di memoria)
+                try:
+                    times = time_case(filter_name, params[filter_name], image, 1)
+                except Exception as e:
+                    entry['error'] = str(e)
+                    results.append(entry)
+                    print(f"Errore durante il benchmark di '{filter_name}' ({size}x{size}x{channels}): {e}")
+                    continue
+
+                if times[0] > max_seconds:
+                    too_slow.add(filter_name)
+                elif repeats > 1:
+                    times = time_case(filter_name, params[filter_name], image, repeats)
+
+                median = statistics.median(times)
+                entry.update({'times': times, 'min': min(times), 'median': median,
+                              'mpix_per_s': size * size / 1e6 / median if median > 0 else None})
+                results.append(entry)
+                print(f"{filter_name:40s} {size:5d}x{size:<5d} c={channels} t={threads:<3d} "
+                      f"{median * 1000:10.1f} ms")
+    return results
+
+
+def spatial_filters(filter_names, params):
+    # filtri con un alone finito e non nullo: si possono dividere in tile (esclusi i rumori e i filtri in frequenza)
+    names = []
+    for filter_name in filter_names:
+        halo = filter_halo(filter_name, params[filter_name])
+        if halo:
+            names.append(filter_name)
+    return names
+
+
+def run_scaling(filter_names, params, sizes, channels_list, workers_list, repeats, max_seconds):
+    """
+    Tempi di run_chain_parallel con ciascun numero di processi (un thread per processo), per i filtri spaziali.
+
+    Returns:
+        Lista di risultati (dict) con speedup ed efficienza rispetto a workers_list[0].
+    """
+    filter_names = spatial_filters(filter_names, params)
+    images = {(size, channels): make_image(size, channels) for channels in channels_list for size in sizes}
+    medians = {}
+    results = []
+    for workers in workers_list:
+        with create_tile_pool(workers) as pool:
+            too_slow = set()
+            for (size, channels), image in images.items():
+                for filter_name in filter_names:
+                    entry = {'function': filter_name, 'size': size, 'channels': channels, 'workers': workers,
+                             'params': params[filter_name]}
+                    if (filter_name, channels) in too_slow:
+                        entry['skipped'] = f"oltre {max_seconds} s su un'immagine piu' piccola"
+                        results.append(entry)
+                        continue
+
+                    filters = [(filter_name, params[filter_name])]
+                    times = []
+                    # la prima esecuzione fa anche da riscaldamento (avvio dei processi, import lazy)
+                    for _ in range(repeats + 1):
+                        start = time.perf_counter()
+                        run_chain_parallel(image, filters, workers, executor=pool)
+                        times.append(time.perf_counter() - start)
+                        if times[0] > max_seconds:
+                            too_slow.add((filter_name, channels))
+                            break
+                    times = times[1:] or times
+
+                    median = statistics.median(times)
+                    medians[(filter_name, size, channels, workers)] = median
+                    base = medians.get((filter_name, size, channels, workers_list[0]))
+                    speedup = base / median if base and median > 0 else None
+                    entry.update({'times': times, 'median': median, 'speedup': speedup,
+                                  'efficiency': speedup * workers_list[0] / workers if speedup else None})
+                    results.append(entry)
+                    scaling = f"speedup {speedup:5.2f}x  efficienza {entry['efficiency']:4.0%}" if speedup else ""
+                    print(f"{filter_name:40s} {size:5d}x{size:<5d} c={channels} w={workers:<3d} "
+                          f"{median * 1000:10.1f} ms  {scaling}")
+    return results
+
+
+def run_box_sums(sizes, channels_list, kernels, repeats):
+    """
+    Tempi delle somme su finestra ksize x ksize di un'immagine float64: cv2.sepFilter2D con kernel di uni,
+    cv2.boxFilter (box_sum) e power_box_sums con i due esponenti della media contro-armonica.
+
+    Returns:
+        Lista di risultati (dict) con il rapporto tra convoluzione separabile e boxFilter.
+    """
+    results = []
+    for channels in channels_list:
+        for size in sizes:
+            image = make_image(size, channels)
+            values = image.astype(np.float64)
+            for ksize in kernels:
+                ones = np.ones(ksize, dtype=np.float64)
+                cases = {
+                    'sepFilter2D': lambda: cv2.sepFilter2D(values, -1, ones, ones, borderType=cv2.BORDER_REFLECT),
+                    'boxFilter': lambda: box_sum(values, ksize),
+                    'power_box_sums': lambda: power_box_sums(image, ksize, (-1.0, 0.0)),
+                }
+                entry = {'size': size, 'channels': channels, 'ksize': ksize}
+                for name, case in cases.items():
+                    times = []
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        case()
+                        times.append(time.perf_counter() - start)
+                    entry[name] = statistics.median(times)
+                entry['ratio'] = entry['sepFilter2D'] / entry['boxFilter']
+                results.append(entry)
+                print(f"box k={ksize:<3d} {size:5d}x{size:<5d} c={channels} "
+                      f"sepFilter2D {entry['sepFilter2D'] * 1000:8.1f} ms  boxFilter {entry['boxFilter'] * 1000:8.1f} ms"
+                      f"  power_box_sums {entry['power_box_sums'] * 1000:8.1f} ms  ({entry['ratio']:.1f}x)")
+    return results
+
+
+def run_in_subprocess(argv, threads):
+    # nuovo interprete con le variabili dei thread impostate prima dell'import di NumPy
+    env = dict(os.environ)
+    for name in THREAD_ENV_VARS:
+        env[name] = str(threads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'results.json')
+        command = [sys.executable, os.path.abspath(__file__)] + argv + ['--threads', str(threads),
+                                                                        '--output', output]
+        subprocess.run(command, env=env, check=True)
+        with open(output, 'r') as f:
+            return json.load(f)['results']
+
+
+def result_key(entry):
+    return entry['function'], entry['size'], entry['channels'], entry['threads']
+
+
+def compare_with_baseline(results, baseline_results, threshold):
+    """
+    Confronta le mediane con quelle della baseline.
+
+    Returns:
+        Lista di (chiave, mediana baseline, mediana attuale, rapporto) per i casi oltre la soglia.
+    """
+    baseline = {result_key(entry): entry for entry in baseline_results if 'median' in entry}
+    regressions = []
+    for entry in results:
+        reference = baseline.get(result_key(entry))
+        if reference is None or 'median' not in entry:
+            continue
+        ratio = entry['median'] / reference['median']
+        if ratio > 1.0 + threshold and entry['median'] - reference['median'] > MIN_REGRESSION_SECONDS:
+            regressions.append((result_key(entry), reference['median'], entry['median'], ratio))
+    return regressions
+
+
+def metadata():
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dei filtri su immagini sintetiche.")
+    parser.add_argument("--sizes", type=int, nargs='+', default=list(DEFAULT_SIZES), help="lati delle immagini")
+    parser.add_argument("--channels", type=int, nargs='+', default=list(DEFAULT_CHANNELS), choices=(1, 3),
+                        help="1 (scala di grigi) e/o 3 (colore)")
+    parser.add_argument("--threads", type=int, nargs='+', default=[1], help="numeri di thread da provare")
+    parser.add_argument("--filters", nargs='+', default=None, help="sottoinsieme di filtri (nomi della GUI)")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="ripetizioni per caso")
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS,
+                        help="oltre questo tempo un caso non viene ripetuto e le dimensioni maggiori sono saltate")
+    parser.add_argument("--scaling-workers", type=int, nargs='+', default=None,
+                        help="numeri di processi per la misura della scalabilita' a tile dei filtri spaziali")
+    parser.add_argument("--box-kernels", type=int, nargs='+', default=None,
+                        help="lati delle finestre per il confronto tra boxFilter e convoluzione separabile")
+    parser.add_argument("--output", default=None, help="file JSON dei risultati")
+    parser.add_argument("--baseline", default=None, help="risultati JSON di riferimento")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="rallentamento relativo oltre il quale un caso e' una regressione")
+    args = parser.parse_args(argv)
+
+    filter_names = args.filters or list(FILTER_FUNCTIONS)
+    unknown = [filter_name for filter_name in filter_names if filter_name not in FILTER_FUNCTIONS]
+    if unknown:
+        print(f"Filtri non riconosciuti: {', '.join(unknown)}")
+        return 1
+    params = preset_params()
+
+    # letta subito: --output puo' essere lo stesso file della baseline
+    baseline_results = None
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline_results = json.load(f)['results']
+
+    if len(args.threads) == 1:
+        results = run_benchmarks(filter_names, params, args.sizes, args.channels, args.threads[0], args.repeats,
+                                 args.max_seconds)
+    else:
+        child_argv = ['--sizes', *map(str, args.sizes), '--channels', *map(str, args.channels),
+                      '--filters', *filter_names, '--repeats', str(args.repeats),
+                      '--max-seconds', str(args.max_seconds)]
+        results = []
+        for threads in args.threads:
+            results.extend(run_in_subprocess(child_argv, threads))
+
+    report = {'meta': metadata(), 'results': results}
+    if args.scaling_workers:
+        report['scaling'] = run_scaling(filter_names, params, args.sizes, args.channels, args.scaling_workers,
+                                        args.repeats, args.max_seconds)
+    if args.box_kernels:
+        report['box'] = run_box_sums(args.sizes, args.channels, args.box_kernels, args.repeats)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, ensure_ascii=False)
+        print(f"Risultati salvati in {args.output}")
+
+    if baseline_results is not None:
+        regressions = compare_with_baseline(results, baseline_results, args.threshold)
+        for (filter_name, size, channels, threads), before, after, ratio in regressions:
+            print(f"REGRESSIONE {filter_name} {size}x{size} c={channels} t={threads}: "
+                  f"{before * 1000:.1f} ms -> {after * 1000:.1f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print(f"Nessuna regressione oltre il {args.threshold:.0%} rispetto a {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
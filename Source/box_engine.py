@@ -0,0 +1,66 @@
+﻿import cv2
+import numpy as np
+
+
+def box_sum(image, ksize, normalize=False):
+    """
+    Somma (o media, con normalize=True) su finestre ksize x ksize in O(1) per pixel, indipendente da ksize.
+
+    Bordo cv2.BORDER_REFLECT come le vecchie implementazioni a finestre; tutti i canali in un unico passaggio.
+    """
+    return cv2.boxFilter(image, -1, (ksize, ksize), normalize=normalize, borderType=cv2.BORDER_REFLECT)
+
+
+def power_box_sums(image, ksize, exponents, zero=1e-10):
+    """
+    Somme su finestre ksize x ksize di x ** e per ogni esponente e, con i pixel nulli sostituiti da zero come
+    nell'implementazione originale della media contro-armonica. Ogni somma e' un cv2.boxFilter in float64, in O(1)
+    per pixel come box_sum.
+
+    Le somme scorrevoli di cv2.boxFilter aggiungono il valore che entra nella finestra e sottraggono quello che esce:
+    con un esponente negativo zero ** e supera di molti ordini di grandezza gli altri termini e lascerebbe un residuo
+    di cancellazione dopo essere uscito. I pixel nulli vengono quindi esclusi dalle potenze e contati a parte (somma
+    esatta di interi); il loro contributo count * zero ** e viene aggiunto alla fine.
+
+    Returns:
+        Lista di array float64 della forma di image, una somma per esponente.
+    """
+    zeros = image == 0
+    if image.dtype == np.uint8:
+        # potenze dei 256 livelli; il livello 0 contribuisce solo tramite il conteggio
+        levels = np.arange(256, dtype=np.float64)
+        levels[0] = 1.0
+        tables = [np.power(levels, exponent) for exponent in exponents]
+        for table in tables:
+            table[0] = 0.0
+        powers = [table[image] for table in tables]
+    else:
+        base = np.where(zeros, 1.0, image.astype(np.float64))
+        powers = [np.where(zeros, 0.0, np.power(base, exponent)) for exponent in exponents]
+
+    sums = [box_sum(power, ksize) for power in powers]
+    if zeros.any():
+        # conteggi interi esatti in float32 (fino a 2^24 pixel per finestra), corretti solo dove la finestra
+        # contiene almeno un pixel nullo
+        count = cv2.boxFilter(zeros.view(np.uint8), cv2.CV_32F, (ksize, ksize), normalize=False,
+                              borderType=cv2.BORDER_REFLECT)
+        hit = count > 0
+        count = count[hit].astype(np.float64)
+        for total, exponent in zip(sums, exponents):
+            total[hit] += count * np.power(zero, exponent)
+    return sums
+
+
+def box_mean(image, ksize):
+    return box_sum(image, ksize, normalize=True)
+
+
+def log_box_mean(image, ksize, epsilon=1e-5):
+    """
+    Media geometrica locale calcolata nel dominio logaritmico: exp(media(log(x + epsilon))).
+
+    Il logaritmo dell'immagine viene calcolato una sola volta e la media di ogni finestra si ottiene con un
+    box filter, quindi non ci sono prodotti di k^2 termini che vanno in overflow.
+    """
+    log_image = np.log(image.astype(np.float32) + np.float32(epsilon))
+    return np.exp(box_mean(log_image, ksize))
@@ -0,0 +1,32 @@
+﻿import threading
+
+
+class FilterCancelled(Exception):
+    """Sollevata all'interno di un filtro quando l'elaborazione e' stata annullata."""
+
+
+class CancellationToken:
+    """
+    Richiesta di annullamento cooperativa: i filtri iterativi la controllano a ogni iterazione (o blocco di righe)
+    e si interrompono sollevando FilterCancelled, cosi' un'elaborazione superata non blocca chi la annulla.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise FilterCancelled()
+
+
+def check_cancelled(cancel_token):
+    # i filtri accettano cancel_token=None quando vengono usati fuori dal FilterWorker
+    if cancel_token is not None:
+        cancel_token.check()
@@ -0,0 +1,81 @@
+﻿import numpy as np
+
+# passo del sottocampionamento (righe e colonne) con cui si misura la variazione tra due iterazioni
+DEFAULT_STRIDE = 4
+
+
+def relative_change(previous, current):
+    # ||current - previous|| / ||previous||, in float64 (i campioni sono piccoli)
+    previous = np.asarray(previous, dtype=np.float64)
+    change = np.linalg.norm(np.asarray(current, dtype=np.float64) - previous)
+    norm = np.linalg.norm(previous)
+    return change / norm if norm > 0 else change
+
+
+class ConvergenceMonitor:
+    """
+    Arresto anticipato dei filtri iterativi: a ogni iterazione confronta l'immagine con quella dell'iterazione
+    precedente su una griglia sottocampionata e segnala la convergenza quando la variazione relativa scende sotto
+    la tolleranza. Con tolerance=None non misura nulla e le iterazioni sono sempre quelle richieste.
+    """
+
+    def __init__(self, tolerance=None, stride=DEFAULT_STRIDE):
+        self.tolerance = tolerance
+        self.stride = stride
+        self.last_change = None
+        self._previous = None
+
+    @property
+    def enabled(self):
+        return self.tolerance is not None
+
+    def _sample(self, data):
+        return data[::self.stride, ::self.stride].copy()
+
+    def start(self, data):
+        if self.enabled:
+            self._previous = self._sample(data)
+
+    def converged(self, data):
+        if not self.enabled:
+            return False
+
+        current = self._sample(data)
+        if self._previous is None:
+            self._previous = current
+            return False
+
+        self.last_change = relative_change(self._previous, current)
+        self._previous = current
+        return self.last_change <= self.tolerance
+
+
+def iteration_param(iterations, tolerance=None):
+    # senza tolleranza resta il solo numero di iterazioni, come nelle configurazioni salvate finora
+    if tolerance is None:
+        return iterations
+    return {'iterations': iterations, 'tolerance': tolerance}
+
+
+def split_iteration_param(param):
+    """
+    Parametri dei filtri Shock e Crimmins: il solo numero di iterazioni oppure {'iterations': n, 'tolerance': t}.
+
+    Returns:
+        (iterazioni, tolleranza o None)
+    """
+    if isinstance(param, dict):
+        return param['iterations'], param.get('tolerance')
+    return param, None
+
+
+def format_iterations(iterations, param):
+    # testo breve per la lista dei filtri, es. "23/500 iterazioni"
+    limit, _ = split_iteration_param(param)
+    return f"{iterations}/{limit} iterazioni"
+
+
+def report_iterations(report, iterations):
+    # i filtri accettano report=None quando vengono usati fuori dalla pipeline
+    if report is not None:
+        report(iterations)
@@ -0,0 +1,354 @@
+﻿"""
+Verifica di equivalenza tra i filtri ottimizzati (filters.py) e le implementazioni di riferimento congelate
+(reference_filters.py), su immagini casuali di forme, tipi e numero di canali diversi.
+
+Ogni filtro ha una tolleranza: esatta per mediana, statistiche d'ordine e Crimmins, scarto massimo di un livello
+per i filtri in virgola mobile, PSNR minimo per i filtri iterativi (PDE). I filtri il cui algoritmo e' stato
+sostituito (l1-TV) devono invece restaurare l'immagine pulita almeno quanto il riferimento. Accanto a ogni verifica
+viene riportato lo speedup.
+Con --stack-size N (4 se non indicato, 0 per saltarle) ogni filtro viene anche applicato a una pila N x H x W x C e
+confrontato esattamente con le chiamate sulle singole immagini. Con --tile-size T (24 se non indicato, 0 per
+saltarle) le catene di TILED_CHECKS vengono eseguite a tile di lato T (run_chain_tiled e run_chain_parallel) e
+confrontate con run_chain sull'immagine intera, bordi compresi.
+Lo script termina con codice 1 se almeno una verifica fallisce.
+
+Esempio:
+    python equivalence.py --trials 3 --max-side 96
+    python equivalence.py --filters median_filter crimmins_speckle_removal
+"""
+import argparse
+import time
+
+import numpy as np
+
+import filters
+import reference_filters
+from pipeline import run_chain
+from tile_engine import chain_bytes_per_element, chain_halo, create_tile_pool, run_chain_parallel, run_chain_tiled
+
+
+def exact():
+    return 'max_abs', 0
+
+
+def max_abs(levels):
+    return 'max_abs', levels
+
+
+def min_psnr(db):
+    return 'psnr', db
+
+
+def no_worse_than_reference(margin_db):
+    # PSNR rispetto all'immagine senza rumore non inferiore a quello del riferimento (meno un margine)
+    return 'quality', margin_db
+
+
+# (nome, funzione di riferimento, funzione ottimizzata, parametri da provare, tolleranza, tipi di dato)
+CHECKS = [
+    ('median_filter', reference_filters.median_filter, filters.median_filter,
+     [{'ksize': 3}, {'ksize': 5}, {'ksize': 9}, {'ksize': 21}], exact(), ('uint8', 'uint16', 'float32')),
+    ('median_blur_filter', reference_filters.median_blur_filter, filters.median_blur_filter,
+     [{'ksize': 3}, {'ksize': 5}], exact(), ('uint8',)),
+    # esatto sugli interi; in float32 l'ordine delle somme cambia l'arrotondamento
+    ('mean_filter', reference_filters.mean_filter, filters.mean_filter,
+     [{'kernel_size': 3}, {'kernel_size': 5}], max_abs(1e-3), ('uint8', 'uint16', 'float32')),
+    # la versione originale con il prodotto va in overflow in float32 da 5x5 in su: il riferimento e' la media
+    # geometrica calcolata con i logaritmi, matematicamente identica
+    ('geometric_mean_filter', reference_filters.log_geometric_mean_filter, filters.geometric_mean_filter,
+     [{'kernel_size': 3}, {'kernel_size': 5}], max_abs(1), ('uint8', 'uint16', 'float32')),
+    ('log_geometric_mean_filter', reference_filters.log_geometric_mean_filter, filters.log_geometric_mean_filter,
+     [{'kernel_size': 3}, {'kernel_size': 7}], max_abs(1), ('uint8', 'uint16', 'float32')),
+    ('gaussian_filter', reference_filters.gaussian_filter, filters.gaussian_filter,
+     [{'kernel_size': 5, 'sigma': 1.0}], exact(), ('uint8',)),
+    ('contra_harmonic_mean_filter', reference_filters.contra_harmonic_mean_filter,
+     filters.contra_harmonic_mean_filter,
+     [{'kernel_size': 3, 'Q': 1.5}, {'kernel_size': 5, 'Q': -1.0}], max_abs(1), ('uint8', 'uint16', 'float32')),
+    ('notch_filter', reference_filters.notch_filter, filters.notch_filter,
+     [{'d0': 4, 'u_k': [8, -8], 'v_k': [0, 5]}], max_abs(1), ('uint8', 'uint16', 'float32')),
+    ('homomorphic_filter', reference_filters.homomorphic_filter, filters.homomorphic_filter,
+     [{'low': 0.5, 'high': 1.5, 'cutoff': 30}, {'low': 0.8, 'high': 1.9, 'cutoff': 10}], max_abs(1),
+     ('uint8', 'uint16', 'float32')),
+    ('shock_filter', reference_filters.shock_filter, filters.shock_filter,
+     [{'iterations': 10}], min_psnr(40), ('uint8',)),
+    ('anisotropic_diffusion', reference_filters.anisotropic_diffusion, filters.anisotropic_diffusion,
+     [{'iterations': 10, 'k': 15, 'gamma': 0.1, 'option': 1}, {'iterations': 20, 'k': 0.1, 'gamma': 0.2, 'option': 2}],
+     min_psnr(40), ('uint8',)),
+    # risolutore primale-duale al posto della discesa euristica: risultati diversi, confrontati sulla qualita'
+    ('l1_tv_deconvolution', reference_filters.l1_tv_deconvolution, filters.l1_tv_deconvolution,
+     [{'iterations': 20, 'regularization_weight': 0.007}, {'iterations': 5, 'regularization_weight': 0.007}],
+     no_worse_than_reference(0.5), ('uint8', 'uint16', 'float32')),
+    ('wiener_deconvolution', reference_filters.wiener_deconvolution, filters.wiener_deconvolution,
+     [{'kernel_size': 5, 'noise': 0.1}, {'kernel_size': 3, 'noise': 0.45}, {'kernel_size': 4, 'noise': 0.05}],
+     max_abs(1), ('uint8', 'uint16', 'float32')),
+    ('crimmins_speckle_removal', reference_filters.crimmins_speckle_removal, filters.crimmins_speckle_removal,
+     [{'iterations': 1}, {'iterations': 5}], exact(), ('uint8',)),
+]
+
+# filtri che dividono per 255 e restituiscono uint8: le loro immagini uint16 restano nella scala 0-255, perche' con
+# i 12 bit delle altre verifiche il risultato sarebbe saturo e il confronto non direbbe nulla
+EIGHT_BIT_FILTERS = {'geometric_mean_filter', 'log_geometric_mean_filter', 'contra_harmonic_mean_filter',
+                     'notch_filter', 'homomorphic_filter', 'l1_tv_deconvolution', 'wiener_deconvolution'}
+
+# filtri verificati solo sulle pile (nessuna implementazione di riferimento separata); i rumori vengono confrontati
+# con lo stesso seme
+STACK_ONLY_CHECKS = [
+    ('median_filter', filters.median_filter, [{'ksize': 9}]),
+    ('anisotropic_diffusion', filters.anisotropic_diffusion,
+     [{'iterations': 50, 'k': 15, 'gamma': 0.1, 'option': 1, 'tolerance': 1e-3}]),
+    ('add_gaussian_noise', filters.add_gaussian_noise, [{}]),
+    ('add_salt_pepper_noise', filters.add_salt_pepper_noise, [{}]),
+    ('add_uniform_noise', filters.add_uniform_noise, [{}]),
+    ('add_film_grain_noise', filters.add_film_grain_noise, [{}]),
+    ('add_periodic_noise', filters.add_periodic_noise, [{}]),
+]
+
+# catene eseguite a tile e confrontate con l'immagine intera: (nome della funzione di filters.py, catena, tolleranza).
+# La deconvoluzione di Wiener con PSF non ha supporto finito: con l'alone di WIENER_PSF_HALO_FACTOR raggi il
+# risultato a tile e' un'approssimazione
+_ANISOTROPIC = ('Diffusione Anisotropica', {'iterations': 10, 'k': 15, 'gamma': 0.1, 'option': 1})
+_CRIMMINS = ('Filtro Crimmins Speckle Removal', 4)
+TILED_CHECKS = [
+    ('median_filter', [('Filtro Mediano', 5)], exact()),
+    ('mean_filter', [('Filtro Media Aritmetica', 5)], exact()),
+    ('geometric_mean_filter', [('Filtro Media Geometrica', 3)], exact()),
+    ('gaussian_filter', [('Filtro Gaussiano', {'kernel_size': 5, 'sigma': 1.0})], exact()),
+    ('contra_harmonic_mean_filter', [('Filtro Contra-Harmonic Mean', {'kernel_size': 3, 'Q': 1.5})], exact()),
+    ('shock_filter', [('Filtro Shock', 6)], exact()),
+    ('anisotropic_diffusion', [_ANISOTROPIC], exact()),
+    ('anisotropic_diffusion',
+     [('Filtro Mediano', 3), _ANISOTROPIC, ('Filtro Gaussiano', {'kernel_size': 3, 'sigma': 0.8}), _CRIMMINS], exact()),
+    ('l1_tv_deconvolution', [('Deconvoluzione ℓ1-TV', {'iterations': 6, 'regularization_weight': 0.007})], exact()),
+    ('wiener_deconvolution', [('Deconvoluzione Wiener', {'kernel_size': 5, 'noise': 0.1})], exact()),
+    ('wiener_psf_deconvolution',
+     [('Deconvoluzione Wiener', {'psf': 'gaussian', 'psf_size': 1.5, 'psf_angle': 0.0, 'noise': 0.01})],
+     min_psnr(30)),
+    ('crimmins_speckle_removal', [_CRIMMINS], exact()),
+]
+
+# scala di grigi (HxW) e colore (HxWx3); le immagini con tre canali uguali vengono convertite in HxW al
+# caricamento (gui.py, batch.py), quindi non arrivano ai filtri
+CHANNEL_LAYOUTS = (1, 3)
+
+
+def random_image(rng, dtype, channels, min_side, max_side, eight_bit=False):
+    """
+    Immagine casuale con zone uniformi, gradienti, rumore e pixel saturi (0 e massimo), forma non quadrata.
+    Con eight_bit le immagini uint16 restano nella scala 0-255.
+
+    Returns:
+        (immagine rumorosa, stessa immagine senza rumore)
+    """
+    rows, cols = rng.integers(min_side, max_side + 1, size=2)
+    # uint16 a passi di 16 entro 4080: al piu' 256 livelli, percorso a ranghi uint8 della mediana
+    top, step = (255.0, 1) if dtype != 'uint16' or eight_bit else (4080.0, 16)
+
+    y, x = np.mgrid[0:rows, 0:cols]
+    planes = []
+    clean_planes = []
+    for _ in range(channels):
+        plane = top * (0.5 + 0.3 * np.sin(x / rng.uniform(3, 12)) * np.cos(y / rng.uniform(3, 12)))
+        clean_planes.append(plane.copy())
+        plane += rng.normal(0, 0.08 * top, size=(rows, cols))
+        impulses = rng.random((rows, cols))
+        plane[impulses < 0.03] = 0
+        plane[impulses > 0.97] = top
+        planes.append(np.clip(plane, 0, top))
+
+    images = []
+    for layers in (planes, clean_planes):
+        image = layers[0] if channels == 1 else np.stack(layers, axis=-1)
+        images.append(image.astype(np.float32) if dtype == 'float32' else (np.round(image / step) * step).astype(dtype))
+    return tuple(images)
+
+
+def psnr(first, second):
+    mse = float(np.mean((first.astype(np.float64) - second.astype(np.float64)) ** 2))
+    return float('inf') if mse == 0 else 10.0 * np.log10(255.0 ** 2 / mse)
+
+
+def compare(reference, optimized, tolerance, clean=None):
+    """
+    Returns:
+        (superata, valore misurato): scarto massimo, PSNR in dB oppure, per 'quality', differenza in dB tra il PSNR
+        del risultato e quello del riferimento rispetto all'immagine pulita.
+    """
+    if reference.shape != optimized.shape or reference.dtype != optimized.dtype:
+        return False, f"forma/tipo {optimized.shape} {optimized.dtype} invece di {reference.shape} {reference.dtype}"
+
+    difference = reference.astype(np.float64) - optimized.astype(np.float64)
+    kind, limit = tolerance
+    if kind == 'max_abs':
+        value = float(np.abs(difference).max()) if difference.size else 0.0
+        return value <= limit, value
+
+    if kind == 'quality':
+        value = psnr(clean, optimized) - psnr(clean, reference)
+        return value >= -limit, value
+
+    value = psnr(reference, optimized)
+    return value >= limit, value
+
+
+def timed(func, image, params):
+    start = time.perf_counter()
+    result = func(image.copy(), **params)
+    return result, time.perf_counter() - start
+
+
+def run_checks(names=None, trials=3, seed=0, min_side=16, max_side=64):
+    """
+    Esegue le verifiche e stampa una riga per ognuna.
+
+    Returns:
+        Lista di (nome, parametri, forma, tipo, superata, valore, speedup).
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for name, reference_func, optimized_func, param_sets, tolerance, dtypes in CHECKS:
+        if names is not None and name not in names:
+            continue
+
+        for params in param_sets:
+            for trial in range(trials):
+                dtype = dtypes[trial % len(dtypes)]
+                channels = CHANNEL_LAYOUTS[(trial + trial // max(len(dtypes), len(CHANNEL_LAYOUTS)))
+                                           % len(CHANNEL_LAYOUTS)]
+                image, clean = random_image(rng, dtype, channels, min_side, max_side, name in EIGHT_BIT_FILTERS)
+
+                reference, reference_time = timed(reference_func, image, params)
+                optimized, optimized_time = timed(optimized_func, image, params)
+                passed, value = compare(reference, optimized, tolerance, clean)
+
+                speedup = reference_time / optimized_time if optimized_time > 0 else float('inf')
+                results.append((name, params, image.shape, dtype, passed, value, speedup))
+
+                kind, limit = tolerance
+                if isinstance(value, str):
+                    measured = value
+                elif kind == 'max_abs':
+                    measured = f"max |d| = {value:g} (<= {limit})"
+                elif kind == 'quality':
+                    measured = f"PSNR sull'immagine pulita {value:+.2f} dB rispetto al riferimento (>= -{limit})"
+                else:
+                    measured = f"PSNR = {value:.1f} dB (>= {limit})"
+                print(f"{'OK  ' if passed else 'FAIL'} {name:28s} {str(image.shape):14s} {dtype:8s} {params}  "
+                      f"{measured}  speedup {speedup:.1f}x")
+    return results
+
+
+def per_image(func, stack, **params):
+    # chiamate singole sulle immagini della pila; quelle in scala di grigi vengono passate come HxW
+    return np.stack([func(image[:, :, 0] if image.shape[2] == 1 else image, **params).reshape(image.shape)
+                     for image in stack])
+
+
+def run_stack_checks(names=None, stack_size=4, seed=0, min_side=16, max_side=64):
+    """
+    Confronta ogni filtro applicato a una pila N x H x W x C con le chiamate sulle singole immagini (uint8, in scala
+    di grigi come N x H x W x 1 e a colori). Lo speedup e' quello della pila rispetto alle chiamate singole.
+
+    Returns:
+        Lista di (nome, parametri, forma, tipo, superata, valore, speedup), come run_checks.
+    """
+    rng = np.random.default_rng(seed)
+    checks = [(name, optimized_func, param_sets) for name, _, optimized_func, param_sets, _, _ in CHECKS]
+    results = []
+    for name, func, param_sets in checks + STACK_ONLY_CHECKS:
+        if names is not None and name not in names:
+            continue
+
+        for params in param_sets:
+            for channels in CHANNEL_LAYOUTS:
+                images = [random_image(rng, 'uint8', channels, min_side, max_side)[0] for _ in range(stack_size)]
+                rows = min(image.shape[0] for image in images)
+                cols = min(image.shape[1] for image in images)
+                stack = np.stack([image[:rows, :cols].reshape(rows, cols, channels) for image in images])
+
+                np.random.seed(seed)
+                single, single_time = timed(lambda data, **kwargs: per_image(func, data, **kwargs), stack, params)
+                np.random.seed(seed)
+                stacked, stacked_time = timed(func, stack, params)
+                passed, value = compare(single, stacked, exact())
+
+                speedup = single_time / stacked_time if stacked_time > 0 else float('inf')
+                results.append((name, params, stack.shape, 'uint8', passed, value, speedup))
+                measured = value if isinstance(value, str) else f"max |d| = {value:g} (<= 0)"
+                print(f"{'OK  ' if passed else 'FAIL'} {name:28s} {str(stack.shape):18s} pila     {params}  "
+                      f"{measured}  speedup {speedup:.1f}x")
+    return results
+
+
+def run_tiled_checks(names=None, tile_size=24, workers=2, seed=0, min_side=16, max_side=64):
+    """
+    Confronta le catene di TILED_CHECKS eseguite a tile (in sequenza e su un pool di workers processi) con run_chain
+    sull'immagine intera. Il budget di memoria e' scelto per tile di circa tile_size pixel, cosi' anche le immagini
+    piccole vengono divise e quasi ogni tile tocca un bordo.
+
+    Returns:
+        Lista di (nome, catena, forma, tipo, superata, valore, speedup), come run_checks; lo speedup non e' misurato
+        (NaN): i tile servono a limitare la memoria, non a fare prima.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    with create_tile_pool(workers) as pool:
+        for name, chain, tolerance in TILED_CHECKS:
+            if names is not None and name not in names:
+                continue
+
+            for channels in CHANNEL_LAYOUTS:
+                image = random_image(rng, 'uint8', channels, min_side, max_side)[0]
+                budget = chain_bytes_per_element(chain) * channels * (tile_size + 2 * chain_halo(chain)) ** 2
+
+                whole = run_chain(image, chain)
+                tiled = np.empty_like(image)
+                run_chain_tiled(image, tiled, chain, budget)
+                parallel = run_chain_parallel(image, chain, workers, budget * workers, executor=pool)
+
+                kind, limit = tolerance
+                for mode, result in (('tile', tiled), ('pool', parallel)):
+                    passed, value = compare(whole, result, tolerance)
+                    results.append((name, chain, image.shape, 'uint8', passed, value, float('nan')))
+                    if isinstance(value, str):
+                        measured = value
+                    elif kind == 'max_abs':
+                        measured = f"max |d| = {value:g} (<= {limit})"
+                    else:
+                        measured = f"PSNR = {value:.1f} dB (>= {limit})"
+                    print(f"{'OK  ' if passed else 'FAIL'} {name:28s} {str(image.shape):14s} {mode:8s} "
+                          f"{' + '.join(filter_name for filter_name, _ in chain)}  {measured}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Confronta i filtri ottimizzati con le implementazioni di "
+                                                 "riferimento.")
+    parser.add_argument("--filters", nargs='+', default=None, help="nomi delle funzioni di filters.py da verificare")
+    parser.add_argument("--trials", type=int, default=3, help="immagini casuali per ogni insieme di parametri")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-side", type=int, default=16)
+    parser.add_argument("--max-side", type=int, default=64)
+    parser.add_argument("--stack-size", type=int, default=4, help="immagini per pila nelle verifiche sulle pile")
+    parser.add_argument("--tile-size", type=int, default=24, help="lato dei tile nelle verifiche a tile")
+    args = parser.parse_args(argv)
+
+    known = {check[0] for check in CHECKS + STACK_ONLY_CHECKS + TILED_CHECKS}
+    if args.filters is not None:
+        unknown = [name for name in args.filters if name not in known]
+        if unknown:
+            print(f"Filtri non riconosciuti: {', '.join(unknown)}")
+            return 1
+
+    results = run_checks(args.filters, args.trials, args.seed, args.min_side, args.max_side)
+    if args.stack_size > 0:
+        results += run_stack_checks(args.filters, args.stack_size, args.seed, args.min_side, args.max_side)
+    if args.tile_size > 0:
+        results += run_tiled_checks(args.filters, args.tile_size, seed=args.seed, min_side=args.min_side,
+                                    max_side=args.max_side)
+    failed = [result for result in results if not result[4]]
+    print(f"{len(results) - len(failed)}/{len(results)} verifiche superate")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
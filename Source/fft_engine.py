@@ -0,0 +1,119 @@
+﻿import os
+from functools import lru_cache
+
+import numpy as np
+
+from transfer_functions import transfer_function, is_hermitian
+
+# impostazioni comuni a tutti i filtri in frequenza
+FFT_SETTINGS = {
+    'precision': 'double',  # 'double' (complex128) oppure 'single' (complex64)
+    'fast_length': False,  # padding (BORDER_REFLECT) a lunghezze veloci per la FFT
+    'workers': os.cpu_count() or 1,  # thread usati da scipy.fft
+}
+
+
+def configure_fft(precision=None, fast_length=None, workers=None):
+    if precision is not None:
+        if precision not in ('double', 'single'):
+            raise ValueError(f"Precisione FFT non valida: '{precision}'")
+        FFT_SETTINGS['precision'] = precision
+    if fast_length is not None:
+        FFT_SETTINGS['fast_length'] = fast_length
+    if workers is not None:
+        FFT_SETTINGS['workers'] = workers
+
+
+@lru_cache(maxsize=None)
+def _fft_backend():
+    # scipy.fft viene importato alla prima trasformata e non all'avvio, dove costerebbe circa mezzo secondo
+    try:
+        import scipy.fft as fft
+        return fft, True
+    except ImportError:  # numpy.fft non supporta i worker
+        return np.fft, False
+
+
+def _fast_shape(shape):
+    fft, has_scipy_fft = _fft_backend()
+    if not has_scipy_fft:
+        return shape
+    return tuple(fft.next_fast_len(n, real=True) for n in shape)
+
+
+def _rfft2(data, workers):
+    fft, has_scipy_fft = _fft_backend()
+    if has_scipy_fft:
+        return fft.rfft2(data, axes=(0, 1), workers=workers)
+    return fft.rfft2(data, axes=(0, 1))
+
+
+def _irfft2(spectrum, shape, workers):
+    fft, has_scipy_fft = _fft_backend()
+    if has_scipy_fft:
+        return fft.irfft2(spectrum, s=shape, axes=(0, 1), workers=workers, overwrite_x=True)
+    return fft.irfft2(spectrum, s=shape, axes=(0, 1))
+
+
+def _fft2(data, workers):
+    fft, has_scipy_fft = _fft_backend()
+    if has_scipy_fft:
+        return fft.fft2(data, axes=(0, 1), workers=workers)
+    return fft.fft2(data, axes=(0, 1))
+
+
+def _ifft2(spectrum, workers):
+    fft, has_scipy_fft = _fft_backend()
+    if has_scipy_fft:
+        return fft.ifft2(spectrum, axes=(0, 1), workers=workers, overwrite_x=True)
+    return fft.ifft2(spectrum, axes=(0, 1))
+
+
+def apply_transfer_functions(data, steps):
+    """
+    Filtra un'immagine reale nel dominio della frequenza con una o piu' funzioni di trasferimento.
+
+    Tutti i canali vengono trasformati insieme con una FFT reale (rfft2 sugli assi 0 e 1); le maschere dei passi
+    vengono moltiplicate nello stesso spettro, quindi una catena di filtri costa una sola andata e ritorno.
+    Se una maschera non e' simmetrica rispetto all'origine il risultato non e' reale: in quel caso si usa la FFT
+    complessa e si restituisce il risultato complesso, come l'implementazione originale con fft2/ifft2.
+
+    Args:
+        data: array reale HxW oppure HxWxC (gia' nel dominio del filtro, es. log1p per l'omomorfico).
+        steps: lista di (filter_type, parametri) come accettati da transfer_function.
+
+    Returns:
+        Array della stessa forma di data, reale oppure complesso (maschere non simmetriche).
+    """
+    precision = FFT_SETTINGS['precision']
+    workers = FFT_SETTINGS['workers']
+
+    dtype = np.float32 if precision == 'single' else np.float64
+    data = np.asarray(data, dtype=dtype)
+
+    rows, cols = data.shape[:2]
+    shape = (rows, cols)
+    if FFT_SETTINGS['fast_length']:
+        shape = _fast_shape(shape)
+        if shape != (rows, cols):
+            pad_width = [(0, shape[0] - rows), (0, shape[1] - cols)] + [(0, 0)] * (data.ndim - 2)
+            data = np.pad(data, pad_width, mode='symmetric')
+    scale = (rows / shape[0], cols / shape[1])
+
+    if not all(is_hermitian(filter_type, shape, *params, scale=scale) for filter_type, params in steps):
+        spectrum = _fft2(data, workers)
+        for filter_type, params in steps:
+            mask = transfer_function(filter_type, shape, *params, layout='fft', scale=scale)
+            spectrum *= mask[:, :, np.newaxis] if spectrum.ndim == 3 else mask
+        return _ifft2(spectrum, workers)[:rows, :cols]
+
+    spectrum = _rfft2(data, workers)
+
+    for filter_type, params in steps:
+        mask = transfer_function(filter_type, shape, *params, layout='rfft', scale=scale)
+        if spectrum.ndim == 3:
+            mask = mask[:, :, np.newaxis]
+        spectrum *= mask
+
+    filtered = _irfft2(spectrum, shape, workers)
+    return filtered[:rows, :cols]
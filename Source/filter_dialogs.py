@@ -1,11 +1,86 @@
-﻿from PyQt5.QtCore import Qt
+﻿from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QSlider, QPushButton, QRadioButton, QListWidget, \
-    QLineEdit, QMessageBox
+    QLineEdit, QMessageBox, QCheckBox
 
 
-class HomomorphicFilterDialog(QDialog):
+class LivePreviewDialog(QDialog):
+    """
+    Base dei dialog dei filtri con anteprima dal vivo.
+
+    Ogni modifica dei parametri annulla subito l'anteprima in corso (preview_invalidated) e, dopo PREVIEW_DELAY_MS
+    senza altre modifiche, chiama apply_callback(*get_params(), preview=True): viene ricalcolato solo questo filtro
+    sopra il risultato gia' in cache della catena applicata. Ogni sottoclasse definisce get_params, che restituisce
+    gli argomenti di apply_callback.
+    """
+    PREVIEW_DELAY_MS = 150
+
+    preview_invalidated = pyqtSignal()
+
     def __init__(self, parent, apply_callback):
         super().__init__(parent)
+        self.apply_callback = apply_callback
+
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.PREVIEW_DELAY_MS)
+        self.preview_timer.timeout.connect(self.preview_filter)
+
+    def enable_live_preview(self, *signals):
+        for signal in signals:
+            signal.connect(self.schedule_preview)
+        self.schedule_preview()  # anteprima con i valori iniziali
+
+    def schedule_preview(self):
+        self.preview_invalidated.emit()
+        self.preview_timer.start()  # (ri)avvia il debounce
+
+    def add_tolerance_controls(self, layout):
+        """
+        Arresto alla convergenza dei filtri iterativi: tolleranza 10^-n sulla variazione relativa tra due iterazioni.
+
+        Returns:
+            I segnali da passare a enable_live_preview.
+        """
+        self.tolerance_checkbox = QCheckBox("Arresto alla convergenza", self)
+
+        self.tolerance_slider = QSlider(Qt.Horizontal)
+        self.tolerance_slider.setMinimum(1)
+        self.tolerance_slider.setMaximum(6)
+        self.tolerance_slider.setValue(3)
+        self.tolerance_slider.setEnabled(False)
+        self.tolerance_label = QLabel(f"Tolleranza: 1e-{self.tolerance_slider.value()}", self)
+        self.tolerance_slider.valueChanged.connect(
+            lambda: self.tolerance_label.setText(f"Tolleranza: 1e-{self.tolerance_slider.value()}"))
+        self.tolerance_checkbox.toggled.connect(self.tolerance_slider.setEnabled)
+
+        layout.addWidget(self.tolerance_checkbox)
+        layout.addWidget(self.tolerance_label)
+        layout.addWidget(self.tolerance_slider)
+        return self.tolerance_checkbox.toggled, self.tolerance_slider.valueChanged
+
+    def get_tolerance(self):
+        # None: numero fisso di iterazioni
+        if not self.tolerance_checkbox.isChecked():
+            return None
+        return 10.0 ** -self.tolerance_slider.value()
+
+    def preview_filter(self):
+        try:
+            params = self.get_params()
+        except ValueError:
+            return  # input incompleto (es. u_k/v_k mentre si scrive): nessuna anteprima
+
+        self.apply_callback(*params, preview=True)
+
+    def apply_filter(self):
+        self.preview_timer.stop()
+        self.apply_callback(*self.get_params())  # callback per applicare il filtro
+        self.close()
+
+
+class HomomorphicFilterDialog(LivePreviewDialog):
+    def __init__(self, parent, apply_callback):
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Homomorphic")
 
         layout = QVBoxLayout(self)
@@ -47,19 +122,19 @@ class HomomorphicFilterDialog(QDialog):
         cancel_button.clicked.connect(self.close)
         layout.addWidget(cancel_button)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.low_slider.valueChanged, self.high_slider.valueChanged,
+                                 self.cutoff_slider.valueChanged)
 
-    def apply_filter(self):
+    def get_params(self):
         low = self.low_slider.value() / 10.0
         high = self.high_slider.value() / 10.0
         cutoff = self.cutoff_slider.value()
-        self.apply_callback(low, high, cutoff)  # callback per applicare il filtro
-        self.close()
+        return low, high, cutoff
 
 
-class MedianFilterDialog(QDialog):
+class MedianFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Mediano")
 
         layout = QVBoxLayout(self)
@@ -83,17 +158,16 @@ class MedianFilterDialog(QDialog):
         cancel_button.clicked.connect(self.close)
         layout.addWidget(cancel_button)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.ksize_slider.valueChanged)
 
-    def apply_filter(self):
+    def get_params(self):
         ksize = self.ksize_slider.value()
-        self.apply_callback(ksize)
-        self.close()
+        return ksize,
 
 
-class ShockFilterDialog(QDialog):
+class ShockFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Shock")
 
         layout = QVBoxLayout(self)
@@ -108,6 +182,7 @@ class ShockFilterDialog(QDialog):
 
         layout.addWidget(self.iterations_label)
         layout.addWidget(self.iterations_slider)
+        tolerance_signals = self.add_tolerance_controls(layout)
 
         button_layout = QHBoxLayout()
 
@@ -121,17 +196,16 @@ class ShockFilterDialog(QDialog):
 
         layout.addLayout(button_layout)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.iterations_slider.valueChanged, *tolerance_signals)
 
-    def apply_filter(self):
+    def get_params(self):
         iterations = self.iterations_slider.value()
-        self.apply_callback(iterations)
-        self.close()
+        return iterations, self.get_tolerance()
 
 
-class MeanFilterDialog(QDialog):
+class MeanFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Media Aritmetica")
 
         layout = QVBoxLayout(self)
@@ -159,17 +233,16 @@ class MeanFilterDialog(QDialog):
 
         layout.addLayout(button_layout)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.kernel_size_slider.valueChanged)
 
-    def apply_filter(self):
+    def get_params(self):
         kernel_size = self.kernel_size_slider.value()
-        self.apply_callback(kernel_size)
-        self.close()
+        return kernel_size,
 
 
-class GeometricMeanFilterDialog(QDialog):
+class GeometricMeanFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Media Geometrica")
 
         layout = QVBoxLayout(self)
@@ -193,17 +266,16 @@ class GeometricMeanFilterDialog(QDialog):
         cancel_button.clicked.connect(self.close)
         layout.addWidget(cancel_button)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.kernel_size_slider.valueChanged)
 
-    def apply_filter(self):
+    def get_params(self):
         kernel_size = self.kernel_size_slider.value()
-        self.apply_callback(kernel_size)
-        self.close()
+        return kernel_size,
 
 
-class LogGeometricMeanFilterDialog(QDialog):
+class LogGeometricMeanFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Media Geometrica Logaritmica")
 
         layout = QVBoxLayout(self)
@@ -227,17 +299,16 @@ class LogGeometricMeanFilterDialog(QDialog):
         cancel_button.clicked.connect(self.close)
         layout.addWidget(cancel_button)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.kernel_size_slider.valueChanged)
 
-    def apply_filter(self):
+    def get_params(self):
         kernel_size = self.kernel_size_slider.value()
-        self.apply_callback(kernel_size)
-        self.close()
+        return kernel_size,
 
 
-class GaussianFilterDialog(QDialog):
+class GaussianFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Gaussiano")
 
         layout = QVBoxLayout(self)
@@ -277,18 +348,17 @@ class GaussianFilterDialog(QDialog):
 
         layout.addLayout(button_layout)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.kernel_size_slider.valueChanged, self.sigma_slider.valueChanged)
 
-    def apply_filter(self):
+    def get_params(self):
         kernel_size = self.kernel_size_slider.value()
         sigma = self.sigma_slider.value() / 10.0
-        self.apply_callback(kernel_size, sigma)
-        self.close()
+        return kernel_size, sigma
 
 
-class ContraHarmonicMeanFilterDialog(QDialog):
+class ContraHarmonicMeanFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Contra-Harmonic Mean")
 
         layout = QVBoxLayout(self)
@@ -328,18 +398,17 @@ class ContraHarmonicMeanFilterDialog(QDialog):
 
         layout.addLayout(button_layout)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.kernel_size_slider.valueChanged, self.q_slider.valueChanged)
 
-    def apply_filter(self):
+    def get_params(self):
         kernel_size = self.kernel_size_slider.value()
         Q_value = self.q_slider.value() / 10.0
-        self.apply_callback(kernel_size, Q_value)
-        self.close()
+        return kernel_size, Q_value
 
 
-class NotchFilterDialog(QDialog):
+class NotchFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Notch")
 
         layout = QVBoxLayout(self)
@@ -377,27 +446,34 @@ class NotchFilterDialog(QDialog):
 
         layout.addLayout(button_layout)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.d0_slider.valueChanged, self.uk_input.textChanged, self.vk_input.textChanged)
 
-    def apply_filter(self):
-        try:
-            d0 = self.d0_slider.value()
+    def get_params(self):
+        d0 = self.d0_slider.value()
 
-            u_k = list(map(int, self.uk_input.text().split(',')))
-            v_k = list(map(int, self.vk_input.text().split(',')))
+        u_k = list(map(int, self.uk_input.text().split(',')))
+        v_k = list(map(int, self.vk_input.text().split(',')))
 
-            if len(u_k) != len(v_k):
-                raise ValueError("Le liste di u_k e v_k devono avere la stessa lunghezza.")
+        if len(u_k) != len(v_k):
+            raise ValueError("Le liste di u_k e v_k devono avere la stessa lunghezza.")
 
-            self.apply_callback(d0, u_k, v_k)
-            self.close()
+        return d0, u_k, v_k
+
+    def apply_filter(self):
+        try:
+            params = self.get_params()
         except ValueError as e:
             QMessageBox.critical(self, "Errore", f"Input non valido: {str(e)}")
+            return
+
+        self.preview_timer.stop()
+        self.apply_callback(*params)
+        self.close()
 
 
-class AnisotropicDiffusionDialog(QDialog):
+class AnisotropicDiffusionDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Diffusione Anisotropica")
 
         layout = QVBoxLayout(self)
@@ -437,6 +513,7 @@ class AnisotropicDiffusionDialog(QDialog):
         layout.addWidget(self.gamma_slider)
         layout.addWidget(self.option1_radio)
         layout.addWidget(self.option2_radio)
+        tolerance_signals = self.add_tolerance_controls(layout)
 
         apply_button = QPushButton('Applica', self)
         apply_button.clicked.connect(self.apply_filter)
@@ -446,20 +523,20 @@ class AnisotropicDiffusionDialog(QDialog):
         cancel_button.clicked.connect(self.close)
         layout.addWidget(cancel_button)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.iterations_slider.valueChanged, self.k_slider.valueChanged,
+                                 self.gamma_slider.valueChanged, self.option1_radio.toggled, *tolerance_signals)
 
-    def apply_filter(self):
+    def get_params(self):
         iterations = self.iterations_slider.value()
         k = self.k_slider.value()
         gamma = self.gamma_slider.value() / 100.0
         option = 1 if self.option1_radio.isChecked() else 2
-        self.apply_callback(iterations, k, gamma, option)
-        self.close()
+        return iterations, k, gamma, option, self.get_tolerance()
 
 
-class L1TVDeconvolutionDialog(QDialog):
+class L1TVDeconvolutionDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Deconvoluzione ℓ1-TV")
 
         layout = QVBoxLayout(self)
@@ -484,6 +561,7 @@ class L1TVDeconvolutionDialog(QDialog):
         layout.addWidget(self.iterations_slider)
         layout.addWidget(self.reg_weight_label)
         layout.addWidget(self.reg_weight_slider)
+        tolerance_signals = self.add_tolerance_controls(layout)
 
         apply_button = QPushButton('Applica', self)
         apply_button.clicked.connect(self.apply_filter)
@@ -493,18 +571,18 @@ class L1TVDeconvolutionDialog(QDialog):
         cancel_button.clicked.connect(self.close)
         layout.addWidget(cancel_button)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.iterations_slider.valueChanged, self.reg_weight_slider.valueChanged,
+                                 *tolerance_signals)
 
-    def apply_filter(self):
+    def get_params(self):
         iterations = self.iterations_slider.value()
         regularization_weight = self.reg_weight_slider.value() / 1000.0
-        self.apply_callback(iterations, regularization_weight)
-        self.close()
+        return iterations, regularization_weight, self.get_tolerance()
 
 
-class WienerFilterDialog(QDialog):
+class WienerFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Wiener")
 
         layout = QVBoxLayout(self)
@@ -531,6 +609,50 @@ class WienerFilterDialog(QDialog):
         layout.addWidget(self.noise_label)
         layout.addWidget(self.noise_slider)
 
+        # deconvoluzione in frequenza con una PSF nota, al posto del filtro a statistiche locali
+        self.local_radio = QRadioButton("Statistiche locali")
+        self.psf_radios = {
+            'gaussian': QRadioButton("Deconvoluzione PSF gaussiana"),
+            'motion': QRadioButton("Deconvoluzione PSF movimento"),
+            'disk': QRadioButton("Deconvoluzione PSF disco"),
+        }
+        self.local_radio.setChecked(True)
+        layout.addWidget(self.local_radio)
+        for radio in self.psf_radios.values():
+            layout.addWidget(radio)
+
+        self.psf_size_slider = QSlider(Qt.Horizontal)
+        self.psf_size_slider.setMinimum(1)
+        self.psf_size_slider.setMaximum(60)
+        self.psf_size_slider.setValue(4)
+        self.psf_size_label = QLabel(f"Dimensione PSF (px): {self.psf_size_slider.value() / 2.0}", self)
+        self.psf_size_slider.valueChanged.connect(
+            lambda: self.psf_size_label.setText(f"Dimensione PSF (px): {self.psf_size_slider.value() / 2.0}"))
+
+        self.psf_angle_slider = QSlider(Qt.Horizontal)
+        self.psf_angle_slider.setMinimum(0)
+        self.psf_angle_slider.setMaximum(179)
+        self.psf_angle_slider.setValue(0)
+        self.psf_angle_label = QLabel(f"Angolo movimento: {self.psf_angle_slider.value()}°", self)
+        self.psf_angle_slider.valueChanged.connect(
+            lambda: self.psf_angle_label.setText(f"Angolo movimento: {self.psf_angle_slider.value()}°"))
+
+        self.nsr_slider = QSlider(Qt.Horizontal)
+        self.nsr_slider.setMinimum(1)
+        self.nsr_slider.setMaximum(100)
+        self.nsr_slider.setValue(10)
+        self.nsr_label = QLabel(f"Rapporto rumore/segnale: {self.nsr_slider.value() / 1000.0}", self)
+        self.nsr_slider.valueChanged.connect(
+            lambda: self.nsr_label.setText(f"Rapporto rumore/segnale: {self.nsr_slider.value() / 1000.0}"))
+
+        for widget in (self.psf_size_label, self.psf_size_slider, self.psf_angle_label, self.psf_angle_slider,
+                       self.nsr_label, self.nsr_slider):
+            layout.addWidget(widget)
+
+        self.local_radio.toggled.connect(self.update_mode)
+        self.psf_radios['motion'].toggled.connect(self.update_mode)
+        self.update_mode()
+
         button_layout = QHBoxLayout()
         apply_button = QPushButton('Applica', self)
         apply_button.clicked.connect(self.apply_filter)
@@ -542,18 +664,40 @@ class WienerFilterDialog(QDialog):
 
         layout.addLayout(button_layout)
 
-        self.apply_callback = apply_callback
-
-    def apply_filter(self):
+        self.enable_live_preview(self.kernel_size_slider.valueChanged, self.noise_slider.valueChanged,
+                                 self.psf_size_slider.valueChanged, self.psf_angle_slider.valueChanged,
+                                 self.nsr_slider.valueChanged,
+                                 *(radio.toggled for radio in self.psf_radios.values()))
+
+    def selected_psf(self):
+        for psf, radio in self.psf_radios.items():
+            if radio.isChecked():
+                return psf
+        return None
+
+    def update_mode(self):
+        psf = self.selected_psf()
+        for widget in (self.kernel_size_label, self.kernel_size_slider, self.noise_label, self.noise_slider):
+            widget.setEnabled(psf is None)
+        for widget in (self.psf_size_label, self.psf_size_slider, self.nsr_label, self.nsr_slider):
+            widget.setEnabled(psf is not None)
+        for widget in (self.psf_angle_label, self.psf_angle_slider):
+            widget.setEnabled(psf == 'motion')
+
+    def get_params(self):
         kernel_size = self.kernel_size_slider.value()
-        noise = self.noise_slider.value() / 100.0
-        self.apply_callback(kernel_size, noise)
-        self.close()
+        psf = self.selected_psf()
+        if psf is None:
+            noise = self.noise_slider.value() / 100.0
+            return kernel_size, noise
+
+        noise = self.nsr_slider.value() / 1000.0
+        return kernel_size, noise, psf, self.psf_size_slider.value() / 2.0, self.psf_angle_slider.value()
 
 
-class CrimminsFilterDialog(QDialog):
+class CrimminsFilterDialog(LivePreviewDialog):
     def __init__(self, parent, apply_callback):
-        super().__init__(parent)
+        super().__init__(parent, apply_callback)
         self.setWindowTitle("Filtro Crimmins Speckle Removal")
 
         layout = QVBoxLayout(self)
@@ -569,6 +713,7 @@ class CrimminsFilterDialog(QDialog):
 
         layout.addWidget(self.iterations_label)
         layout.addWidget(self.iterations_slider)
+        tolerance_signals = self.add_tolerance_controls(layout)
 
         apply_button = QPushButton('Applica', self)
         apply_button.clicked.connect(self.apply_filter)
@@ -578,9 +723,8 @@ class CrimminsFilterDialog(QDialog):
         cancel_button.clicked.connect(self.close)
         layout.addWidget(cancel_button)
 
-        self.apply_callback = apply_callback
+        self.enable_live_preview(self.iterations_slider.valueChanged, *tolerance_signals)
 
-    def apply_filter(self):
+    def get_params(self):
         iterations = self.iterations_slider.value()
-        self.apply_callback(iterations)
-        self.close()
+        return iterations, self.get_tolerance()
@@ -9,7 +9,21 @@ class FilterItemWidget(QWidget):
         self.label = QLabel(f"{filter_name} (parametro: {param})", self)
         self.layout.addWidget(self.label)
 
+        # tempo e memoria dell'ultima esecuzione, se la profilazione e' attiva
+        self.profile_label = QLabel("", self)
+        self.layout.addWidget(self.profile_label)
+
+        # iterazioni eseguite dai filtri iterativi (meno del massimo se convergono prima)
+        self.iterations_label = QLabel("", self)
+        self.layout.addWidget(self.iterations_label)
+
         self.remove_button = QPushButton("X", self)
         self.remove_button.setFixedSize(20, 20)
         self.remove_button.clicked.connect(remove_callback)  # callback per rimuovere il filtro
         self.layout.addWidget(self.remove_button)
+
+    def set_profile(self, text):
+        self.profile_label.setText(text)
+
+    def set_iterations(self, text):
+        self.iterations_label.setText(text)
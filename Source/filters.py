@@ -1,11 +1,17 @@
 ﻿import cv2
 import numpy as np
-from scipy.ndimage import convolve
-from scipy.signal import wiener
+from box_engine import log_box_mean, power_box_sums
+from cancellation import check_cancelled
+from convergence import ConvergenceMonitor, report_iterations
+from fft_engine import apply_transfer_functions
+from median_engine import median_engine, median_blur
+from stack_engine import stack_filter
+from transfer_functions import TRANSFER_DOMAINS, psf_radius
 from utils import is_grayscale
 
 
-def median_filter(image, ksize):
+@stack_filter(vectorized=False)
+def median_filter(image, ksize, cancel_token=None):
     if ksize <= 1:
         ksize = 3
 
@@ -13,33 +19,12 @@ def median_filter(image, ksize):
     if ksize % 2 == 0:
         ksize += 1
 
-    pad_size = ksize // 2
-
-    if is_grayscale(image):  # immagine in scala di grigi
-        padded_image = cv2.copyMakeBorder(image, pad_size, pad_size, pad_size, pad_size, cv2.BORDER_REFLECT)
-        filtered_image = np.zeros_like(image)
-
-        for i in range(pad_size, padded_image.shape[0] - pad_size):
-            for j in range(pad_size, padded_image.shape[1] - pad_size):
-                window = padded_image[i - pad_size:i + pad_size + 1, j - pad_size:j + pad_size + 1]
-                median_value = np.median(window)
-                filtered_image[i - pad_size, j - pad_size] = median_value
-
-    else:  # immagine a colori
-        filtered_image = np.zeros_like(image)
-        for c in range(image.shape[2]):  # si itera sui canali (R, G, B)
-            padded_image = cv2.copyMakeBorder(image[:, :, c], pad_size, pad_size, pad_size, pad_size,
-                                              cv2.BORDER_REFLECT)
-
-            for i in range(pad_size, padded_image.shape[0] - pad_size):
-                for j in range(pad_size, padded_image.shape[1] - pad_size):
-                    window = padded_image[i - pad_size:i + pad_size + 1, j - pad_size:j + pad_size + 1]
-                    median_value = np.median(window)
-                    filtered_image[i - pad_size, j - pad_size, c] = median_value
-
-    return filtered_image
+    # bordo BORDER_REFLECT come nell'implementazione originale, i canali vengono elaborati insieme;
+    # il percorso (OpenCV, strided o ranghi uint8) dipende da ksize e dal dtype
+    return median_engine(image, ksize, cancel_token)
 
 
+@stack_filter(vectorized=False)
 def median_blur_filter(image, ksize):
     if ksize <= 1:
         ksize = 3
@@ -48,10 +33,11 @@ def median_blur_filter(image, ksize):
     if ksize % 2 == 0:
         ksize += 1
 
-    # uso di medianBlur di OpenCV
-    return cv2.medianBlur(image, ksize)
+    # uso di medianBlur di OpenCV, a gruppi di canali se sono piu' di 4
+    return median_blur(image, ksize)
 
 
+@stack_filter(vectorized=False)
 def mean_filter(image, kernel_size=3):
     if kernel_size <= 1:
         kernel_size = 3  # dimensione di default
@@ -61,47 +47,27 @@ def mean_filter(image, kernel_size=3):
 
     kernel = np.ones((kernel_size, kernel_size), np.float32) / (kernel_size * kernel_size)
 
-    if is_grayscale(image):  # immagine in scala di grigi
-        return cv2.filter2D(image, -1, kernel)
-    else:  # immagine a colori
-        channels = cv2.split(image)
-        filtered_channels = [cv2.filter2D(channel, -1, kernel) for channel in channels]
-        return cv2.merge(filtered_channels)
+    # filter2D elabora ogni canale separatamente: tutti i canali in una sola chiamata
+    return cv2.filter2D(image, -1, kernel)
 
 
+@stack_filter()
 def geometric_mean_filter(image, kernel_size=3):
     if kernel_size < 1:
         kernel_size = 3
     if kernel_size % 2 == 0:
         kernel_size += 1
 
-    pad_size = kernel_size // 2
     epsilon = 1e-5  # piccolo valore per evitare log(0)
 
-    if is_grayscale(image):  # immagine in scala di grigi
-        images = [image]
-    else:  # immagine a colori
-        images = cv2.split(image)
-
-    filtered_channels = []
-    for img in images:
-        padded_image = cv2.copyMakeBorder(img, pad_size, pad_size, pad_size, pad_size, cv2.BORDER_REFLECT)
-        output = np.zeros_like(img, dtype=np.float32)
-
-        for i in range(pad_size, padded_image.shape[0] - pad_size):
-            for j in range(pad_size, padded_image.shape[1] - pad_size):
-                window = padded_image[i - pad_size:i + pad_size + 1, j - pad_size:j + pad_size + 1].astype(np.float32)
-                product = np.prod(window + epsilon)
-                geometric_mean = product ** (1.0 / (kernel_size * kernel_size))
-                output[i - pad_size, j - pad_size] = geometric_mean
+    # media dei logaritmi con box filter: niente prodotto della finestra (overflow in float32 da 7x7),
+    # tempo indipendente da kernel_size, tutti i canali in un passaggio
+    output = log_box_mean(image, kernel_size, epsilon)
 
-        output = np.clip(output, 0, 255).astype(np.uint8)
-        filtered_channels.append(output)
-
-    return cv2.merge(filtered_channels) if len(filtered_channels) > 1 else filtered_channels[0]
+    return np.clip(output, 0, 255).astype(np.uint8)
 
 
-# non funzionante
+@stack_filter()
 def log_geometric_mean_filter(image, kernel_size=3):
     if kernel_size < 1:
         kernel_size = 3
@@ -109,147 +75,96 @@ def log_geometric_mean_filter(image, kernel_size=3):
     if kernel_size % 2 == 0:
         kernel_size += 1
 
-    pad_size = kernel_size // 2  # divisione intera
     epsilon = 1e-5  # piccolo valore per evitare log(0)
 
-    if is_grayscale(image):  # immagine in scala di grigi
-        images = [image]
-    else:  # immagine a colori
-        images = cv2.split(image)
+    # log dell'immagine calcolato una volta, media di ogni finestra in O(1) con box filter
+    filtered_image = log_box_mean(image, kernel_size, epsilon)
 
-    filtered_channels = []
-    for img in images:
-        padded_image = cv2.copyMakeBorder(img, pad_size, pad_size, pad_size, pad_size, cv2.BORDER_REFLECT)
-        filtered_image = np.zeros_like(img, dtype=np.float32)
-
-        for i in range(pad_size, padded_image.shape[0] - pad_size):
-            for j in range(pad_size, padded_image.shape[1] - pad_size):
-                window = padded_image[i - pad_size:i + pad_size + 1, j - pad_size:j + pad_size + 1].astype(np.float32)
-                log_sum = np.sum(np.log(window + epsilon))
-                geometric_mean = np.exp(log_sum / (kernel_size * kernel_size))
-                filtered_image[i - pad_size, j - pad_size] = geometric_mean
-
-        filtered_image = np.clip(filtered_image, 0, 255).astype(np.uint8)
-        filtered_channels.append(filtered_image)
-
-    return cv2.merge(filtered_channels) if len(filtered_channels) > 1 else filtered_channels[0]
+    return np.clip(filtered_image, 0, 255).astype(np.uint8)
 
 
+@stack_filter(vectorized=False)
 def gaussian_filter(image, kernel_size=5, sigma=1.0):
     if kernel_size % 2 == 0:
         kernel_size += 1
     return cv2.GaussianBlur(image, (kernel_size, kernel_size), sigma)
 
 
+@stack_filter()
 def contra_harmonic_mean_filter(image, kernel_size=3, Q=1.0):
     if kernel_size < 1:
         kernel_size = 3
     if kernel_size % 2 == 0:
         kernel_size += 1
 
-    pad_size = kernel_size // 2
+    # somme locali di x^Q e x^(Q+1) con due box filter (i pixel nulli valgono 1e-10, contati a parte), poi una sola
+    # divisione; i canali vengono elaborati insieme come un unico array
+    den, num = power_box_sums(image, kernel_size, (Q, Q + 1))
 
-    if is_grayscale(image):  # immagine in scala di grigi
-        images = [image]
-    else:  # immagine a colori
-        images = cv2.split(image)
-
-    filtered_channels = []
-    for img in images:
-        padded_image = cv2.copyMakeBorder(img, pad_size, pad_size, pad_size, pad_size, cv2.BORDER_REFLECT)
-        filtered_image = np.zeros_like(img, dtype=np.float32)
-
-        for i in range(pad_size, padded_image.shape[0] - pad_size):
-            for j in range(pad_size, padded_image.shape[1] - pad_size):
-                window = padded_image[i - pad_size:i + pad_size + 1, j - pad_size:j + pad_size + 1]
-                window = np.where(window == 0, 1e-10, window)
-                num = np.sum(window ** (Q + 1))
-                den = np.sum(window ** Q)
-
-                if den != 0 and not np.isnan(den):
-                    filtered_image[i - pad_size, j - pad_size] = num / den
-                else:
-                    filtered_image[i - pad_size, j - pad_size] = 0
-
-        filtered_image = np.clip(filtered_image, 0, 255).astype(np.uint8)
-        filtered_channels.append(filtered_image)
-
-    return cv2.merge(filtered_channels) if len(filtered_channels) > 1 else filtered_channels[0]
-
-
-def notch_filter(image, d0, u_k, v_k):
-    if not is_grayscale(image):
-        channels = cv2.split(image)
-        filtered_channels = []
-
-        for ch in channels:
-            dft = np.fft.fft2(ch)
-            dft_shift = np.fft.fftshift(dft)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        filtered_image = np.divide(num, den, out=num)
+    filtered_image[(den == 0) | np.isnan(den)] = 0
 
-            rows, cols = ch.shape
-            crow, ccol = rows // 2, cols // 2
+    filtered_image = filtered_image.astype(np.float32)
+    return np.clip(filtered_image, 0, 255, out=filtered_image).astype(np.uint8)
 
-            mask = np.ones((rows, cols), np.float32)
 
-            for u, v in zip(u_k, v_k):
-                for i in range(rows):
-                    for j in range(cols):
-                        duv = np.sqrt((i - (crow + u)) ** 2 + (j - (ccol + v)) ** 2)
-                        duv_neg = np.sqrt((i - (crow - u)) ** 2 + (j - (ccol - v)) ** 2)
-
-                        if duv < d0 or duv_neg < d0:
-                            mask[i, j] = 0
-
-            dft_shift_filtered = dft_shift * mask
-
-            # inversa della trasformata di Fourier
-            f_ishift = np.fft.ifftshift(dft_shift_filtered)
-            img_back = np.fft.ifft2(f_ishift)
-            img_back = np.abs(img_back)
-
-            filtered_channels.append(np.clip(img_back, 0, 255).astype(np.uint8))
-
-        return cv2.merge(filtered_channels)
+@stack_filter()
+def frequency_filter(image, steps):
+    """
+    Applica in un'unica FFT una sequenza di filtri in frequenza che operano nello stesso dominio.
 
-    else:  # immagine in scala di grigi
-        dft = np.fft.fft2(image)
-        dft_shift = np.fft.fftshift(dft)
+    Le funzioni di trasferimento dei passi vengono moltiplicate nello spettro (vedi fft_engine), quindi filtri
+    consecutivi in una catena non pagano un'andata e ritorno nel dominio spaziale ciascuno.
 
-        rows, cols = image.shape
-        crow, ccol = rows // 2, cols // 2
+    Args:
+        image: immagine uint8 in scala di grigi o a colori.
+        steps: lista di (filter_type, parametri), es. [('notch', (d0, u_k, v_k))].
+    """
+    domains = {TRANSFER_DOMAINS[filter_type] for filter_type, _ in steps}
+    if len(domains) != 1:
+        raise ValueError(f"I filtri in frequenza devono operare nello stesso dominio: {sorted(domains)}")
 
-        mask = np.ones((rows, cols), np.float32)
+    if domains.pop() == 'log':  # omomorfico: filtraggio del logaritmo dell'immagine
+        image_log = np.log1p(np.array(image, dtype="float") / 255)
+        image_filtered = np.real(apply_transfer_functions(image_log, steps))
 
-        for u, v in zip(u_k, v_k):
-            for i in range(rows):
-                for j in range(cols):
-                    duv = np.sqrt((i - (crow + u)) ** 2 + (j - (ccol + v)) ** 2)
-                    duv_neg = np.sqrt((i - (crow - u)) ** 2 + (j - (ccol - v)) ** 2)
+        image_exp = np.expm1(image_filtered)
+        image_exp = np.clip(image_exp, 0, 1)
+        return (image_exp * 255).astype("uint8")
 
-                    if duv < d0 or duv_neg < d0:
-                        mask[i, j] = 0
+    img_back = apply_transfer_functions(image, steps)
+    img_back = np.abs(img_back)
 
-        dft_shift_filtered = dft_shift * mask
+    return np.clip(img_back, 0, 255).astype(np.uint8)
 
-        # inversa della trasformata di Fourier
-        f_ishift = np.fft.ifftshift(dft_shift_filtered)
-        img_back = np.fft.ifft2(f_ishift)
-        img_back = np.abs(img_back)
 
-        return np.clip(img_back, 0, 255).astype(np.uint8)
+@stack_filter()
+def notch_filter(image, d0, u_k, v_k):
+    # FFT reale su tutti i canali insieme, maschera dalla cache LRU
+    return frequency_filter(image, [('notch', (d0, u_k, v_k))])
 
 
-def shock_filter(image, iterations=10, dt=0.1):
-    if is_grayscale(image):  # immagine in scala di grigi
+@stack_filter()
+def shock_filter(image, iterations=10, dt=0.1, cancel_token=None, tolerance=None, report=None):
+    # senza tolleranza tutti i canali vengono aggiornati insieme (Laplaciano e Sobel lavorano per canale); con la
+    # tolleranza ogni canale di un'immagine a colori ha il suo arresto
+    if is_grayscale(image) or tolerance is None:
         images = [image]
     else:  # immagine a colori
         images = cv2.split(image)
 
     filtered_channels = []
+    used = 0
     for img in images:
         img_float = img.astype(np.float32) / 255.0
 
-        for _ in range(iterations):
+        # arresto anticipato opzionale, per canale; si riporta il massimo delle iterazioni eseguite
+        monitor = ConvergenceMonitor(tolerance)
+        monitor.start(img_float)
+        iteration = 0
+        for iteration in range(1, iterations + 1):
+            check_cancelled(cancel_token)
             laplacian = cv2.Laplacian(img_float, cv2.CV_32F)
             gradient_x = cv2.Sobel(img_float, cv2.CV_32F, 1, 0, ksize=3)
             gradient_y = cv2.Sobel(img_float, cv2.CV_32F, 0, 1, ksize=3)
@@ -259,52 +174,31 @@ def shock_filter(image, iterations=10, dt=0.1):
             sign_lap = np.sign(laplacian)
             img_float += dt * sign_lap * grad_mag
 
+            if monitor.converged(img_float):
+                break
+
+        used = max(used, iteration)
         img_filtered = np.clip(img_float * 255, 0, 255).astype(np.uint8)
         filtered_channels.append(img_filtered)
 
+    report_iterations(report, used)
     return cv2.merge(filtered_channels) if len(filtered_channels) > 1 else filtered_channels[0]
 
 
+@stack_filter()
 def homomorphic_filter(image, low=0.5, high=1.5, cutoff=30):
-    if is_grayscale(image):  # immagine in scala di grigi
-        images = [image]
-    else:  # immagine a colori
-        images = cv2.split(image)
-
-    filtered_channels = []
-    for img in images:
-        image_log = np.log1p(np.array(img, dtype="float") / 255)
-
-        dft = np.fft.fft2(image_log)
-        dft_shift = np.fft.fftshift(dft)
-
-        rows, cols = img.shape
-        crow, ccol = rows // 2, cols // 2
-
-        mask = np.ones((rows, cols), np.float32)
-        for i in range(rows):
-            for j in range(cols):
-                distance = np.sqrt((i - crow) ** 2 + (j - ccol) ** 2)
-                mask[i, j] = high - (high - low) * np.exp(- (distance ** 2) / (2 * (cutoff ** 2)))
+    # maschera gaussiana di enfasi delle alte frequenze applicata al logaritmo dell'immagine
+    return frequency_filter(image, [('homomorphic', (low, high, cutoff))])
 
-        dft_shift_filtered = dft_shift * mask
-        dft_filtered = np.fft.ifftshift(dft_shift_filtered)
-        image_filtered = np.fft.ifft2(dft_filtered)
-        image_filtered = np.real(image_filtered)
 
-        image_exp = np.expm1(image_filtered)
-        image_exp = np.clip(image_exp, 0, 1)
-        filtered_channels.append((image_exp * 255).astype("uint8"))
-
-    return cv2.merge(filtered_channels) if len(filtered_channels) > 1 else filtered_channels[0]
-
-
-def anisotropic_diffusion(image, iterations=10, k=15, gamma=0.1, option=1):
+@stack_filter()
+def anisotropic_diffusion(image, iterations=10, k=15, gamma=0.1, option=1, cancel_token=None, tolerance=None,
+                          report=None):
     """
     Applica il filtro di diffusione anisotropica (Perona-Malik) a un'immagine.
     Efficace nel correggere rumore additivo di tipo gaussiano
 
-    Funziona per immagini a colori, separando i canali.
+    Funziona per immagini a colori: i tre canali vengono aggiornati insieme come un unico array HxWx3.
 
     - Iterations: Un numero più basso di iterazioni se si vuole mantenere i dettagli, mentre un numero più alto se il
         rumore è molto forte
@@ -320,173 +214,351 @@ def anisotropic_diffusion(image, iterations=10, k=15, gamma=0.1, option=1):
     - Option 2 (Funzione Razionale): Quando si desidera una riduzione del rumore più uniforme e non si è troppo
         preoccupati di preservare bordi molto netti. È utile per immagini dove i dettagli sono meno definiti o dove si
         cerca un compromesso tra riduzione del rumore e mantenimento dei bordi.
-    """
-
-    # se immagine a colori (canali separati)
-    if not is_grayscale(image):
-        b, g, r = cv2.split(image)
-
-        # applicazione del filtro anisotropic su ciascun canale
-        b_filtered = anisotropic_diffusion_single_channel(b, iterations, k, gamma, option)
-        g_filtered = anisotropic_diffusion_single_channel(g, iterations, k, gamma, option)
-        r_filtered = anisotropic_diffusion_single_channel(r, iterations, k, gamma, option)
-
-        # ricombinare i canali filtrati
-        return cv2.merge([b_filtered, g_filtered, r_filtered])
-
-    # se immagine in scala di grigi
-    return anisotropic_diffusion_single_channel(image, iterations, k, gamma, option)
 
+    - Tolerance: se indicata, la diffusione si ferma prima di iterations quando la variazione relativa tra due
+        iterazioni scende sotto questo valore; le iterazioni eseguite vengono passate a report.
+    """
 
-def anisotropic_diffusion_single_channel(channel, iterations, k, gamma, option):
-    channel = channel.astype(np.float32) / 255.0
+    data = image.astype(np.float32)
+    np.divide(data, 255.0, out=data)
 
+    # bordo riflesso di 2 pixel solo sugli assi spaziali: i canali di un'immagine HxWx3 vengono aggiornati insieme
     padding_size = 2
-    channel_padded = np.pad(channel, pad_width=padding_size, mode='reflect')
-
-    for _ in range(iterations):
-        nabla_north = np.roll(channel_padded, 1, axis=0) - channel_padded
-        nabla_south = np.roll(channel_padded, -1, axis=0) - channel_padded
-        nabla_east = np.roll(channel_padded, -1, axis=1) - channel_padded
-        nabla_west = np.roll(channel_padded, 1, axis=1) - channel_padded
-
-        if option == 1:
-            c_north = np.exp(-(nabla_north / k) ** 2)
-            c_south = np.exp(-(nabla_south / k) ** 2)
-            c_east = np.exp(-(nabla_east / k) ** 2)
-            c_west = np.exp(-(nabla_west / k) ** 2)
-        elif option == 2:
-            c_north = 1.0 / (1.0 + (nabla_north / k) ** 2)
-            c_south = 1.0 / (1.0 + (nabla_south / k) ** 2)
-            c_east = 1.0 / (1.0 + (nabla_east / k) ** 2)
-            c_west = 1.0 / (1.0 + (nabla_west / k) ** 2)
-
-        channel_padded += gamma * (
-                c_north * nabla_north +
-                c_south * nabla_south +
-                c_east * nabla_east +
-                c_west * nabla_west
-        )
-
-    channel = channel_padded[padding_size:-padding_size, padding_size:-padding_size]
-
-    channel = np.clip(channel * 255, 0, 255).astype(np.uint8)
-
-    return channel
-
+    pad_width = ((padding_size, padding_size), (padding_size, padding_size)) + ((0, 0),) * (data.ndim - 2)
+    data = np.pad(data, pad_width, mode='reflect')
+
+    used = _perona_malik(data, iterations, k, gamma, option, cancel_token, ConvergenceMonitor(tolerance))
+    report_iterations(report, used)
+
+    channel = data[padding_size:-padding_size, padding_size:-padding_size]
+    np.multiply(channel, 255, out=channel)
+    np.clip(channel, 0, 255, out=channel)
+    return channel.astype(np.uint8)
+
+
+def anisotropic_diffusion_single_channel(channel, iterations, k, gamma, option, cancel_token=None, tolerance=None,
+                                        report=None):
+    # mantenuta per compatibilita': anisotropic_diffusion accetta gia' un singolo canale
+    return anisotropic_diffusion(channel, iterations, k, gamma, option, cancel_token, tolerance, report)
+
+
+def _conduction(nabla, k, option, out):
+    # coefficiente di conduzione g(|nabla|), calcolato sul posto in out
+    np.divide(nabla, k, out=out)
+    np.square(out, out=out)
+    if option == 1:
+        np.negative(out, out=out)
+        np.exp(out, out=out)
+    elif option == 2:
+        np.add(out, 1.0, out=out)
+        np.reciprocal(out, out=out)
+    else:
+        raise ValueError(f"Opzione di diffusione non valida: {option}")
+    return out
 
-def l1_tv_deconvolution(image, iterations=30, regularization_weight=0.05):
-    if is_grayscale(image):  # immagine in scala di grigi
-        images = [image]
-    else:  # immagine a colori
-        images = cv2.split(image)
 
-    restored_channels = []
-    for img in images:
-        # filtro mediano preliminare per ridurre il rumore "sale e pepe"
-        img = cv2.medianBlur(img, 3)
+def _perona_malik(data, iterations, k, gamma, option, cancel_token=None, monitor=None):
+    """
+    Aggiornamento di Perona-Malik sul posto su un array float32 HxW o HxWxC, con tre buffer allocati una volta sola.
 
-        # normalizzazione dell'immagine
-        img = img.astype(np.float32) / 255.0
+    Le differenze con i vicini usano slice al posto di np.roll (con lo stesso avvolgimento ai bordi). Il flusso verso
+    sud e' l'opposto di quello verso nord del pixel sottostante (e lo stesso vale per ovest ed est), quindi ogni
+    iterazione calcola solo due coefficienti di conduzione invece di quattro, con risultati identici.
 
-        restored_image = img.copy()
+    Returns:
+        Numero di iterazioni eseguite (meno di iterations se monitor segnala la convergenza).
+    """
+    nabla = np.empty_like(data)
+    flux = np.empty_like(data)
+    update = np.empty_like(data)
+
+    if monitor is not None:
+        monitor.start(data)
+    for iteration in range(iterations):
+        check_cancelled(cancel_token)
+
+        # nord: data[i - 1] - data[i]; sud: -flusso nord in i + 1
+        np.subtract(data[:-1], data[1:], out=nabla[1:])
+        np.subtract(data[-1:], data[:1], out=nabla[:1])
+        _conduction(nabla, k, option, flux)
+        np.multiply(flux, nabla, out=flux)
+        update[...] = flux
+        np.subtract(update[:-1], flux[1:], out=update[:-1])
+        np.subtract(update[-1:], flux[:1], out=update[-1:])
+
+        # est: data[:, j + 1] - data[:, j]; ovest: -flusso est in j - 1
+        np.subtract(data[:, 1:], data[:, :-1], out=nabla[:, :-1])
+        np.subtract(data[:, :1], data[:, -1:], out=nabla[:, -1:])
+        _conduction(nabla, k, option, flux)
+        np.multiply(flux, nabla, out=flux)
+        np.add(update, flux, out=update)
+        np.subtract(update[:, 1:], flux[:, :-1], out=update[:, 1:])
+        np.subtract(update[:, :1], flux[:, -1:], out=update[:, :1])
+
+        np.multiply(update, gamma, out=update)
+        np.add(data, update, out=data)
+
+        if monitor is not None and monitor.converged(data):
+            return iteration + 1
+    return iterations
+
+
+# regularization_weight mantiene il significato originale: era il passo del termine di fedelta' (piu' alto, piu'
+# dettaglio e meno levigatura). Nel flusso di l1-TV, dx/dt = -K^T sign(K x - f) + lambda div(grad x / |grad x|), la
+# fedelta' pesa 1/lambda rispetto alla TV, quindi lambda = L1_TV_WEIGHT_PRODUCT / regularization_weight; la costante
+# conserva il preset saleepepe (0.007 -> lambda 0.28) e lo slider 0.001-0.1 copre lambda da 1.96 a 0.0196
+L1_TV_WEIGHT_PRODUCT = 0.00196
+
+# sfocatura del modello (gaussiana binomiale 3x3), separabile
+_BINOMIAL_KERNEL = np.array([1, 2, 1], dtype=np.float32) / 4
+
+
+@stack_filter()
+def l1_tv_deconvolution(image, iterations=30, regularization_weight=0.05, cancel_token=None, tolerance=None,
+                        report=None):
+    """
+    Deconvoluzione l1-TV: min_x ||K x - f||_1 + lambda * TV(x), con K la sfocatura binomiale 3x3, f l'immagine dopo
+    un filtro mediano preliminare (rumore "sale e pepe") e lambda = L1_TV_WEIGHT_PRODUCT / regularization_weight.
+    Con regularization_weight <= 0 il risultato e' l'immagine dopo il filtro mediano, come nell'originale.
 
-        # kernel per la convoluzione (gaussiano)
-        kernel = np.array([[1, 2, 1],
-                           [2, 4, 2],
-                           [1, 2, 1]]) / 16
+    Risolta con l'algoritmo primale-duale di Chambolle-Pock con passi precondizionati (diagonali), tutti i canali
+    insieme. Con tolerance si ferma prima di iterations quando l'immagine smette di cambiare.
+    """
+    # filtro mediano preliminare per ridurre il rumore "sale e pepe"
+    observed = cv2.medianBlur(image, 3).astype(np.float32)
+    np.divide(observed, 255.0, out=observed)
 
-        for _ in range(iterations):
-            blurred_image = convolve(restored_image, kernel)
+    restored_image = observed.copy()
+    used = 0
+    if regularization_weight > 0:
+        used = _l1_tv_primal_dual(restored_image, observed, iterations, L1_TV_WEIGHT_PRODUCT / regularization_weight,
+                                  cancel_token, ConvergenceMonitor(tolerance))
+    report_iterations(report, used)
 
-            # gradiente per la regolarizzazione TV
-            gradient_x = np.roll(restored_image, -1, axis=1) - restored_image
-            gradient_y = np.roll(restored_image, -1, axis=0) - restored_image
-            tv_term = np.sqrt(gradient_x ** 2 + gradient_y ** 2 + 1e-5)
+    np.multiply(restored_image, 255, out=restored_image)
+    np.clip(restored_image, 0, 255, out=restored_image)
+    return restored_image.astype(np.uint8)
 
-            fidelity_term = blurred_image - img
-            fidelity_term = np.clip(fidelity_term, -0.1, 0.1)
 
-            update_term = regularization_weight * (fidelity_term / (tv_term + 1e-8))
-            restored_image -= update_term
+def _blur(data, out):
+    # con BORDER_REFLECT e kernel simmetrico l'operatore e' autoaggiunto: la stessa funzione fa K e K^T
+    return cv2.sepFilter2D(data, -1, _BINOMIAL_KERNEL, _BINOMIAL_KERNEL, dst=out, borderType=cv2.BORDER_REFLECT)
 
-        restored_image = np.clip(restored_image * 255, 0, 255).astype(np.uint8)
-        restored_channels.append(restored_image)
 
-    return cv2.merge(restored_channels) if len(restored_channels) > 1 else restored_channels[0]
+def _l1_tv_primal_dual(x, observed, iterations, weight, cancel_token=None, monitor=None):
+    """
+    Iterazioni di Chambolle-Pock sul posto in x (float32 HxW o HxWxC, valori in [0, 1]).
 
+    Variabili duali: p = (px, py) per il gradiente, proiettata sulla palla |p| <= weight, e q per il termine l1,
+    proiettata su [-1, 1]. Passi precondizionati: sigma 1/2 per il gradiente, 1 per la sfocatura e
+    tau = 1/5 per il primale (4 differenze e la sfocatura per pixel), che garantiscono la convergenza.
 
+    Returns:
+        Numero di iterazioni eseguite.
+    """
+    sigma_gradient = 0.5
+    tau = 0.2
+
+    result = x
+    x_bar = x.copy()
+    px = np.zeros_like(x)
+    py = np.zeros_like(x)
+    q = np.zeros_like(x)
+    work = np.empty_like(x)
+    norm = np.empty_like(x)
+
+    if monitor is not None:
+        monitor.start(x)
+    for iteration in range(iterations):
+        check_cancelled(cancel_token)
+
+        # p <- proiezione(p + sigma grad(x_bar)), differenze in avanti con bordo di Neumann
+        np.subtract(x_bar[:, 1:], x_bar[:, :-1], out=work[:, :-1])
+        work[:, -1] = 0
+        work *= sigma_gradient
+        px += work
+        np.subtract(x_bar[1:], x_bar[:-1], out=work[:-1])
+        work[-1] = 0
+        work *= sigma_gradient
+        py += work
+
+        np.multiply(px, px, out=norm)
+        np.multiply(py, py, out=work)
+        norm += work
+        np.sqrt(norm, out=norm)
+        np.maximum(norm, weight, out=norm)
+        np.divide(weight, norm, out=norm)
+        px *= norm
+        py *= norm
+
+        # q <- clip(q + K x_bar - f, -1, 1)
+        _blur(x_bar, work)
+        work -= observed
+        q += work
+        np.clip(q, -1.0, 1.0, out=q)
+
+        # x <- clip(x - tau (K^T q - div p), 0, 1); div e' l'aggiunto di -grad
+        _blur(q, work)
+        work[:, :-1] -= px[:, :-1]
+        work[:, 1:] += px[:, :-1]
+        work[:-1] -= py[:-1]
+        work[1:] += py[:-1]
+        work *= -tau
+        work += x
+        np.clip(work, 0.0, 1.0, out=work)
+
+        # x_bar <- 2 x_nuovo - x; il buffer del vecchio x diventa il nuovo buffer di lavoro
+        np.multiply(work, 2.0, out=x_bar)
+        x_bar -= x
+        x, work = work, x
+
+        if monitor is not None and monitor.converged(x):
+            iterations = iteration + 1
+            break
+
+    if x is not result:
+        result[...] = x
+    return iterations
+
+
+@stack_filter()
 def wiener_deconvolution(image, kernel_size=5, noise=0.01):
+    """
+    Filtro di Wiener adattivo (statistiche locali), come scipy.signal.wiener: in ogni finestra kernel_size x
+    kernel_size il pixel viene avvicinato alla media locale tanto piu' quanto la varianza locale e' vicina al rumore.
+
+    Media e varianza locali vengono calcolate con cv2.boxFilter / cv2.sqrBoxFilter (costo indipendente dalla
+    finestra), con bordo riflesso e su tutti i canali insieme.
+    """
     if kernel_size <= 1:
         kernel_size = 2
 
     epsilon = 1e-5
-    pad_size = kernel_size // 2
+    noise = noise + epsilon
+    ksize = (kernel_size, kernel_size)
 
-    if is_grayscale(image):  # immagine in scala di grigi
-        images = [image]
-    else:  # immagine a colori
-        images = cv2.split(image)
+    data = image.astype(np.float32)
+    np.divide(data, 255.0, out=data)
 
-    deconvolved_channels = []
-    for img in images:
-        padded_image = cv2.copyMakeBorder(img, pad_size, pad_size, pad_size, pad_size, cv2.BORDER_REFLECT)
+    local_mean = cv2.boxFilter(data, -1, ksize, borderType=cv2.BORDER_REFLECT)
+    local_variance = cv2.sqrBoxFilter(data, -1, ksize, borderType=cv2.BORDER_REFLECT)
+    local_variance -= local_mean * local_mean
 
-        padded_image = padded_image.astype(np.float32) / 255.0
+    # guadagno 1 - noise / varianza, nullo dove la varianza e' sotto il rumore (li' resta la media locale)
+    gain = np.maximum(local_variance, noise, out=local_variance)
+    np.divide(noise, gain, out=gain)
+    np.subtract(1.0, gain, out=gain)
 
-        deconvolved_img = wiener(padded_image, (kernel_size, kernel_size), noise + epsilon)
+    data -= local_mean
+    data *= gain
+    data += local_mean
 
-        deconvolved_img = np.nan_to_num(deconvolved_img)
+    np.clip(data, 0, 1, out=data)
+    np.multiply(data, 255, out=data)
+    return data.astype(np.uint8)
 
-        deconvolved_img = deconvolved_img[pad_size:-pad_size, pad_size:-pad_size]
 
-        deconvolved_img = np.clip(deconvolved_img, 0, 1)
+@stack_filter()
+def wiener_psf_deconvolution(image, psf='gaussian', psf_size=2.0, psf_angle=0.0, noise=0.01):
+    """
+    Deconvoluzione di Wiener in frequenza: W = conj(H) / (|H|^2 + noise), con H la trasformata della PSF.
 
-        deconvolved_img = (deconvolved_img * 255).astype(np.uint8)
-        deconvolved_channels.append(deconvolved_img)
+    Args:
+        psf: 'gaussian' (psf_size = sigma), 'motion' (psf_size = lunghezza, psf_angle in gradi) oppure 'disk'
+            (psf_size = raggio), tutte in pixel.
+        noise: rapporto rumore/segnale; valori piu' alti attenuano l'amplificazione del rumore.
+    """
+    # bordo riflesso largo quanto la PSF, per limitare gli artefatti della convoluzione circolare
+    margin = psf_radius(psf, psf_size)
+    padded = cv2.copyMakeBorder(image, margin, margin, margin, margin, cv2.BORDER_REFLECT)
 
-    return cv2.merge(deconvolved_channels) if len(deconvolved_channels) > 1 else deconvolved_channels[0]
+    # la trasformata di W viene presa dalla cache LRU delle funzioni di trasferimento, per forma dell'immagine
+    restored = np.real(apply_transfer_functions(padded, [('wiener', (psf, psf_size, psf_angle, noise))]))
+    restored = restored[margin:margin + image.shape[0], margin:margin + image.shape[1]]
 
+    return np.clip(restored, 0, 255).astype(np.uint8)
 
-def crimmins_speckle_removal(image, iterations=1):
-    if len(image.shape) == 3:
-        channels = cv2.split(image)
-        processed_channels = [crimmins_speckle_removal_single_channel(ch, iterations) for ch in channels]
-        return cv2.merge(processed_channels)
-    else:
-        return crimmins_speckle_removal_single_channel(image, iterations)
 
+@stack_filter()
+def crimmins_speckle_removal(image, iterations=1, cancel_token=None, tolerance=None, report=None):
+    """
+    Rimozione dello speckle di Crimmins su un'immagine uint8 in scala di grigi o a colori.
+
+    A ogni iterazione il pixel viene limitato tra il minimo e il massimo degli 8 vicini e poi avvicinato di un livello
+    alla loro media. Minimo e massimo sono un'erosione e una dilatazione con un elemento strutturante ad anello (3x3
+    senza il centro), la media una sola convoluzione con lo stesso anello; tutti i canali vengono aggiornati insieme.
 
-def crimmins_speckle_removal_single_channel(image, iterations):
-    image = image.astype(np.float32)
+    - Tolerance: se indicata, il filtro si ferma prima di iterations quando la variazione relativa tra due
+        iterazioni scende sotto questo valore; le iterazioni eseguite vengono passate a report.
+    """
+    data = image if image.dtype == np.uint8 else np.clip(image, 0, 255).astype(np.uint8)
 
-    image_padded = np.pad(image, pad_width=1, mode='reflect')
+    # bordo riflesso di 1 pixel (come np.pad 'reflect') piu' un anello esterno che replica l'avvolgimento di np.roll
+    # sull'immagine con il bordo: i risultati restano identici a quelli dell'implementazione con 8 np.roll
+    pad_width = ((1, 1), (1, 1)) + ((0, 0),) * (data.ndim - 2)
+    buffer = np.empty((data.shape[0] + 4, data.shape[1] + 4) + data.shape[2:], dtype=np.uint8)
+    padded = buffer[1:-1, 1:-1]
+    padded[...] = np.pad(data, pad_width, mode='reflect')
 
-    for _ in range(iterations):
-        neighbors = [
-            np.roll(image_padded, 1, axis=0),  # north
-            np.roll(image_padded, -1, axis=0),  # south
-            np.roll(image_padded, 1, axis=1),  # west
-            np.roll(image_padded, -1, axis=1),  # east
-            np.roll(np.roll(image_padded, 1, axis=0), 1, axis=1),  # northwest
-            np.roll(np.roll(image_padded, 1, axis=0), -1, axis=1),  # northeast
-            np.roll(np.roll(image_padded, -1, axis=0), 1, axis=1),  # southwest
-            np.roll(np.roll(image_padded, -1, axis=0), -1, axis=1)  # southeast
-        ]
+    used = _crimmins(buffer, iterations, cancel_token, ConvergenceMonitor(tolerance, stride=1))
+    report_iterations(report, used)
+    return padded[1:-1, 1:-1].copy()
 
-        min_neighbor = np.min(neighbors, axis=0)
-        max_neighbor = np.max(neighbors, axis=0)
 
-        image_padded = np.where(image_padded < min_neighbor, min_neighbor, image_padded)
-        image_padded = np.where(image_padded > max_neighbor, max_neighbor, image_padded)
+def crimmins_speckle_removal_single_channel(image, iterations, cancel_token=None, tolerance=None, report=None):
+    # mantenuta per compatibilita': crimmins_speckle_removal accetta gia' un singolo canale
+    return crimmins_speckle_removal(image, iterations, cancel_token, tolerance, report)
 
-        mean_neighbor = np.mean(neighbors, axis=0)
-        image_padded = np.where(image_padded > mean_neighbor, image_padded - 1, image_padded)
-        image_padded = np.where(image_padded < mean_neighbor, image_padded + 1, image_padded)
 
-    image = image_padded[1:-1, 1:-1]
+# gli 8 vicini di un pixel
+_RING_KERNEL = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=np.uint8)
 
-    return np.clip(image, 0, 255).astype(np.uint8)
+
+def _crimmins(buffer, iterations, cancel_token=None, monitor=None):
+    """
+    Iterazioni di Crimmins sul posto su un array uint8 HxW o HxWxC con un anello esterno di 1 pixel, riscritto a ogni
+    iterazione per avvolgere l'interno come np.roll. I valori restano interi in [0, 255]: la media dei vicini viene
+    confrontata come somma in int16 con 8 volte il pixel, senza arrotondamenti.
+
+    Returns:
+        Numero di iterazioni eseguite (meno di iterations se monitor segnala la convergenza).
+    """
+    padded = buffer[1:-1, 1:-1]
+    low = np.empty_like(buffer)
+    high = np.empty_like(buffer)
+    neighbor_sum = np.empty(buffer.shape, dtype=np.int16)
+    scaled = np.empty(buffer.shape, dtype=np.int16)
+    step = np.empty(buffer.shape, dtype=bool)
+
+    if monitor is not None:
+        monitor.start(padded)
+    for iteration in range(iterations):
+        check_cancelled(cancel_token)
+
+        # avvolgimento: prima le righe, poi le colonne intere (angoli compresi)
+        buffer[0, 1:-1] = buffer[-2, 1:-1]
+        buffer[-1, 1:-1] = buffer[1, 1:-1]
+        buffer[:, 0] = buffer[:, -2]
+        buffer[:, -1] = buffer[:, 1]
+
+        cv2.erode(buffer, _RING_KERNEL, dst=low, borderType=cv2.BORDER_REPLICATE)
+        cv2.dilate(buffer, _RING_KERNEL, dst=high, borderType=cv2.BORDER_REPLICATE)
+        cv2.filter2D(buffer, cv2.CV_16S, _RING_KERNEL, dst=neighbor_sum, borderType=cv2.BORDER_REPLICATE)
+
+        np.maximum(buffer, low, out=buffer)
+        np.minimum(buffer, high, out=buffer)
+
+        # pixel sopra la media dei vicini: -1; poi, con il valore aggiornato, pixel sotto la media: +1
+        np.multiply(buffer, 8, out=scaled, dtype=np.int16)
+        np.greater(scaled, neighbor_sum, out=step)
+        np.subtract(buffer, step, out=buffer)
+        np.multiply(buffer, 8, out=scaled, dtype=np.int16)
+        np.less(scaled, neighbor_sum, out=step)
+        np.add(buffer, step, out=buffer)
+
+        if monitor is not None and monitor.converged(padded):
+            return iteration + 1
+    return iterations
 
 
 # altri filtri...
@@ -494,6 +566,7 @@ def crimmins_speckle_removal_single_channel(image, iterations):
 
 # rumori
 
+@stack_filter(vectorized=False)
 def add_gaussian_noise(image, mean=0, std_dev=25):
     if is_grayscale(image):  # immagine in scala di grigi
         images = [image]
@@ -511,6 +584,7 @@ def add_gaussian_noise(image, mean=0, std_dev=25):
     return cv2.merge(noisy_channels) if len(noisy_channels) > 1 else noisy_channels[0]
 
 
+@stack_filter(vectorized=False)
 def add_salt_pepper_noise(image, prob=0.05):
     noisy_image = image.copy()
 
@@ -534,6 +608,7 @@ def add_salt_pepper_noise(image, prob=0.05):
     return noisy_image
 
 
+@stack_filter(vectorized=False)
 def add_uniform_noise(image, low=0, high=50):
     if is_grayscale(image):  # immagine in scala di grigi
         images = [image]
@@ -549,10 +624,10 @@ def add_uniform_noise(image, low=0, high=50):
     return cv2.merge(noisy_channels) if len(noisy_channels) > 1 else noisy_channels[0]
 
 
+@stack_filter(vectorized=False)
 def add_film_grain_noise(image, std_dev=20):
-    if is_grayscale(image):  # immagine in scala di grigi
-        row, col = image.shape
-        noise = np.random.normal(0, std_dev, (row, col)).astype(np.int16)
+    if is_grayscale(image):  # immagine in scala di grigi (anche HxWx3 con i canali uguali, es. un tile)
+        noise = np.random.normal(0, std_dev, image.shape).astype(np.int16)
         img_int16 = image.astype(np.int16)
         noisy_img = cv2.add(img_int16, noise)
         noisy_img = np.clip(noisy_img, 0, 255).astype(np.uint8)
@@ -572,6 +647,7 @@ def add_film_grain_noise(image, std_dev=20):
         return cv2.merge(noisy_channels)
 
 
+@stack_filter(vectorized=False)
 def add_periodic_noise(image, amplitude=50, frequency=40):
     if is_grayscale(image):
         images = [image]
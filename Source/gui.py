@@ -1,17 +1,20 @@
-﻿import csv
-import os
-
-import cv2
+﻿import cv2
 from PyQt5.QtWidgets import QMainWindow, QAction, QVBoxLayout, QLabel, QWidget, QFileDialog, QApplication, QHBoxLayout, \
     QListWidget, QListWidgetItem, QSizePolicy, QPushButton
 from PyQt5.QtGui import QFont, QKeySequence
 from PyQt5.QtCore import Qt, QSize
 from filter_worker import FilterWorker
 from filter_dialogs import *
-from image_manager import load_image, convert_to_rgb, display_image, show_image_zoomed, save_image
-from utils import save_filter_configuration, load_filter_configuration, calculate_psnr, calculate_mse, calculate_ssim, \
-    is_grayscale
+from image_io import load_image, convert_to_rgb, save_image
+from image_manager import display_image, show_image_zoomed
+from metrics import compute_metrics
+from utils import save_filter_configuration, load_filter_configuration, is_grayscale
 from filter_item_widget import FilterItemWidget
+from prefix_cache import PrefixCache, PreviewCache, freeze_params
+from profiling import format_profile, export_chrome_trace
+from convergence import iteration_param, format_iterations
+from results_store import ResultsStore, RESULTS_DB, RESULTS_CSV
+from proxy_preview import make_proxy, scale_filters
 import sys
 
 
@@ -25,6 +28,40 @@ class ImageRestorationApp(QMainWindow):
         self.undo_stack = []
         self.redo_stack = []
 
+        # risultati intermedi della catena, per non ricalcolarla da capo ad ogni modifica
+        self.prefix_cache = PrefixCache()
+
+        # archivio dei risultati (PSNR/MSE/SSIM), con il CSV storico aggiornato in coda
+        self.results_store = ResultsStore(RESULTS_DB, csv_filename=RESULTS_CSV)
+
+        # ogni richiesta di elaborazione ha una generazione: i risultati di quelle superate vengono scartati
+        self.generation = 0
+        self.worker = None
+        self.active_workers = set()
+
+        # anteprima dal vivo dei dialog: solo l'ultimo filtro viene ricalcolato sopra la catena in cache
+        self.live_preview_worker = None
+        self.live_preview_generation = 0
+
+        # anteprima veloce: la catena gira prima su un proxy ridotto, poi il risultato esatto lo sostituisce
+        self.preview_enabled = False
+        self.proxy_image = None
+        self.proxy_scale = 1.0
+        self.proxy_cache = PrefixCache()
+        self.preview_worker = None
+        self.full_result_generation = 0
+
+        # salvataggio richiesto durante l'elaborazione: avviene all'arrivo del risultato a piena risoluzione
+        self.pending_save = None
+
+        # profilazione dei filtri: misure dell'ultima esecuzione di ogni passo, per prefisso della catena
+        self.profiling_enabled = False
+        self.step_profiles = {}
+        self.profile_records = []
+
+        # iterazioni eseguite dai filtri iterativi (arresto alla convergenza), per prefisso della catena
+        self.step_iterations = {}
+
         self.initUI()
 
     def initUI(self):
@@ -110,6 +147,21 @@ class ImageRestorationApp(QMainWindow):
         filter_menu.addAction('Deconvoluzione Wiener', self.show_wiener_filter_dialog)
         filter_menu.addAction('Filtro Crimmins Speckle Removal', self.show_crimmins_filter_dialog)
 
+        # barra menu - visualizza
+        view_menu = menubar.addMenu('Visualizza')
+
+        preview_action = QAction('Anteprima veloce', self)
+        preview_action.setCheckable(True)
+        preview_action.toggled.connect(self.set_preview_enabled)
+        view_menu.addAction(preview_action)
+
+        profiling_action = QAction('Profilazione filtri', self)
+        profiling_action.setCheckable(True)
+        profiling_action.toggled.connect(self.set_profiling_enabled)
+        view_menu.addAction(profiling_action)
+
+        view_menu.addAction('Esporta trace filtri', self.export_trace_action)
+
         # barra menu - rumori
         noise_menu = menubar.addMenu('Rumori')
 
@@ -151,56 +203,77 @@ class ImageRestorationApp(QMainWindow):
         fileName, _ = QFileDialog.getOpenFileName(self, "Carica Immagine", "", "Image Files "
                                                                                "(*.png *.jpg *.jpeg)", options=options)
         if fileName:
-            self.image = load_image(fileName)
-            self.restored_image = self.image
+            self.open_image(fileName)
 
-            if self.image is not None:
+    def open_image(self, fileName):
+        # le elaborazioni dell'immagine precedente vengono superate: i loro risultati non arrivano piu' alla GUI
+        self.supersede_workers()
+        self.cancel_live_preview()
+        self.pending_save = None
 
-                if is_grayscale(self.image):
-                    self.image = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        self.image = load_image(fileName)
+        self.restored_image = self.image
 
-                image_rgb = convert_to_rgb(self.image)
-                display_image(image_rgb, self.original_label)
-                self.restored_label.clear()
-                self.reset_filters()
-                display_image(image_rgb, self.restored_label)
-
-    def log_filter_results(self, image_name, filters, restored_image, image_id, csv_filename='risultati.csv'):
-        if len(self.image.shape) == 2:
-            original_image = self.image
-            if len(restored_image.shape) == 3:
-                restored_image = cv2.cvtColor(restored_image, cv2.COLOR_BGR2GRAY)
-        else:
-            original_image = cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB)
-            if len(restored_image.shape) == 2:
-                restored_image = cv2.cvtColor(restored_image, cv2.COLOR_GRAY2RGB)
-            else:
-                restored_image = cv2.cvtColor(restored_image, cv2.COLOR_BGR2RGB)
-
-        if original_image.shape != restored_image.shape:
-            restored_image = cv2.resize(restored_image, (original_image.shape[1], original_image.shape[0]))
+        if self.image is not None:
+            self.prefix_cache.clear()
 
-        # PSNR, MSE e SSIM
-        psnr_value = calculate_psnr(original_image, restored_image)
-        mse_value = calculate_mse(original_image, restored_image)
-        ssim_value = calculate_ssim(original_image, restored_image)
+            if is_grayscale(self.image):
+                self.image = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
 
-        file_exists = os.path.isfile(csv_filename)
+            self.proxy_image, self.proxy_scale = make_proxy(self.image)
+            self.proxy_cache.clear()
+            self.step_profiles.clear()
+            self.profile_records.clear()
+            self.step_iterations.clear()
 
-        with open(csv_filename, mode='a', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
+            image_rgb = convert_to_rgb(self.image)
+            display_image(image_rgb, self.original_label)
+            self.restored_label.clear()
+            self.reset_filters()
+            display_image(image_rgb, self.restored_label)
 
-            if not file_exists:
-                writer.writerow(["ID", "NomeFile", "NomeFiltro", "Parametri", "PSNR", "MSE", "SSIM"])
+    def log_filter_results(self, image_name, filters, restored_image):
+        # PSNR, MSE e SSIM
+        metrics = compute_metrics(self.image, restored_image)
+
+        # un salvataggio alla volta: il risultato viene scritto subito
+        self.results_store.add_run(image_name, filters, metrics)
+        self.results_store.flush()
+        print(f"Risultati salvati nel CSV per l'immagine: {image_name}")
+
+    def set_preview_enabled(self, enabled):
+        self.preview_enabled = enabled
+
+    def set_profiling_enabled(self, enabled):
+        self.profiling_enabled = enabled
+        if enabled:
+            # i passi in cache non verrebbero misurati: la catena viene ricalcolata per intero
+            self.prefix_cache.clear()
+            self.apply_all_filters()
+        else:
+            self.step_profiles.clear()
+            self.update_filter_list()
 
-            for filter_name, params in filters:
-                if isinstance(params, dict):
-                    filter_data = "; ".join([f"{key}={value}" for key, value in params.items()])
-                else:
-                    filter_data = str(params)
+    def export_trace_action(self):
+        if not self.profile_records:
+            print("Nessuna misura da esportare: attivare 'Profilazione filtri' e applicare i filtri.")
+            return
 
-                writer.writerow([image_id, image_name, filter_name, filter_data, psnr_value, mse_value, ssim_value])
-                print(f"Risultati salvati nel CSV per l'immagine: {image_name}")
+        options = QFileDialog.Options()
+        fileName, _ = QFileDialog.getSaveFileName(self, "Esporta Trace Filtri", "", "JSON Files (*.json)",
+                                                  options=options)
+        if fileName:
+            export_chrome_trace(self.profile_records, fileName)
+
+    def full_resolution_pending(self):
+        # vero finche' la catena a piena risoluzione della richiesta corrente non ha un risultato; se e' gia' pronto
+        # ma il segnale non e' ancora arrivato, viene preso dal worker
+        if self.worker is None or self.worker.generation != self.generation:
+            return False
+        if self.worker.result is not None:
+            self.restored_image = self.worker.result
+            return False
+        return self.worker.isRunning()
 
     def save_restored_image(self):
         if self.restored_image is not None:
@@ -208,21 +281,19 @@ class ImageRestorationApp(QMainWindow):
             fileName, _ = QFileDialog.getSaveFileName(self, "Salva Immagine Restaurata", "SavedImages/",
                                                       "Image Files (*.png *.jpg *.jpeg)", options=options)
             if fileName:
-                save_image(self.restored_image, fileName)
-
-                csv_filename = 'risultati.csv'
-                file_exists = os.path.isfile(csv_filename)
-                image_id = 1
-                if file_exists:
-                    with open(csv_filename, mode='r', newline='') as file:
-                        reader = csv.reader(file)
-                        next(reader)
-                        ids = [int(row[0]) for row in reader if row]
-                        if ids:
-                            image_id = max(ids) + 1
-
-                image_name = fileName.split('/')[-1]
-                self.log_filter_results(image_name, self.applied_filters, self.restored_image, image_id)
+                # il salvataggio usa sempre il risultato a piena risoluzione, mai l'anteprima sul proxy: se non e'
+                # ancora pronto si salva in on_filter_applied, senza bloccare l'interfaccia
+                if self.full_resolution_pending():
+                    self.pending_save = fileName
+                    print(f"{fileName} verra' salvata al termine dell'elaborazione a piena risoluzione")
+                else:
+                    self.write_restored_image(fileName)
+
+    def write_restored_image(self, fileName):
+        save_image(self.restored_image, fileName)
+
+        image_name = fileName.split('/')[-1]
+        self.log_filter_results(image_name, self.applied_filters, self.restored_image)
 
     def save_filter_configuration_action(self):
         options = QFileDialog.Options()
@@ -243,131 +314,127 @@ class ImageRestorationApp(QMainWindow):
 
     def show_median_filter_dialog(self):
         dialog = MedianFilterDialog(self, self.apply_median_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_median_blur_filter_dialog(self):
         dialog = MedianFilterDialog(self, self.apply_median_blur_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_mean_filter_dialog(self):
         dialog = MeanFilterDialog(self, self.apply_mean_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_geometric_mean_filter_dialog(self):
         dialog = GeometricMeanFilterDialog(self, self.apply_geometric_mean_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_log_geometric_mean_filter_dialog(self):
         dialog = LogGeometricMeanFilterDialog(self, self.apply_log_geometric_mean_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_gaussian_filter_dialog(self):
         dialog = GaussianFilterDialog(self, self.apply_gaussian_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_contra_harmonic_mean_filter_dialog(self):
         dialog = ContraHarmonicMeanFilterDialog(self, self.apply_contra_harmonic_mean_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_notch_filter_dialog(self):
         dialog = NotchFilterDialog(self, self.apply_notch_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_shock_filter_dialog(self):
         dialog = ShockFilterDialog(self, self.apply_shock_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_homomorphic_filter_dialog(self):
         dialog = HomomorphicFilterDialog(self, self.apply_homomorphic_filter)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_anisotropic_diffusion_dialog(self):
         dialog = AnisotropicDiffusionDialog(self, self.apply_anisotropic_diffusion)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_l1_tv_deconvolution_dialog(self):
         dialog = L1TVDeconvolutionDialog(self, self.apply_l1_tv_deconvolution)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_wiener_filter_dialog(self):
         dialog = WienerFilterDialog(self, self.apply_wiener_deconvolution)
-        dialog.exec_()
+        self.exec_filter_dialog(dialog)
 
     def show_crimmins_filter_dialog(self):
         dialog = CrimminsFilterDialog(self, self.apply_crimmins_filter)
+        self.exec_filter_dialog(dialog)
+
+    def exec_filter_dialog(self, dialog):
+        dialog.preview_invalidated.connect(self.cancel_live_preview)
         dialog.exec_()
+        self.end_live_preview()
 
-    def apply_median_filter(self, ksize):
-        self.applied_filters.append(('Filtro Mediano', ksize))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def add_filter(self, filter_name, param, preview=False):
+        # con preview=True il filtro non viene aggiunto alla catena: si aggiorna solo l'anteprima dal vivo
+        if preview:
+            self.preview_filter(filter_name, param)
+            return
 
-    def apply_median_blur_filter(self, ksize):
-        self.applied_filters.append(('Filtro MedianBlur', ksize))
+        self.applied_filters.append((filter_name, param))
         self.update_filter_list()
         self.apply_all_filters()
 
-    def apply_mean_filter(self, kernel_size):
-        self.applied_filters.append(('Filtro Media Aritmetica', kernel_size))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_median_filter(self, ksize, preview=False):
+        self.add_filter('Filtro Mediano', ksize, preview)
 
-    def apply_geometric_mean_filter(self, kernel_size):
-        self.applied_filters.append(('Filtro Media Geometrica', kernel_size))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_median_blur_filter(self, ksize, preview=False):
+        self.add_filter('Filtro MedianBlur', ksize, preview)
 
-    def apply_log_geometric_mean_filter(self, kernel_size):
-        self.applied_filters.append(('Filtro Media Geometrica Logaritmica', kernel_size))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_mean_filter(self, kernel_size, preview=False):
+        self.add_filter('Filtro Media Aritmetica', kernel_size, preview)
 
-    def apply_gaussian_filter(self, kernel_size, sigma):
-        self.applied_filters.append(('Filtro Gaussiano', {'kernel_size': kernel_size, 'sigma': sigma}))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_geometric_mean_filter(self, kernel_size, preview=False):
+        self.add_filter('Filtro Media Geometrica', kernel_size, preview)
 
-    def apply_contra_harmonic_mean_filter(self, kernel_size, Q):
-        self.applied_filters.append(('Filtro Contra-Harmonic Mean', {'kernel_size': kernel_size, 'Q': Q}))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_log_geometric_mean_filter(self, kernel_size, preview=False):
+        self.add_filter('Filtro Media Geometrica Logaritmica', kernel_size, preview)
 
-    def apply_notch_filter(self, d0, u_k, v_k):
-        self.applied_filters.append(('Filtro Notch', {'d0': d0, 'u_k': u_k, 'v_k': v_k}))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_gaussian_filter(self, kernel_size, sigma, preview=False):
+        self.add_filter('Filtro Gaussiano', {'kernel_size': kernel_size, 'sigma': sigma}, preview)
 
-    def apply_shock_filter(self, iterations):
-        self.applied_filters.append(('Filtro Shock', iterations))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_contra_harmonic_mean_filter(self, kernel_size, Q, preview=False):
+        self.add_filter('Filtro Contra-Harmonic Mean', {'kernel_size': kernel_size, 'Q': Q}, preview)
 
-    def apply_homomorphic_filter(self, low, high, cutoff):
-        self.applied_filters.append(('Filtro Homomorphic', {'low': low, 'high': high, 'cutoff': cutoff}))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_notch_filter(self, d0, u_k, v_k, preview=False):
+        self.add_filter('Filtro Notch', {'d0': d0, 'u_k': u_k, 'v_k': v_k}, preview)
 
-    def apply_anisotropic_diffusion(self, iterations, k, gamma, option):
-        self.applied_filters.append(
-            ('Diffusione Anisotropica', {'iterations': iterations, 'k': k, 'gamma': gamma, 'option': option}))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_shock_filter(self, iterations, tolerance=None, preview=False):
+        self.add_filter('Filtro Shock', iteration_param(iterations, tolerance), preview)
 
-    def apply_l1_tv_deconvolution(self, iterations, regularization_weight):
-        self.applied_filters.append(
-            ('Deconvoluzione ℓ1-TV', {'iterations': iterations, 'regularization_weight': regularization_weight}))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_homomorphic_filter(self, low, high, cutoff, preview=False):
+        self.add_filter('Filtro Homomorphic', {'low': low, 'high': high, 'cutoff': cutoff}, preview)
 
-    def apply_wiener_deconvolution(self, kernel_size, noise):
-        self.applied_filters.append(('Deconvoluzione Wiener', {'kernel_size': kernel_size, 'noise': noise}))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_anisotropic_diffusion(self, iterations, k, gamma, option, tolerance=None, preview=False):
+        param = {'iterations': iterations, 'k': k, 'gamma': gamma, 'option': option}
+        if tolerance is not None:
+            param['tolerance'] = tolerance
+        self.add_filter('Diffusione Anisotropica', param, preview)
 
-    def apply_crimmins_filter(self, iterations):
-        self.applied_filters.append(('Filtro Crimmins Speckle Removal', iterations))
-        self.update_filter_list()
-        self.apply_all_filters()
+    def apply_l1_tv_deconvolution(self, iterations, regularization_weight, tolerance=None, preview=False):
+        param = {'iterations': iterations, 'regularization_weight': regularization_weight}
+        if tolerance is not None:
+            param['tolerance'] = tolerance
+        self.add_filter('Deconvoluzione ℓ1-TV', param, preview)
+
+    def apply_wiener_deconvolution(self, kernel_size, noise, psf=None, psf_size=None, psf_angle=0.0, preview=False):
+        # senza PSF: filtro a statistiche locali; con PSF: deconvoluzione in frequenza (noise = rumore/segnale)
+        if psf is None:
+            param = {'kernel_size': kernel_size, 'noise': noise}
+        else:
+            param = {'psf': psf, 'psf_size': psf_size, 'psf_angle': psf_angle, 'noise': noise}
+        self.add_filter('Deconvoluzione Wiener', param, preview)
+
+    def apply_crimmins_filter(self, iterations, tolerance=None, preview=False):
+        self.add_filter('Filtro Crimmins Speckle Removal', iteration_param(iterations, tolerance), preview)
 
     def apply_gaussian_noise(self):
         self.applied_filters.append(('Rumore Gaussiano', None))
@@ -398,11 +465,21 @@ class ImageRestorationApp(QMainWindow):
         self.filter_list.clear()
         for index, (filter_name, param) in enumerate(self.applied_filters):
             item_widget = FilterItemWidget(filter_name, param, self.create_remove_callback(index))
+            record = self.step_profiles.get(self.filter_prefix_key(index))
+            if record is not None:
+                item_widget.set_profile(format_profile(record))
+            iterations = self.step_iterations.get(self.filter_prefix_key(index))
+            if iterations is not None:
+                item_widget.set_iterations(format_iterations(iterations, param))
             list_item = QListWidgetItem(self.filter_list)
             list_item.setSizeHint(item_widget.sizeHint())
             self.filter_list.addItem(list_item)
             self.filter_list.setItemWidget(list_item, item_widget)
 
+    def filter_prefix_key(self, index):
+        # stessa chiave dei passi di run_chain: tutti i filtri fino a index compreso
+        return tuple((filter_name, freeze_params(param)) for filter_name, param in self.applied_filters[:index + 1])
+
     def create_remove_callback(self, index):
         return lambda: self.remove_filter(index)
 
@@ -415,17 +492,134 @@ class ImageRestorationApp(QMainWindow):
         self.applied_filters = []
         self.filter_list.clear()
 
+    def supersede_workers(self):
+        # l'elaborazione superata viene annullata senza attenderla: si interrompe da sola
+        # alla prossima iterazione e il suo eventuale risultato viene ignorato (nuova generazione)
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.stop()
+        if self.preview_worker is not None and self.preview_worker.isRunning():
+            self.preview_worker.stop()
+
+        self.generation += 1
+
     def apply_all_filters(self):
         if self.image is not None:
-            if hasattr(self, 'worker') and self.worker.isRunning():
-                self.worker.stop()
-                self.worker.wait()
+            self.supersede_workers()
+
+            if self.preview_enabled and self.proxy_scale < 1.0:
+                self.preview_worker = self.start_worker(self.proxy_image,
+                                                        scale_filters(self.applied_filters, self.proxy_scale),
+                                                        self.proxy_cache, self.generation, self.on_preview_applied)
+
+            self.worker = self.start_worker(self.image, list(self.applied_filters), self.prefix_cache,
+                                            self.generation, self.on_filter_applied, profile=self.profiling_enabled,
+                                            track_iterations=True)
+
+    def start_worker(self, image, filters, cache, generation, callback, profile=False, track_iterations=False):
+        worker = FilterWorker(image, filters, cache=cache, generation=generation, profile=profile)
+        worker.filter_applied.connect(callback)
+        if profile:
+            worker.step_profiled.connect(self.on_step_profiled)
+        if track_iterations:
+            # solo la catena a piena risoluzione: le iterazioni sul proxy o nell'anteprima non sono rappresentative
+            worker.iterations_reported.connect(self.on_iterations_reported)
+        worker.finished.connect(self.create_worker_finished_callback(worker))
+
+        # riferimento mantenuto finche' il thread non termina
+        self.active_workers.add(worker)
+        worker.start()
+        return worker
+
+    def preview_filter(self, filter_name, param):
+        if self.image is None:
+            return
+
+        self.cancel_live_preview()
+
+        # sul proxy se l'anteprima veloce e' attiva, altrimenti a piena risoluzione
+        if self.preview_enabled and self.proxy_scale < 1.0:
+            image, cache = self.proxy_image, self.proxy_cache
+            filters = scale_filters(self.applied_filters + [(filter_name, param)], self.proxy_scale)
+        else:
+            image, cache = self.image, self.prefix_cache
+            filters = self.applied_filters + [(filter_name, param)]
+
+        # il passo del filtro in anteprima non entra in cache, solo i prefissi della catena applicata
+        cache = PreviewCache(cache, len(self.applied_filters))
+        self.live_preview_worker = self.start_worker(image, filters, cache, self.live_preview_generation,
+                                                     self.on_live_preview_applied)
+
+    def cancel_live_preview(self):
+        # nuova generazione: il risultato di un'anteprima in volo viene ignorato anche se arriva
+        self.live_preview_generation += 1
+        if self.live_preview_worker is not None and self.live_preview_worker.isRunning():
+            self.live_preview_worker.stop()
+
+    def end_live_preview(self):
+        self.cancel_live_preview()
+        self.live_preview_worker = None
+
+        # dialog chiuso senza applicare: si torna a mostrare il risultato della catena
+        if (self.worker is None or not self.worker.isRunning()) and self.restored_image is not None:
+            image_rgb = convert_to_rgb(self.restored_image)
+            display_image(image_rgb, self.restored_label)
+
+    def on_live_preview_applied(self, result_image, generation):
+        if generation != self.live_preview_generation:
+            return
+
+        image_rgb = convert_to_rgb(result_image)
+        display_image(image_rgb, self.restored_label)
+
+    def create_worker_finished_callback(self, worker):
+        return lambda: self.active_workers.discard(worker)
+
+    def on_preview_applied(self, result_image, generation):
+        # l'anteprima viene mostrata solo se il risultato esatto della stessa richiesta non e' gia' arrivato
+        if generation != self.generation or self.full_result_generation == generation:
+            return
 
-            self.worker = FilterWorker(self.image, self.applied_filters)
-            self.worker.filter_applied.connect(self.on_filter_applied)
-            self.worker.start()
+        image_rgb = convert_to_rgb(result_image)
+        display_image(image_rgb, self.restored_label)
+
+    def on_step_profiled(self, record, generation):
+        if generation != self.generation:
+            return
+
+        self.step_profiles[record.key] = record
+        self.profile_records.append(record)
+        print(f"{record.name}: {format_profile(record)} (CPU {record.cpu_time:.2f} s, immagine {record.shape})")
+
+        # per i passi fusi la misura viene mostrata sull'ultimo filtro del gruppo
+        for index in range(len(self.applied_filters)):
+            if self.filter_prefix_key(index) == record.key:
+                item_widget = self.filter_list.itemWidget(self.filter_list.item(index))
+                if item_widget is not None:
+                    item_widget.set_profile(format_profile(record))
+                break
 
-    def on_filter_applied(self, result_image):
+    def on_iterations_reported(self, name, key, iterations, generation):
+        if generation != self.generation:
+            return
+
+        self.step_iterations[key] = iterations
+        for index, (filter_name, param) in enumerate(self.applied_filters):
+            if self.filter_prefix_key(index) == key:
+                item_widget = self.filter_list.itemWidget(self.filter_list.item(index))
+                if item_widget is not None:
+                    item_widget.set_iterations(format_iterations(iterations, param))
+                break
+
+    def on_filter_applied(self, result_image, generation):
+        if generation != self.generation:
+            return  # risultato di una richiesta superata
+
+        self.full_result_generation = generation
         self.restored_image = result_image
         image_rgb = convert_to_rgb(result_image)
         display_image(image_rgb, self.restored_label)
+
+        # un salvataggio richiesto durante l'elaborazione usa il risultato della catena corrente
+        if self.pending_save is not None:
+            fileName, self.pending_save = self.pending_save, None
+            self.write_restored_image(fileName)
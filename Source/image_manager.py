@@ -1,43 +1,8 @@
-﻿import cv2
-from PyQt5.QtWidgets import QDialog, QLabel, QVBoxLayout, QApplication
+﻿from PyQt5.QtWidgets import QDialog, QLabel, QVBoxLayout, QApplication
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtCore import Qt
 
 
-def load_image(fileName):
-    image = cv2.imread(fileName)
-    if image is None:
-        print("Errore: Immagine non caricata correttamente")
-    return image
-
-
-def save_image(image, path):
-    """
-    Salva un'immagine OpenCV su disco.
-
-    Args:
-        image: L'immagine che deve essere salvata (in formato OpenCV, cioè un array NumPy).
-        path: Il percorso completo del file (incluso il nome e l'estensione) dove l'immagine verrà salvata.
-    """
-    try:
-        if image is None:
-            print("Errore: Nessuna immagine valida da salvare.")
-            return
-
-        success = cv2.imwrite(path, image)
-
-        if success:
-            print(f"Immagine salvata correttamente in: {path}")
-        else:
-            print("Errore durante il salvataggio dell'immagine. Controlla il percorso e i permessi.")
-    except Exception as e:
-        print(f"Errore durante il salvataggio dell'immagine: {e}")
-
-
-def convert_to_rgb(image):
-    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-
 def display_image(image, label):
     height, width, channel = image.shape
     bytes_per_line = 3 * width
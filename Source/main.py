@@ -1,7 +1,4 @@
-﻿from PyQt5.QtWidgets import QApplication
-from PyQt5.QtGui import QFont
-import sys
-from gui import ImageRestorationApp
+﻿import sys
 import os
 
 
@@ -15,7 +12,12 @@ def create_directories():
             print(f"Cartella '{directory}' già esistente.")
 
 
-if __name__ == "__main__":
+def main():
+    # PyQt5 e la GUI vengono importati solo all'avvio dell'applicazione, non da chi usa create_directories
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtGui import QFont
+    from gui import ImageRestorationApp
+
     create_directories()
 
     app = QApplication(sys.argv)
@@ -24,4 +26,8 @@ if __name__ == "__main__":
     window = ImageRestorationApp()
     window.show()
 
-    sys.exit(app.exec_())
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+﻿import cv2
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cancellation import check_cancelled
+
+# kernel fino a questa dimensione: finestre strided + np.partition
+SMALL_KERNEL_MAX = 7
+
+# livelli distinti che entrano nei ranghi uint8 del percorso cv2.medianBlur per i dati interi
+RANK_MAX_LEVELS = 256
+
+# livelli distinti del percorso a bucket: ranghi su due byte, ciascuno filtrato con cv2.medianBlur
+BUCKET_MAX_LEVELS = RANK_MAX_LEVELS * RANK_MAX_LEVELS
+
+# costo di un elemento di cv2.medianBlur (uint8, kernel grandi) in elementi di finestra del percorso strided,
+# misurato tra 14 e 24 per ksize da 9 a 61 con un thread; si usa il massimo
+MEDIAN_BLUR_COST = 24
+
+# elementi (finestre x pixel) elaborati per blocco di righe nel percorso strided
+STRIDED_BLOCK_ELEMENTS = 1 << 24
+
+
+def pad_reflect(image, pad_size):
+    # stesso bordo dell'implementazione originale (cv2.BORDER_REFLECT)
+    if pad_size == 0:
+        return image
+    pad_width = [(pad_size, pad_size), (pad_size, pad_size)] + [(0, 0)] * (image.ndim - 2)
+    return np.pad(image, pad_width, mode='symmetric')
+
+
+def _channel_groups(channels):
+    # cv2.medianBlur accetta solo 1, 3 o 4 canali: gruppi da 4, con il resto da 3 o da 1
+    groups = []
+    start = 0
+    while start < channels:
+        remaining = channels - start
+        size = 4 if remaining >= 4 else (3 if remaining == 3 else 1)
+        groups.append(slice(start, start + size))
+        start += size
+    return groups
+
+
+def median_blur(image, ksize):
+    """
+    cv2.medianBlur con qualsiasi numero di canali (es. una pila di immagini piegata in canali): oltre i 4 canali
+    l'immagine viene elaborata a gruppi di canali, con lo stesso risultato canale per canale.
+    """
+    if image.ndim == 2 or image.shape[2] in (1, 3, 4):
+        return cv2.medianBlur(image, ksize)
+
+    output = np.empty_like(image)
+    for group in _channel_groups(image.shape[2]):
+        filtered = cv2.medianBlur(np.ascontiguousarray(image[:, :, group]), ksize)
+        output[:, :, group] = filtered.reshape(output[:, :, group].shape)
+    return output
+
+
+def median_opencv(image, ksize):
+    """
+    Mediana con cv2.medianBlur (solo uint8, qualsiasi ksize dispari e numero di canali).
+
+    medianBlur usa internamente BORDER_REPLICATE: si applica sull'immagine gia' estesa con BORDER_REFLECT
+    e si ritaglia, in modo che ogni pixel interno veda esattamente la stessa finestra dell'originale.
+    """
+    pad_size = ksize // 2
+    padded = pad_reflect(image, pad_size)
+    filtered = median_blur(np.ascontiguousarray(padded), ksize)
+    return filtered[pad_size:pad_size + image.shape[0], pad_size:pad_size + image.shape[1]]
+
+
+def median_strided(image, ksize, cancel_token=None):
+    """
+    Mediana vettorizzata su finestre strided (sliding_window_view), per kernel piccoli e qualsiasi dtype.
+
+    Le righe vengono elaborate a blocchi per limitare la memoria del buffer di partizionamento.
+    """
+    pad_size = ksize // 2
+    padded = pad_reflect(image, pad_size)
+    height, width = image.shape[:2]
+    area = ksize * ksize
+    kth = area // 2
+
+    output = np.empty_like(image)
+    row_elements = width * area * (image.shape[2] if image.ndim == 3 else 1)
+    block_rows = max(1, STRIDED_BLOCK_ELEMENTS // max(row_elements, 1))
+
+    for start in range(0, height, block_rows):
+        check_cancelled(cancel_token)
+        stop = min(start + block_rows, height)
+        block = padded[start:stop + 2 * pad_size]
+        # (righe, colonne[, canali], ksize, ksize)
+        windows = sliding_window_view(block, (ksize, ksize), axis=(0, 1))
+        windows = windows.reshape(windows.shape[:-2] + (area,))
+        output[start:stop] = np.partition(windows, kth, axis=-1)[..., kth]
+
+    return output
+
+
+def _ranks(image, levels):
+    # rango di ogni valore tra i livelli ordinati: tabella per interi con un intervallo piccolo, altrimenti ricerca
+    if np.issubdtype(image.dtype, np.integer) and int(levels[-1]) - int(levels[0]) < BUCKET_MAX_LEVELS * 16:
+        table = np.zeros(int(levels[-1]) - int(levels[0]) + 1, dtype=np.int32)
+        table[levels.astype(np.int64) - int(levels[0])] = np.arange(len(levels), dtype=np.int32)
+        return table[image.astype(np.int64) - int(levels[0])]
+    return np.searchsorted(levels, image)
+
+
+def median_ranks(image, ksize, levels=None):
+    """
+    Mediana di dati interi con al piu' RANK_MAX_LEVELS livelli distinti: i valori vengono sostituiti dai loro ranghi
+    (uint8) e filtrati con cv2.medianBlur, che per kernel grandi usa gli istogrammi per colonna di Perreault (tempo
+    costante rispetto a ksize). La mediana dei ranghi e' il rango della mediana, quindi il risultato e' esatto.
+    """
+    if levels is None:
+        levels, ranks = np.unique(image, return_inverse=True)
+    else:
+        ranks = _ranks(image, levels)
+    ranks = ranks.reshape(image.shape).astype(np.uint8)
+    return levels[median_opencv(ranks, ksize)].astype(image.dtype, copy=False)
+
+
+def median_buckets(image, ksize, levels=None, cancel_token=None, max_elements=None):
+    """
+    Mediana esatta di dati con al piu' BUCKET_MAX_LEVELS livelli distinti (es. uint16 o float quantizzati), con
+    cv2.medianBlur sui due byte dei ranghi: tempo costante rispetto a ksize come median_ranks.
+
+    La divisione intera per 256 e' monotona, quindi la mediana dei bucket (rango // 256) e' il bucket della mediana.
+    Per ogni bucket b presente nel risultato i ranghi vengono poi limitati a [256 b, 256 b + 255], che non sposta una
+    mediana compresa nell'intervallo, e la mediana uint8 di rango - 256 b vale per i pixel di quel bucket. Il costo
+    cresce con il numero di bucket distinti (al piu' 256), ognuno limitato alle righe in cui compare.
+
+    Returns:
+        La mediana, oppure None se il lavoro stimato (elementi filtrati con cv2.medianBlur per MEDIAN_BLUR_COST)
+        supera max_elements.
+    """
+    if levels is None:
+        levels, ranks = np.unique(image, return_inverse=True)
+    else:
+        ranks = _ranks(image, levels)
+    ranks = ranks.reshape(image.shape).astype(np.int32)
+    buckets = median_opencv((ranks >> 8).astype(np.uint8), ksize).reshape(image.shape)
+
+    pad_size = ksize // 2
+    height, width = image.shape[:2]
+    # righe di ogni bucket dal minimo e dal massimo per riga (un passaggio ciascuno invece di uno per bucket)
+    row_buckets = buckets.reshape(height, -1)
+    row_min, row_max = row_buckets.min(axis=1), row_buckets.max(axis=1)
+    bands = []
+    for bucket in np.flatnonzero(np.bincount(buckets.ravel(), minlength=256)).astype(np.uint8):
+        rows = np.flatnonzero((row_min <= bucket) & (row_max >= bucket))
+        bands.append((bucket, rows[0], rows[-1] + 1))
+    if max_elements is not None:
+        # le bande piu' il primo passaggio sui bucket, sull'immagine intera
+        band_rows = sum(stop - start + 2 * pad_size for _, start, stop in bands) + height + 2 * pad_size
+        if band_rows * (width + 2 * pad_size) * (image.size // (height * width)) * MEDIAN_BLUR_COST > max_elements:
+            return None
+
+    padded = pad_reflect(ranks, pad_size)
+    output = np.empty(image.shape, dtype=np.int32)
+    for bucket, start, stop in bands:
+        check_cancelled(cancel_token)
+        low = bucket.astype(np.int32) << 8
+        band = np.clip(padded[start:stop + 2 * pad_size], low, low + 255) - low
+        # bordo gia' esteso con BORDER_REFLECT: si ritaglia come in median_opencv
+        filtered = median_blur(np.ascontiguousarray(band.astype(np.uint8)), ksize).reshape(band.shape)
+        filtered = filtered[pad_size:pad_size + stop - start, pad_size:pad_size + width]
+        mask = buckets[start:stop] == bucket
+        output[start:stop][mask] = low + filtered[mask]
+
+    return levels[output].astype(image.dtype, copy=False)
+
+
+def median_engine(image, ksize, cancel_token=None):
+    """
+    Sceglie automaticamente il percorso di calcolo della mediana in base a ksize e al dtype:
+
+    - uint8: cv2.medianBlur (O(1) per pixel anche per kernel grandi);
+    - kernel piccoli (ksize <= SMALL_KERNEL_MAX): finestre strided vettorizzate;
+    - kernel grandi su dati interi con al piu' RANK_MAX_LEVELS livelli distinti: ranghi uint8 e cv2.medianBlur;
+    - kernel grandi con al piu' BUCKET_MAX_LEVELS livelli distinti (es. uint16, float quantizzati): ranghi su due
+      byte e median_buckets, se il lavoro stimato e' minore di quello strided (ksize^2 elementi per pixel);
+    - altrimenti (es. float con piu' di BUCKET_MAX_LEVELS valori distinti): finestre strided.
+    """
+    if image.dtype == np.uint8:
+        return median_opencv(image, ksize)
+
+    if ksize <= SMALL_KERNEL_MAX:
+        return median_strided(image, ksize, cancel_token)
+
+    levels = np.unique(image)
+    if len(levels) <= RANK_MAX_LEVELS and (np.issubdtype(image.dtype, np.integer) or image.dtype == np.bool_):
+        return median_ranks(image, ksize, levels)
+    if len(levels) <= BUCKET_MAX_LEVELS:
+        filtered = median_buckets(image, ksize, levels, cancel_token, max_elements=image.size * ksize * ksize)
+        if filtered is not None:
+            return filtered
+
+    return median_strided(image, ksize, cancel_token)
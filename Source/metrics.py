@@ -0,0 +1,207 @@
+﻿import numpy as np
+import cv2
+
+# costanti dell'SSIM (Wang et al. 2004), le stesse di skimage.metrics.structural_similarity
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+SSIM_WIN_SIZE = 7
+SSIM_GAUSSIAN_SIGMA = 1.5
+SSIM_GAUSSIAN_WIN_SIZE = 11  # 2 * int(3.5 * sigma + 0.5) + 1, come il troncamento di skimage
+
+# intervallo dei valori delle immagini a 8 bit, usato da PSNR e SSIM
+DATA_RANGE = 255.0
+
+
+def _align(original, restored):
+    # stesse conversioni del CSV dei risultati: niente canale alfa, stessi canali e stessa dimensione dell'originale
+    if original.ndim == 3 and original.shape[2] == 4:
+        original = original[:, :, :3]
+    if restored.ndim == 3 and restored.shape[2] == 4:
+        restored = restored[:, :, :3]
+
+    if original.ndim == 2 and restored.ndim == 3:
+        restored = cv2.cvtColor(restored, cv2.COLOR_BGR2GRAY)
+    elif original.ndim == 3 and restored.ndim == 2:
+        restored = cv2.cvtColor(restored, cv2.COLOR_GRAY2BGR)
+
+    if original.shape[:2] != restored.shape[:2]:
+        restored = cv2.resize(restored, (original.shape[1], original.shape[0]))
+    return original, restored
+
+
+def _ssim_win_size(shape, gaussian_weights):
+    # finestra 7x7 (11x11 gaussiana) ridotta per le immagini piu' piccole; None se l'SSIM non e' calcolabile
+    win_size = SSIM_GAUSSIAN_WIN_SIZE if gaussian_weights else min(SSIM_WIN_SIZE, shape[0], shape[1])
+    if win_size % 2 == 0:
+        win_size -= 1
+    if win_size < 3 or win_size > min(shape[0], shape[1]):
+        return None
+    return win_size
+
+
+def _local_mean(image, win_size, gaussian_weights):
+    # statistiche locali separabili in OpenCV, tutti i canali in una sola chiamata
+    if gaussian_weights:
+        return cv2.GaussianBlur(image, (win_size, win_size), SSIM_GAUSSIAN_SIGMA, borderType=cv2.BORDER_REFLECT)
+    return cv2.boxFilter(image, -1, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+
+
+class _Reference:
+    """
+    Immagine di riferimento convertita in float32 una sola volta, con le sue statistiche locali per l'SSIM.
+    Nei batch viene riusata da tutte le coppie che hanno lo stesso riferimento.
+    """
+
+    def __init__(self, image, gaussian_weights):
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = image[:, :, :3]
+        self.image = image
+        self.data = image.astype(np.float32)
+        self.gaussian_weights = gaussian_weights
+        self.win_size = _ssim_win_size(image.shape, gaussian_weights)
+        self._statistics = None
+
+    def statistics(self):
+        # media locale, suo quadrato e varianza campionaria locale, calcolati alla prima richiesta
+        if self._statistics is None:
+            mean = _local_mean(self.data, self.win_size, self.gaussian_weights)
+            mean_sq = mean * mean
+            variance = _local_mean(self.data * self.data, self.win_size, self.gaussian_weights)
+            variance -= mean_sq
+            variance *= _covariance_norm(self.win_size)
+            self._statistics = (mean, mean_sq, variance)
+        return self._statistics
+
+
+def _covariance_norm(win_size):
+    # covarianza campionaria come in skimage (use_sample_covariance=True)
+    num_samples = win_size * win_size
+    return num_samples / (num_samples - 1.0)
+
+
+def _mse(x, y):
+    # un solo buffer float32 per differenza e quadrato; somma in float64
+    diff = np.subtract(x, y)
+    np.square(diff, out=diff)
+    return float(diff.mean(dtype=np.float64))
+
+
+def _psnr(mse, data_range=DATA_RANGE):
+    # stessa formula di cv2.PSNR, che per immagini identiche restituisce un valore finito (~361 dB)
+    return float(20.0 * np.log10(data_range / (np.sqrt(mse) + np.finfo(np.float64).eps)))
+
+
+def _ssim(reference, y, full=False, data_range=DATA_RANGE):
+    win_size = reference.win_size
+    if win_size is None:
+        print("L'immagine è troppo piccola per calcolare l'SSIM. Impostazione di SSIM a 'N/A'.")
+        return ("N/A", None) if full else "N/A"
+
+    x = reference.data
+    gaussian_weights = reference.gaussian_weights
+    mu_x, mu_x_sq, sigma_x = reference.statistics()
+    mu_y = _local_mean(y, win_size, gaussian_weights)
+    sigma_y = _local_mean(y * y, win_size, gaussian_weights)
+    sigma_xy = _local_mean(x * y, win_size, gaussian_weights)
+
+    cov_norm = _covariance_norm(win_size)
+    c1 = (SSIM_K1 * data_range) ** 2
+    c2 = (SSIM_K2 * data_range) ** 2
+
+    # varianza e covarianza calcolate sul posto nei buffer delle medie locali
+    mu_x_mu_y = mu_x * mu_y
+    mu_y *= mu_y
+    sigma_y -= mu_y
+    sigma_y *= cov_norm
+    sigma_xy -= mu_x_mu_y
+    sigma_xy *= cov_norm
+
+    # SSIM = (2 mx my + C1)(2 sxy + C2) / ((mx^2 + my^2 + C1)(sx + sy + C2))
+    numerator = mu_x_mu_y
+    numerator *= 2.0
+    numerator += c1
+    sigma_xy *= 2.0
+    sigma_xy += c2
+    numerator *= sigma_xy
+
+    denominator = mu_y
+    denominator += mu_x_sq
+    denominator += c1
+    sigma_y += sigma_x
+    sigma_y += c2
+    denominator *= sigma_y
+
+    ssim_map = np.divide(numerator, denominator, out=numerator)
+
+    # i bordi influenzati dal padding sono esclusi dalla media, come in skimage
+    pad = (win_size - 1) // 2
+    ssim_value = float(ssim_map[pad:-pad, pad:-pad].mean(dtype=np.float64))
+
+    return (ssim_value, ssim_map) if full else ssim_value
+
+
+def _metrics(reference, restored, ssim=True):
+    _, restored = _align(reference.image, restored)
+    y = restored.astype(np.float32)
+
+    mse_value = _mse(reference.data, y)
+    psnr_value = _psnr(mse_value)
+    ssim_value = _ssim(reference, y) if ssim else None
+    return psnr_value, mse_value, ssim_value
+
+
+def calculate_psnr(original, restored):
+    original, restored = _align(original, restored)
+    return _psnr(_mse(original.astype(np.float32), restored.astype(np.float32)))
+
+
+def calculate_mse(original, restored):
+    # differenza in float32: con uint8 i valori negativi andrebbero in overflow
+    original, restored = _align(original, restored)
+    return _mse(original.astype(np.float32), restored.astype(np.float32))
+
+
+def calculate_ssim(original, restored, gaussian_weights=False, full=False):
+    """
+    SSIM medio tra due immagini (canali trattati insieme), con finestra uniforme 7x7 oppure gaussiana (sigma 1.5).
+
+    Returns:
+        Il valore medio, oppure (valore, mappa SSIM) se full=True; "N/A" se l'immagine e' troppo piccola.
+    """
+    reference = _Reference(original, gaussian_weights)
+    _, restored = _align(reference.image, restored)
+    return _ssim(reference, restored.astype(np.float32), full=full)
+
+
+def compute_metrics(original_image, restored_image, gaussian_weights=False):
+    """
+    PSNR, MSE e SSIM tra l'immagine originale e quella restaurata, con le stesse conversioni di colore e
+    dimensione usate per il CSV dei risultati. Le immagini vengono convertite in float32 una sola volta.
+
+    Returns:
+        (psnr, mse, ssim)
+    """
+    return _metrics(_Reference(original_image, gaussian_weights), restored_image)
+
+
+def compute_metrics_batch(pairs, gaussian_weights=False, ssim=True):
+    """
+    Metriche per una lista di coppie (originale, restaurata), ad esempio i risultati di uno sweep di parametri.
+    Le coppie con lo stesso oggetto come originale riusano la sua conversione e le sue statistiche locali.
+
+    Args:
+        pairs: iterabile di (immagine originale, immagine restaurata).
+        ssim: se False l'SSIM non viene calcolato (None nel risultato).
+
+    Returns:
+        Lista di (psnr, mse, ssim) nello stesso ordine delle coppie.
+    """
+    references = {}
+    results = []
+    for original_image, restored_image in pairs:
+        reference = references.get(id(original_image))
+        if reference is None:
+            reference = _Reference(original_image, gaussian_weights)
+            references[id(original_image)] = reference
+        results.append(_metrics(reference, restored_image, ssim=ssim))
+    return results
@@ -0,0 +1,176 @@
+﻿from filters import median_filter, mean_filter, shock_filter, homomorphic_filter, anisotropic_diffusion, \
+    median_blur_filter, geometric_mean_filter, log_geometric_mean_filter, l1_tv_deconvolution, wiener_deconvolution, \
+    add_gaussian_noise, add_salt_pepper_noise, add_uniform_noise, add_film_grain_noise, add_periodic_noise, \
+    gaussian_filter, contra_harmonic_mean_filter, notch_filter, crimmins_speckle_removal, frequency_filter, \
+    wiener_psf_deconvolution
+from cancellation import FilterCancelled, check_cancelled
+from convergence import split_iteration_param
+from prefix_cache import prefix_keys
+from transfer_functions import TRANSFER_DOMAINS
+
+
+def _shock_step(img, param, token, report):
+    # parametro: numero di iterazioni oppure {'iterations': n, 'tolerance': t}
+    iterations, tolerance = split_iteration_param(param)
+    return shock_filter(img, iterations, cancel_token=token, tolerance=tolerance, report=report)
+
+
+def _crimmins_step(img, param, token, report):
+    iterations, tolerance = split_iteration_param(param)
+    return crimmins_speckle_removal(img, iterations=iterations, cancel_token=token, tolerance=tolerance,
+                                    report=report)
+
+
+def _wiener_step(img, param):
+    # statistiche locali {'kernel_size', 'noise'} oppure deconvoluzione {'psf', 'psf_size', 'psf_angle', 'noise'}
+    if 'psf' in param:
+        return wiener_psf_deconvolution(img, param['psf'], param['psf_size'], param.get('psf_angle', 0.0),
+                                        param['noise'])
+    return wiener_deconvolution(img, param['kernel_size'], param['noise'])
+
+
+# ogni voce riceve (immagine, parametri, token di annullamento, report); i filtri iterativi controllano il token e,
+# con una tolleranza nei parametri, passano a report le iterazioni eseguite
+FILTER_FUNCTIONS = {
+    "Filtro Mediano": lambda img, param, token, report: median_filter(img, param, cancel_token=token),
+    "Filtro MedianBlur": lambda img, param, token, report: median_blur_filter(img, param),
+    "Filtro Media Aritmetica": lambda img, param, token, report: mean_filter(img, param),
+    "Filtro Media Geometrica": lambda img, param, token, report: geometric_mean_filter(img, param),
+    "Filtro Media Geometrica Logaritmica": lambda img, param, token, report: log_geometric_mean_filter(img, param),
+    "Filtro Gaussiano": lambda img, param, token, report: gaussian_filter(img, kernel_size=param['kernel_size'],
+                                                                          sigma=param['sigma']),
+    "Filtro Contra-Harmonic Mean": lambda img, param, token, report: contra_harmonic_mean_filter(
+        img, kernel_size=param['kernel_size'], Q=param['Q']),
+    "Filtro Notch": lambda img, param, token, report: notch_filter(img, d0=param['d0'], u_k=param['u_k'],
+                                                                   v_k=param['v_k']),
+    "Filtro Shock": lambda img, param, token, report: _shock_step(img, param, token, report),
+    "Filtro Homomorphic": lambda img, param, token, report: homomorphic_filter(img, low=param['low'],
+                                                                               high=param['high'],
+                                                                               cutoff=param['cutoff']),
+    "Diffusione Anisotropica": lambda img, param, token, report: anisotropic_diffusion(
+        img, iterations=param['iterations'], k=param['k'], gamma=param['gamma'], option=param['option'],
+        cancel_token=token, tolerance=param.get('tolerance'), report=report),
+    "Deconvoluzione ℓ1-TV": lambda img, param, token, report: l1_tv_deconvolution(
+        img, iterations=param['iterations'], regularization_weight=param['regularization_weight'],
+        cancel_token=token, tolerance=param.get('tolerance'), report=report),
+    "Deconvoluzione Wiener": lambda img, param, token, report: _wiener_step(img, param),
+    "Filtro Crimmins Speckle Removal": lambda img, param, token, report: _crimmins_step(img, param, token, report),
+    "Rumore Gaussiano": lambda img, _, token, report: add_gaussian_noise(img),
+    "Rumore Sale e Pepe": lambda img, _, token, report: add_salt_pepper_noise(img),
+    "Rumore Uniforme": lambda img, _, token, report: add_uniform_noise(img),
+    "Rumore Grana della Pellicola": lambda img, _, token, report: add_film_grain_noise(img),
+    "Rumore Periodico": lambda img, _, token, report: add_periodic_noise(img),
+}
+
+# filtri in frequenza: parametri della GUI -> (filter_type, parametri) per transfer_function
+FREQUENCY_STEPS = {
+    "Filtro Notch": lambda param: ('notch', (param['d0'], param['u_k'], param['v_k'])),
+    "Filtro Homomorphic": lambda param: ('homomorphic', (param['low'], param['high'], param['cutoff'])),
+}
+
+
+def build_chain(filters, fuse_spectra=True):
+    """
+    Trasforma la lista (nome filtro, parametri) nei passi da eseguire.
+
+    Con fuse_spectra, filtri in frequenza consecutivi che operano nello stesso dominio diventano un solo passo:
+    le loro funzioni di trasferimento vengono moltiplicate nello spettro invece di tornare ogni volta nel dominio
+    spaziale (si saltano quindi il clip e la conversione a uint8 intermedi).
+
+    Returns:
+        Lista di (nome del passo, funzione (immagine, token, report) -> immagine, filtri (nome, parametri) consumati).
+    """
+    chain = []
+    fused_steps = []
+
+    def flush_fused():
+        if len(fused_steps) == 1:
+            chain.append(fused_steps[0][0])
+        elif fused_steps:
+            name = " + ".join(single[0] for single, _ in fused_steps)
+            steps = [step for _, step in fused_steps]
+            consumed = [filter_entry for single, _ in fused_steps for filter_entry in single[2]]
+            chain.append((name, lambda img, token, report, steps=steps: frequency_filter(img, steps), consumed))
+        fused_steps.clear()
+
+    for filter_name, param in filters:
+        filter_func = FILTER_FUNCTIONS.get(filter_name)
+        if not filter_func:
+            print(f"Filtro non riconosciuto: '{filter_name}'")
+            continue
+
+        single_step = (filter_name,
+                       lambda img, token, report, filter_func=filter_func, param=param: filter_func(img, param, token,
+                                                                                                   report),
+                       [(filter_name, param)])
+
+        to_frequency_step = FREQUENCY_STEPS.get(filter_name) if fuse_spectra else None
+        if to_frequency_step is None:
+            flush_fused()
+            chain.append(single_step)
+            continue
+
+        try:
+            step = to_frequency_step(param)
+        except Exception as e:
+            print(f"Errore durante l'applicazione del filtro '{filter_name}': {e}")
+            continue
+
+        if fused_steps and TRANSFER_DOMAINS[fused_steps[-1][1][0]] != TRANSFER_DOMAINS[step[0]]:
+            flush_fused()
+        fused_steps.append((single_step, step))
+
+    flush_fused()
+    return chain
+
+
+def run_chain(image, filters, fuse_spectra=True, cache=None, cancel_token=None, profiler=None, on_iterations=None):
+    """
+    Applica una catena di filtri (nome filtro, parametri) a un'immagine, senza dipendenze da Qt.
+
+    Con una PrefixCache si riparte dal prefisso piu' lungo gia' calcolato e si memorizza ogni passo nuovo.
+    I filtri che falliscono vengono segnalati e saltati, come nella GUI. Con un FilterProfiler ogni passo calcolato
+    (non quelli presi dalla cache) viene misurato. Con on_iterations, i filtri iterativi con una tolleranza chiamano
+    on_iterations(nome del passo, chiave del prefisso, iterazioni eseguite).
+
+    Raises:
+        FilterCancelled: se cancel_token viene annullato durante l'elaborazione (il risultato parziale e' scartato).
+    """
+    chain = build_chain(filters, fuse_spectra)
+    keys = prefix_keys(chain)
+
+    # si riparte dal prefisso piu' lungo gia' calcolato (undo, rimozione, aggiunta di un filtro)
+    start = 0
+    temp_image = None
+    if cache is not None:
+        cache.bind(image)
+        last_cached, temp_image = cache.longest_prefix(keys)
+        start = last_cached + 1
+    if temp_image is None:
+        temp_image = image.copy()
+
+    for index in range(start, len(chain)):
+        check_cancelled(cancel_token)
+
+        filter_name, filter_func, consumed = chain[index]
+        report = None
+        if on_iterations is not None:
+            report = lambda iterations, name=filter_name, key=keys[index]: on_iterations(name, key, iterations)
+        step_func = lambda img, token, filter_func=filter_func, report=report: filter_func(img, token, report)
+        try:
+            if profiler is None:
+                temp_image = step_func(temp_image, cancel_token)
+            else:
+                temp_image = profiler.profile(filter_name, consumed, keys[index], step_func, temp_image,
+                                              cancel_token)
+        except FilterCancelled:
+            raise
+        except Exception as e:
+            print(f"Errore durante l'applicazione del filtro '{filter_name}': {e}")
+            continue
+
+        # un'elaborazione annullata o superata non scrive nella cache, che potrebbe gia' servire un'altra immagine
+        if cache is not None and not (cancel_token is not None and cancel_token.cancelled):
+            cache.put(keys[index], temp_image, image)
+
+    return temp_image
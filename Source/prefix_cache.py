@@ -0,0 +1,130 @@
+﻿import threading
+from collections import OrderedDict
+
+# memoria massima occupata dai risultati intermedi
+DEFAULT_BUDGET_BYTES = 512 * 1024 * 1024
+
+
+def freeze_params(param):
+    # parametri della GUI/JSON (dict, liste) -> chiave hashable
+    if isinstance(param, dict):
+        return tuple(sorted((key, freeze_params(value)) for key, value in param.items()))
+    if isinstance(param, (list, tuple)):
+        return tuple(freeze_params(value) for value in param)
+    return param
+
+
+def prefix_keys(chain):
+    """
+    Chiavi cumulative di una catena: la chiave del passo j identifica tutti i filtri (nome + parametri)
+    applicati dall'immagine originale fino al passo j compreso.
+
+    Args:
+        chain: passi come restituiti da build_chain, (nome, funzione, filtri consumati).
+    """
+    keys = []
+    key = ()
+    for _, _, consumed in chain:
+        key = key + tuple((filter_name, freeze_params(param)) for filter_name, param in consumed)
+        keys.append(key)
+    return keys
+
+
+class PrefixCache:
+    """
+    Cache LRU dei risultati intermedi di una catena di filtri, con un limite di memoria.
+
+    Le chiavi sono i prefissi della catena, quindi aggiungere un filtro ricalcola un solo passo, l'undo e' immediato
+    e rimuovere il filtro k ricalcola solo dal passo k in poi. La cache e' legata a una singola immagine sorgente:
+    quando cambia l'immagine viene svuotata.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._used_bytes = 0
+        self._source = None
+        self._lock = threading.Lock()
+
+    def bind(self, image):
+        with self._lock:
+            if self._source is not image:
+                self._clear()
+                self._source = image
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+            return image
+
+    def put(self, key, image, source=None):
+        """
+        Memorizza il risultato del prefisso key. Con source (l'immagine da cui e' stato calcolato) il risultato viene
+        scartato se nel frattempo la cache e' stata legata a un'altra immagine, ad esempio da un'elaborazione
+        superata che termina dopo il caricamento di una nuova immagine.
+        """
+        if image.nbytes > self.budget_bytes:
+            return
+
+        with self._lock:
+            if source is not None and source is not self._source:
+                return
+            if key in self._entries:
+                self._used_bytes -= self._entries.pop(key).nbytes
+
+            self._entries[key] = image
+            self._used_bytes += image.nbytes
+
+            # rimozione dei risultati usati meno di recente fino a rientrare nel limite
+            while self._used_bytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._used_bytes -= evicted.nbytes
+
+    def longest_prefix(self, keys):
+        """
+        Restituisce (indice, immagine) del prefisso piu' lungo presente in cache, oppure (-1, None).
+        """
+        for index in range(len(keys) - 1, -1, -1):
+            image = self.get(keys[index])
+            if image is not None:
+                return index, image
+        return -1, None
+
+    def clear(self):
+        # anche il legame con l'immagine: i risultati ancora in arrivo per quella precedente vengono scartati
+        with self._lock:
+            self._clear()
+            self._source = None
+
+    def _clear(self):
+        self._entries.clear()
+        self._used_bytes = 0
+
+    @property
+    def used_bytes(self):
+        return self._used_bytes
+
+
+class PreviewCache:
+    """
+    Vista di una PrefixCache per le anteprime dal vivo: riparte dai prefissi in cache e memorizza solo quelli dei
+    primi prefix_length filtri (la catena gia' applicata). Il risultato con il filtro in anteprima cambia a ogni
+    valore del dialog: memorizzarlo farebbe uscire dalla cache i prefissi usati da undo e rimozione.
+    """
+
+    def __init__(self, cache, prefix_length):
+        self.cache = cache
+        self.prefix_length = prefix_length
+
+    def bind(self, image):
+        self.cache.bind(image)
+
+    def longest_prefix(self, keys):
+        return self.cache.longest_prefix(keys)
+
+    def put(self, key, image, source=None):
+        # la chiave di un prefisso contiene un elemento per ogni filtro applicato
+        if len(key) <= self.prefix_length:
+            self.cache.put(key, image, source)
@@ -0,0 +1,119 @@
+﻿import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+
+# misure di un passo della catena: tempi in secondi, start in secondi dall'epoch (per allineare processi diversi)
+StepProfile = namedtuple('StepProfile', ['name', 'filters', 'key', 'start', 'wall_time', 'cpu_time', 'peak_bytes',
+                                         'shape', 'dtype', 'pid', 'thread_id'])
+
+# tracemalloc e' globale al processo: viene avviato dal primo profiler attivo e fermato dall'ultimo
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+class FilterProfiler:
+    """
+    Misura ogni passo di una catena di filtri: tempo reale, tempo CPU del processo (comprende i thread di OpenCV e
+    della FFT), picco di memoria allocata e forma dell'immagine in ingresso.
+
+    La memoria viene misurata con tracemalloc, che vede le allocazioni di NumPy ma non i buffer interni di OpenCV;
+    con memory=None si misurano solo i tempi. Senza profiler (profiler=None in run_chain) non c'e' alcun costo.
+    """
+
+    def __init__(self, memory='tracemalloc', on_record=None):
+        if memory not in ('tracemalloc', None):
+            raise ValueError(f"Modalita' di misura della memoria non valida: '{memory}'")
+        self.memory = memory
+        self.on_record = on_record
+        self.records = []
+
+    def profile(self, name, filters, key, func, image, cancel_token):
+        """
+        Esegue func(image, cancel_token) misurandolo; il record viene aggiunto a records e passato a on_record.
+        """
+        if self.memory == 'tracemalloc':
+            _start_tracemalloc()
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        start = time.time()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            result = func(image, cancel_token)
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+            peak_bytes = None
+            if self.memory == 'tracemalloc':
+                peak_bytes = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            if self.memory == 'tracemalloc':
+                _stop_tracemalloc()
+
+        record = StepProfile(name, list(filters), key, start, wall_time, cpu_time, peak_bytes, image.shape,
+                             str(image.dtype), os.getpid(), threading.get_ident())
+        self.records.append(record)
+        if self.on_record is not None:
+            self.on_record(record)
+        return result
+
+
+def format_profile(record):
+    # testo breve per la lista dei filtri, es. "12.3 s / 480 MB"
+    text = f"{record.wall_time:.1f} s" if record.wall_time >= 0.1 else f"{record.wall_time * 1000:.0f} ms"
+    if record.peak_bytes is not None:
+        text += f" / {record.peak_bytes / (1024 * 1024):.0f} MB"
+    return text
+
+
+def trace_events(records):
+    """
+    Eventi "complete" (ph "X") del formato Chrome trace, visualizzabili in chrome://tracing o Perfetto.
+    """
+    events = []
+    for record in records:
+        events.append({
+            'name': record.name,
+            'cat': 'filter',
+            'ph': 'X',
+            'ts': record.start * 1e6,
+            'dur': record.wall_time * 1e6,
+            'pid': record.pid,
+            'tid': record.thread_id,
+            'args': {
+                'cpu_time_s': record.cpu_time,
+                'peak_bytes': record.peak_bytes,
+                'shape': list(record.shape),
+                'dtype': record.dtype,
+                'filters': [[filter_name, param] for filter_name, param in record.filters],
+            },
+        })
+    return events
+
+
+def export_chrome_trace(records, file_path):
+    try:
+        with open(file_path, 'w') as f:
+            json.dump({'traceEvents': trace_events(records), 'displayTimeUnit': 'ms'}, f)
+        print(f"Trace salvata con successo in {file_path}")
+    except Exception as e:
+        print(f"Errore durante il salvataggio della trace: {e}")
@@ -0,0 +1,90 @@
+﻿import cv2
+
+# lato massimo del proxy usato per l'anteprima veloce
+PROXY_MAX_SIDE = 800
+
+
+def make_proxy(image, max_side=PROXY_MAX_SIDE):
+    """
+    Versione ridotta dell'immagine per l'anteprima, con il fattore di scala applicato.
+
+    Returns:
+        (proxy, scale); se l'immagine e' gia' abbastanza piccola restituisce (image, 1.0).
+    """
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1.0:
+        return image, 1.0
+
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+def _scale_kernel(kernel_size, scale):
+    # dimensione del kernel in pixel del proxy, sempre dispari
+    scaled = max(1, int(round(kernel_size * scale)))
+    return scaled if scaled % 2 == 1 else scaled + 1
+
+
+def _scale_iterations(iterations, scale):
+    # per i filtri che spostano i bordi di circa un pixel per iterazione
+    return max(1, int(round(iterations * scale)))
+
+
+def _scale_iteration_param(param, scale):
+    # numero di iterazioni oppure {'iterations': n, 'tolerance': t}
+    if isinstance(param, dict):
+        return {**param, 'iterations': _scale_iterations(param['iterations'], scale)}
+    return _scale_iterations(param, scale)
+
+
+def _scale_diffusion(param, scale):
+    # la distanza di diffusione cresce come sqrt(iterazioni): servono scale^2 iterazioni
+    scaled = dict(param)
+    scaled['iterations'] = max(1, int(round(param['iterations'] * scale * scale)))
+    return scaled
+
+
+def _scale_wiener(param, scale):
+    # finestra delle statistiche locali oppure dimensione della PSF, entrambe in pixel
+    if 'psf' in param:
+        return {**param, 'psf_size': param['psf_size'] * scale}
+    return {**param, 'kernel_size': _scale_kernel(param['kernel_size'], scale)}
+
+
+# parametri espressi in pixel da adattare al proxy; u_k, v_k, d0 e cutoff dei filtri in frequenza sono in
+# cicli per immagine, quindi restano gli stessi anche sul proxy
+_PARAM_SCALERS = {
+    "Filtro Mediano": lambda param, scale: _scale_kernel(param, scale),
+    "Filtro MedianBlur": lambda param, scale: _scale_kernel(param, scale),
+    "Filtro Media Aritmetica": lambda param, scale: _scale_kernel(param, scale),
+    "Filtro Media Geometrica": lambda param, scale: _scale_kernel(param, scale),
+    "Filtro Media Geometrica Logaritmica": lambda param, scale: _scale_kernel(param, scale),
+    "Filtro Gaussiano": lambda param, scale: {'kernel_size': _scale_kernel(param['kernel_size'], scale),
+                                              'sigma': max(0.1, param['sigma'] * scale)},
+    "Filtro Contra-Harmonic Mean": lambda param, scale: {**param,
+                                                         'kernel_size': _scale_kernel(param['kernel_size'], scale)},
+    "Filtro Shock": _scale_iteration_param,
+    "Diffusione Anisotropica": _scale_diffusion,
+    "Deconvoluzione Wiener": lambda param, scale: _scale_wiener(param, scale),
+    "Filtro Crimmins Speckle Removal": _scale_iteration_param,
+}
+
+
+def scale_filters(filters, scale):
+    """
+    Adatta i parametri di una catena (nome filtro, parametri) a un'immagine ridimensionata di un fattore scale.
+    """
+    if scale == 1.0:
+        return list(filters)
+
+    scaled_filters = []
+    for filter_name, param in filters:
+        scaler = _PARAM_SCALERS.get(filter_name)
+        if scaler is not None:
+            try:
+                param = scaler(param, scale)
+            except (TypeError, KeyError):
+                pass  # parametri non validi: l'errore verra' segnalato dal FilterWorker
+        scaled_filters.append((filter_name, param))
+    return scaled_filters
@@ -0,0 +1,217 @@
+﻿import csv
+import json
+import os
+import sqlite3
+import threading
+
+from utils import format_filter_params, append_filter_results
+
+# archivio dei risultati e CSV nel formato storico, letto dal notebook e da SavePlots.py
+RESULTS_DB = 'risultati.db'
+RESULTS_CSV = 'risultati.csv'
+
+# righe accumulate in memoria prima di un inserimento in blocco
+DEFAULT_BATCH_SIZE = 256
+
+CSV_HEADER = ["ID", "NomeFile", "NomeFiltro", "Parametri", "PSNR", "MSE", "SSIM"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS id_sequence (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    image_name TEXT NOT NULL,
+    psnr REAL,
+    mse REAL,
+    ssim REAL
+);
+CREATE TABLE IF NOT EXISTS filter_steps (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    position INTEGER NOT NULL,
+    filter_name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    params_json TEXT,
+    PRIMARY KEY (run_id, position)
+);
+CREATE INDEX IF NOT EXISTS runs_image_name ON runs(image_name);
+CREATE INDEX IF NOT EXISTS filter_steps_filter_name ON filter_steps(filter_name);
+"""
+
+
+def _metric_value(value):
+    # "N/A" (SSIM non calcolabile) diventa NULL nel database
+    return value if isinstance(value, (int, float)) else None
+
+
+def _csv_metric(value):
+    return "N/A" if value is None else value
+
+
+class ResultsStore:
+    """
+    Archivio SQLite dei risultati: una riga per ogni immagine salvata (runs) e una per ogni filtro della catena
+    (filter_steps), con indici sul nome dell'immagine e del filtro.
+
+    Gli ID vengono riservati da una sequenza nel database, senza rileggere i risultati precedenti; gli inserimenti
+    vengono accumulati e scritti in blocco da flush(). Se csv_filename e' indicato, ogni flush aggiunge le stesse
+    righe in coda al CSV nel formato storico (una riga per filtro), cosi' il notebook continua a funzionare.
+    """
+
+    def __init__(self, path=RESULTS_DB, csv_filename=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.csv_filename = csv_filename
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+
+        is_new = not os.path.isfile(path)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL: la riserva di un ID e' una transazione piccola e i lettori (notebook, SavePlots) non bloccano la GUI
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+        # al primo avvio vengono importati i risultati gia' presenti nel CSV, cosi' gli ID proseguono
+        if is_new and csv_filename is not None and os.path.isfile(csv_filename):
+            self.import_csv(csv_filename)
+
+    def reserve_ids(self, count=1):
+        """
+        Riserva count ID consecutivi (transazione esclusiva: sicuro anche con piu' processi sullo stesso file).
+
+        Returns:
+            Il primo ID riservato.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            row = self._connection.execute("SELECT value FROM id_sequence WHERE name = 'runs'").fetchone()
+            if row is None:
+                first_id = self._connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM runs").fetchone()[0]
+                self._connection.execute("INSERT INTO id_sequence (name, value) VALUES ('runs', ?)",
+                                         (first_id + count,))
+            else:
+                first_id = row[0]
+                self._connection.execute("UPDATE id_sequence SET value = ? WHERE name = 'runs'",
+                                         (first_id + count,))
+        return first_id
+
+    def add_run(self, image_name, filters, metrics, run_id=None):
+        """
+        Aggiunge un risultato al buffer.
+
+        Args:
+            filters: catena applicata, [(nome filtro, parametri)].
+            metrics: (psnr, mse, ssim).
+            run_id: ID gia' riservato; se None ne viene riservato uno nuovo.
+
+        Returns:
+            L'ID del risultato.
+        """
+        if run_id is None:
+            run_id = self.reserve_ids()
+
+        with self._lock:
+            self._pending.append((run_id, image_name, list(filters), tuple(metrics)))
+            should_flush = len(self._pending) >= self.batch_size
+
+        if should_flush:
+            self.flush()
+        return run_id
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+
+            runs = []
+            steps = []
+            for run_id, image_name, filters, (psnr_value, mse_value, ssim_value) in pending:
+                runs.append((run_id, image_name, _metric_value(psnr_value), _metric_value(mse_value),
+                             _metric_value(ssim_value)))
+                for position, (filter_name, params) in enumerate(filters):
+                    steps.append((run_id, position, filter_name, format_filter_params(params),
+                                  json.dumps(params, ensure_ascii=False)))
+
+            with self._connection:
+                self._connection.executemany("INSERT INTO runs (id, image_name, psnr, mse, ssim) "
+                                             "VALUES (?, ?, ?, ?, ?)", runs)
+                self._connection.executemany("INSERT INTO filter_steps (run_id, position, filter_name, params, "
+                                             "params_json) VALUES (?, ?, ?, ?, ?)", steps)
+
+        if self.csv_filename is not None:
+            append_filter_results(self.csv_filename, pending)
+
+    def import_csv(self, csv_filename):
+        """
+        Importa un CSV nel formato storico (una riga per filtro, metriche ripetute); i parametri restano testuali.
+        """
+        runs = {}
+        positions = {}
+        steps = []
+        with open(csv_filename, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            for row in reader:
+                if not row:
+                    continue
+                run_id = int(row[0])
+                if run_id not in runs:
+                    metrics = []
+                    for value in row[4:7]:
+                        try:
+                            metrics.append(float(value))
+                        except ValueError:
+                            metrics.append(None)
+                    runs[run_id] = (run_id, row[1], *metrics)
+                position = positions.get(run_id, 0)
+                positions[run_id] = position + 1
+                steps.append((run_id, position, row[2], row[3], None))
+
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO runs (id, image_name, psnr, mse, ssim) "
+                                         "VALUES (?, ?, ?, ?, ?)", runs.values())
+            self._connection.executemany("INSERT OR IGNORE INTO filter_steps (run_id, position, filter_name, params, "
+                                         "params_json) VALUES (?, ?, ?, ?, ?)", steps)
+        return len(runs)
+
+    def export_csv(self, csv_filename):
+        """
+        Riscrive l'intero archivio nel formato CSV storico (ID, NomeFile, NomeFiltro, Parametri, PSNR, MSE, SSIM).
+        """
+        self.flush()
+        rows = self._connection.execute(
+            "SELECT runs.id, runs.image_name, filter_steps.filter_name, filter_steps.params, runs.psnr, runs.mse, "
+            "runs.ssim FROM runs JOIN filter_steps ON filter_steps.run_id = runs.id "
+            "ORDER BY runs.id, filter_steps.position")
+
+        with open(csv_filename, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_HEADER)
+            for run_id, image_name, filter_name, params, psnr_value, mse_value, ssim_value in rows:
+                writer.writerow([run_id, image_name, filter_name, params, _csv_metric(psnr_value),
+                                 _csv_metric(mse_value), _csv_metric(ssim_value)])
+
+    def runs_for_image(self, image_name):
+        self.flush()
+        return self._connection.execute("SELECT id, psnr, mse, ssim FROM runs WHERE image_name = ? ORDER BY id",
+                                        (image_name,)).fetchall()
+
+    def runs_with_filter(self, filter_name):
+        self.flush()
+        return self._connection.execute(
+            "SELECT DISTINCT runs.id, runs.image_name, runs.psnr, runs.mse, runs.ssim FROM runs "
+            "JOIN filter_steps ON filter_steps.run_id = runs.id WHERE filter_steps.filter_name = ? ORDER BY runs.id",
+            (filter_name,)).fetchall()
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,75 @@
+﻿"""
+Controllo del tempo di avvio del nucleo senza GUI (pipeline dei filtri, I/O delle immagini, metriche, batch).
+
+Ogni misura avvia un interprete Python nuovo, quindi comprende anche numpy e OpenCV; scipy e skimage vengono
+importati solo dai filtri e dalle metriche che li usano, PyQt5 solo dalla GUI. Il controllo fallisce se il tempo
+supera IMPORT_BUDGET_SECONDS oppure se uno dei moduli pesanti viene caricato all'import.
+
+Esempio:
+    python startup_budget.py --runs 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# budget pubblicato (README, "Batch Processing") per l'import di CORE_MODULES in un processo nuovo
+IMPORT_BUDGET_SECONDS = 0.5
+
+CORE_MODULES = ("pipeline", "image_io", "metrics", "utils", "batch")
+
+# moduli che non devono essere caricati dal nucleo
+HEAVY_MODULES = ("PyQt5", "scipy", "skimage", "matplotlib", "pandas")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(modules=CORE_MODULES):
+    """
+    Importa i moduli in un interprete nuovo.
+
+    Returns:
+        (secondi, moduli pesanti caricati)
+    """
+    probe = _PROBE.format(modules=", ".join(modules), heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result["seconds"], result["loaded"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica il tempo di import del nucleo senza GUI.")
+    parser.add_argument("--runs", type=int, default=3, help="numero di avvii (si considera il piu' veloce)")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS, help="budget in secondi")
+    args = parser.parse_args(argv)
+
+    timings = []
+    loaded = set()
+    for _ in range(max(1, args.runs)):
+        seconds, heavy = measure_import()
+        timings.append(seconds)
+        loaded.update(heavy)
+
+    # il minimo esclude il rumore dovuto alla cache del disco e al carico della macchina
+    best = min(timings)
+    print(f"Import di {', '.join(CORE_MODULES)}: {best * 1000:.0f} ms (budget {args.budget * 1000:.0f} ms, "
+          f"{len(timings)} avvii)")
+
+    failed = False
+    if loaded:
+        print(f"Moduli pesanti caricati all'import: {', '.join(sorted(loaded))}")
+        failed = True
+    if best > args.budget:
+        print("Budget di avvio superato.")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,71 @@
+﻿import os
+
+import cv2
+import numpy as np
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+
+
+@pytest.fixture
+def window(tmp_path, monkeypatch):
+    # risultati.db e risultati.csv vengono creati nella cartella corrente
+    monkeypatch.chdir(tmp_path)
+    from gui import ImageRestorationApp
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = ImageRestorationApp()
+    yield window
+    for worker in list(window.active_workers):
+        worker.stop()
+        worker.wait()
+    app.processEvents()
+
+
+def write_image(path, value):
+    rng = np.random.default_rng(value)
+    image = rng.integers(0, 256, (96, 128, 3), dtype=np.uint8)
+    cv2.imwrite(str(path), image)
+    return str(path)
+
+
+def test_open_image_supersedes_running_chain(window, tmp_path):
+    window.open_image(write_image(tmp_path / 'prima.png', 1))
+    window.applied_filters = [('Diffusione Anisotropica', {'iterations': 200, 'k': 20, 'gamma': 0.1, 'option': 1})]
+    window.apply_all_filters()
+    old_worker, old_generation = window.worker, window.generation
+
+    window.open_image(write_image(tmp_path / 'seconda.png', 2))
+    assert window.generation > old_generation
+    assert old_worker.cancel_token.cancelled
+
+    old_worker.wait()
+    QtWidgets.QApplication.processEvents()
+
+    # il risultato della catena sull'immagine precedente non arriva alla GUI ne' alla cache
+    new_image = window.restored_image
+    window.on_filter_applied(np.zeros_like(new_image), old_generation)
+    assert window.restored_image is new_image
+    assert window.full_result_generation != old_generation
+    assert window.prefix_cache.used_bytes == 0
+
+
+def test_save_during_chain_waits_for_full_resolution(window, tmp_path, monkeypatch):
+    window.open_image(write_image(tmp_path / 'prima.png', 1))
+    window.applied_filters = [('Diffusione Anisotropica', {'iterations': 500, 'k': 20, 'gamma': 0.1, 'option': 1})]
+    window.apply_all_filters()
+
+    target = tmp_path / 'salvata.png'
+    monkeypatch.setattr(QtWidgets.QFileDialog, 'getSaveFileName', lambda *args, **kwargs: (str(target), ''))
+
+    # la richiesta ritorna subito, senza attendere il worker sul thread della GUI
+    window.save_restored_image()
+    assert window.worker.isRunning()
+    assert window.pending_save == str(target)
+    assert not target.exists()
+
+    window.worker.wait()
+    QtWidgets.QApplication.processEvents()
+    assert window.pending_save is None
+    assert np.array_equal(cv2.imread(str(target)), window.worker.result)
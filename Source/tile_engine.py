@@ -0,0 +1,548 @@
+﻿import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+from cancellation import check_cancelled
+from convergence import split_iteration_param
+from fft_engine import configure_fft
+from pipeline import build_chain
+from transfer_functions import psf_radius
+from utils import is_grayscale
+
+# budget di memoria predefinito per i buffer di un tile (immagine, alone e copie di lavoro dei filtri)
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# lato minimo di un tile senza alone: sotto questo valore l'alone costerebbe piu' del tile stesso
+MIN_TILE_SIZE = 16
+
+# la deconvoluzione di Wiener in frequenza non ha supporto finito: alone di alcune volte il raggio della PSF
+WIENER_PSF_HALO_FACTOR = 4
+
+# tile per processo nell'esecuzione parallela: abbastanza da bilanciare il carico tra tile piu' e meno costosi
+TILES_PER_WORKER = 4
+
+# variabili lette dalle librerie BLAS/OpenMP al caricamento: nei processi del pool valgono per quelle importate dopo
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def _odd_kernel(kernel_size, minimum=1):
+    # stessa normalizzazione dei filtri: sotto il minimo diventa 3, i valori pari diventano dispari
+    if kernel_size < minimum:
+        kernel_size = 3
+    if kernel_size % 2 == 0:
+        kernel_size += 1
+    return kernel_size
+
+
+def _gaussian_halo(param):
+    kernel_size = param['kernel_size']
+    if kernel_size <= 0:  # dimensione ricavata da OpenCV dalla sigma
+        return int(math.ceil(4 * param['sigma'])) + 1
+    return _odd_kernel(kernel_size) // 2
+
+
+def _wiener_halo(param):
+    if 'psf' in param:
+        return WIENER_PSF_HALO_FACTOR * psf_radius(param['psf'], param['psf_size'])
+    return max(param['kernel_size'], 2) // 2
+
+
+def _iterations(param):
+    if isinstance(param, dict):
+        return param['iterations']
+    return split_iteration_param(param)[0]
+
+
+# alone (pixel per lato) necessario perche' il centro di un tile sia identico al risultato sull'immagine intera:
+# raggio del kernel, oppure iterazioni x raggio dello stencil per i filtri iterativi. None: filtro globale (in
+# frequenza o dipendente dalle coordinate), che si puo' applicare solo all'immagine intera
+FILTER_HALOS = {
+    "Filtro Mediano": lambda param: _odd_kernel(param, 2) // 2,
+    "Filtro MedianBlur": lambda param: _odd_kernel(param, 2) // 2,
+    "Filtro Media Aritmetica": lambda param: _odd_kernel(param, 2) // 2,
+    "Filtro Media Geometrica": lambda param: _odd_kernel(param) // 2,
+    "Filtro Media Geometrica Logaritmica": lambda param: _odd_kernel(param) // 2,
+    "Filtro Gaussiano": _gaussian_halo,
+    "Filtro Contra-Harmonic Mean": lambda param: _odd_kernel(param['kernel_size']) // 2,
+    "Filtro Notch": lambda param: None,
+    "Filtro Shock": lambda param: _iterations(param),  # Laplaciano e Sobel 3x3
+    "Filtro Homomorphic": lambda param: None,
+    "Diffusione Anisotropica": lambda param: _iterations(param),  # 4 vicini
+    # mediana 3x3 preliminare, poi gradiente e divergenza piu' sfocatura e sua aggiunta a ogni iterazione
+    "Deconvoluzione ℓ1-TV": lambda param: 1 + 2 * _iterations(param),
+    "Deconvoluzione Wiener": _wiener_halo,
+    "Filtro Crimmins Speckle Removal": lambda param: _iterations(param),  # 8 vicini
+    "Rumore Gaussiano": lambda param: 0,
+    "Rumore Sale e Pepe": lambda param: 0,
+    "Rumore Uniforme": lambda param: 0,
+    "Rumore Grana della Pellicola": lambda param: 0,
+    "Rumore Periodico": lambda param: None,
+}
+
+# filtri con il bordo dell'implementazione originale: np.roll sull'immagine estesa di pad pixel riflessi, cioe' un
+# dominio periodico. Un tile che tocca un bordo prende l'alone dal lato opposto dell'immagine (_wrap_indices), quindi
+# questi filtri vengono eseguiti in un passaggio a parte (vedi chain_passes)
+WRAP_PADS = {
+    "Diffusione Anisotropica": 2,
+    "Filtro Crimmins Speckle Removal": 1,
+}
+
+# picco di memoria per elemento (pixel x canale) di un'immagine uint8, compresi ingresso e uscita: misurato con
+# tracemalloc e arrotondato per eccesso per i buffer interni di OpenCV, che tracemalloc non vede
+BYTES_PER_ELEMENT = {
+    "Filtro Mediano": 4,
+    "Filtro MedianBlur": 3,
+    "Filtro Media Aritmetica": 4,
+    "Filtro Media Geometrica": 16,
+    "Filtro Media Geometrica Logaritmica": 16,
+    "Filtro Gaussiano": 4,
+    "Filtro Contra-Harmonic Mean": 40,
+    "Filtro Notch": 112,
+    "Filtro Shock": 36,
+    "Filtro Homomorphic": 48,
+    "Diffusione Anisotropica": 20,
+    "Deconvoluzione ℓ1-TV": 36,
+    "Deconvoluzione Wiener": 24,
+    "Filtro Crimmins Speckle Removal": 12,
+    "Rumore Gaussiano": 20,
+    "Rumore Sale e Pepe": 4,
+    "Rumore Uniforme": 12,
+    "Rumore Grana della Pellicola": 12,
+    "Rumore Periodico": 24,
+}
+WIENER_PSF_BYTES_PER_ELEMENT = 72
+
+
+def filter_halo(filter_name, param):
+    """
+    Returns:
+        Alone in pixel del filtro, oppure None se il filtro non si puo' applicare a tile.
+
+    Raises:
+        ValueError: se il filtro non e' riconosciuto.
+    """
+    halo = FILTER_HALOS.get(filter_name)
+    if halo is None:
+        raise ValueError(f"Filtro non riconosciuto: '{filter_name}'")
+    return halo(param)
+
+
+def chain_halo(filters):
+    # gli aloni dei filtri in sequenza si sommano; None se un filtro della catena e' globale
+    total = 0
+    for filter_name, param in filters:
+        halo = filter_halo(filter_name, param)
+        if halo is None:
+            return None
+        total += halo
+    return total
+
+
+def chain_bytes_per_element(filters):
+    # i passi vengono eseguiti uno alla volta: conta il piu' costoso, piu' il tile letto che resta in memoria
+    peak = 0
+    for filter_name, param in filters:
+        if filter_name == "Deconvoluzione Wiener" and 'psf' in param:
+            peak = max(peak, WIENER_PSF_BYTES_PER_ELEMENT)
+        else:
+            peak = max(peak, BYTES_PER_ELEMENT.get(filter_name, 0))
+    return peak + 1
+
+
+def chain_passes(filters):
+    """
+    Divide la catena in passaggi eseguiti uno dopo l'altro sull'intera immagine: i filtri consecutivi con il bordo
+    riflesso stanno in un solo passaggio, ogni filtro con il bordo avvolto (WRAP_PADS) in uno proprio.
+
+    Returns:
+        Lista di (filtri del passaggio, pad dell'avvolgimento oppure None).
+    """
+    passes = []
+    for filter_name, param in filters:
+        pad = WRAP_PADS.get(filter_name)
+        if pad is None and passes and passes[-1][1] is None:
+            passes[-1][0].append((filter_name, param))
+        else:
+            passes.append(([(filter_name, param)], pad))
+    return passes
+
+
+def plan_tiles(shape, filters, memory_budget=DEFAULT_MEMORY_BUDGET, min_tiles=1):
+    """
+    Sceglie il lato dei tile in modo che un tile con il suo alone, elaborato dalla catena, resti nel budget.
+
+    Args:
+        min_tiles: numero di tile desiderato (esecuzione parallela); i tile vengono rimpiccioliti fino a
+            MIN_TILE_SIZE per arrivarci. Con una catena che contiene filtri globali resta un solo tile.
+
+    Returns:
+        (lato del tile senza alone, alone); se l'immagine intera rientra nel budget (e min_tiles e' 1, oppure la
+        catena non si puo' dividere) il tile e' l'immagine intera (lato pari al lato maggiore) e l'alone e' 0.
+
+    Raises:
+        ValueError: se un filtro globale non rientra nel budget, o il budget non basta per tile di MIN_TILE_SIZE.
+    """
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) == 3 else 1
+    element_bytes = chain_bytes_per_element(filters) * channels
+    fits = height * width * element_bytes <= memory_budget
+
+    halo = chain_halo(filters)
+    if fits and (min_tiles <= 1 or halo is None):
+        return max(height, width), 0
+
+    if halo is None:
+        global_filters = [name for name, param in filters if filter_halo(name, param) is None]
+        raise ValueError(f"Filtri in frequenza o dipendenti dalla posizione ({', '.join(global_filters)}): "
+                         f"l'immagine {width}x{height} non rientra nel budget di {memory_budget} byte")
+
+    tile_size = math.isqrt(memory_budget // element_bytes) - 2 * halo
+    if tile_size < MIN_TILE_SIZE:
+        raise ValueError(f"Budget di {memory_budget} byte insufficiente per tile di {MIN_TILE_SIZE} pixel con un "
+                         f"alone di {halo} pixel")
+    if min_tiles > 1:
+        tile_size = min(tile_size, max(MIN_TILE_SIZE, math.ceil(math.sqrt(height * width / min_tiles))))
+    return tile_size, halo
+
+
+def iter_tiles(height, width, tile_size, halo):
+    """
+    Griglia dei tile: per ognuno la regione da leggere (tile piu' alone, ritagliata ai bordi dell'immagine) e la
+    posizione del tile all'interno di quella regione.
+
+    Yields:
+        ((y0, y1, x0, x1) del tile, (y0, y1, x0, x1) della regione letta)
+    """
+    for y0 in range(0, height, tile_size):
+        y1 = min(y0 + tile_size, height)
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            yield (y0, y1, x0, x1), (max(y0 - halo, 0), min(y1 + halo, height), max(x0 - halo, 0),
+                                     min(x1 + halo, width))
+
+
+def _without_tolerance(filters):
+    # l'arresto alla convergenza deciso tile per tile darebbe giunture: si eseguono tutte le iterazioni
+    stripped = []
+    for filter_name, param in filters:
+        if isinstance(param, dict) and 'tolerance' in param:
+            param = {key: value for key, value in param.items() if key != 'tolerance'}
+        stripped.append((filter_name, param))
+    return stripped
+
+
+def _apply_chain(chain, tile, cancel_token, grayscale=False):
+    # grayscale viene deciso una volta per tutta l'immagine (vedi is_grayscale_array), mai tile per tile
+    if grayscale:
+        tile = cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+
+    for _, filter_func, _ in chain:
+        tile = filter_func(tile, cancel_token, None)
+
+    if grayscale:
+        tile = cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR)
+    return tile
+
+
+def _wrap_indices(start, stop, length, pad):
+    # indici nell'immagine delle posizioni [start, stop) del dominio periodico di un filtro avvolto: l'immagine estesa
+    # di pad pixel riflessi (np.pad 'reflect') e ripetuta con periodo length + 2 * pad
+    index = np.abs(np.arange(start, stop) % (length + 2 * pad) - pad)
+    return np.where(index > length - 1, 2 * (length - 1) - index, index)
+
+
+def _pass_tiles(height, width, tile_size, halo, pad):
+    """
+    Tile di un passaggio: (tile, indice della regione letta, posizione del tile nella regione). Per i filtri con il
+    bordo riflesso la regione e' ritagliata ai bordi dell'immagine (slice); per quelli avvolti (pad) l'alone oltre un
+    bordo viene dal lato opposto, come nel filtro applicato all'immagine intera (indici).
+    """
+    for core, (ry0, ry1, rx0, rx1) in iter_tiles(height, width, tile_size, halo):
+        y0, y1, x0, x1 = core
+        if pad is None or halo == 0:
+            yield core, (slice(ry0, ry1), slice(rx0, rx1)), (y0 - ry0, x0 - rx0)
+        else:
+            rows = _wrap_indices(y0 + pad - halo, y1 + pad + halo, height, pad)
+            cols = _wrap_indices(x0 + pad - halo, x1 + pad + halo, width, pad)
+            yield core, np.ix_(rows, cols), (halo, halo)
+
+
+def _filter_region(chain, tile, core, offset, cancel_token=None, grayscale=False):
+    # applica la catena al tile letto con l'alone e restituisce solo il tile senza alone (core), che nella regione
+    # letta inizia in offset
+    y0, y1, x0, x1 = core
+    oy, ox = offset
+    result = _apply_chain(chain, tile, cancel_token, grayscale)
+    if result.shape != tile.shape:
+        raise ValueError(f"La catena ha restituito un tile {result.shape} invece di {tile.shape}")
+    return result[oy:oy + y1 - y0, ox:ox + x1 - x0]
+
+
+def _process_tile(chain, source, destination, core, index, offset, cancel_token=None, grayscale=False):
+    y0, y1, x0, x1 = core
+    tile = np.array(source[index])
+    destination[y0:y1, x0:x1] = _filter_region(chain, tile, core, offset, cancel_token, grayscale)
+
+
+def _pass_targets(source, destination, scratch, passes):
+    # (ingresso, uscita) di ogni passaggio: le uscite si alternano tra destination e scratch, in modo che nessun
+    # passaggio legga l'array che sta scrivendo e l'ultimo scriva in destination
+    outputs = [destination if (passes - 1 - index) % 2 == 0 else scratch for index in range(passes)]
+    return list(zip([source] + outputs[:-1], outputs))
+
+
+@contextmanager
+def _scratch_array(like, passes):
+    # array intermedio, solo con piu' di un passaggio: memmap temporaneo accanto a like se like e' su disco (immagini
+    # piu' grandi della memoria), altrimenti in memoria
+    filename = getattr(like, 'filename', None)
+    if passes < 2:
+        yield None
+    elif filename is None:
+        yield np.empty(like.shape, like.dtype)
+    else:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(filename))) as directory:
+            yield np.lib.format.open_memmap(os.path.join(directory, 'passaggio.npy'), mode='w+', dtype=like.dtype,
+                                            shape=like.shape)
+
+
+def is_grayscale_array(source, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Come utils.is_grayscale (HxW, o HxWx3 con i canali uguali), letto a strisce di righe entro memory_budget: per i
+    memmap piu' grandi della memoria.
+    """
+    if source.ndim == 2:
+        return True
+    if source.shape[2] != 3:
+        return False
+    rows = max(1, memory_budget // (source.shape[1] * source.shape[2] * source.dtype.itemsize))
+    return all(is_grayscale(np.asarray(source[y:y + rows])) for y in range(0, source.shape[0], rows))
+
+
+def run_chain_tiled(source, destination, filters, memory_budget=DEFAULT_MEMORY_BUDGET, cancel_token=None,
+                    progress=None, grayscale=False):
+    """
+    Applica una catena di filtri a un'immagine piu' grande della memoria, un tile alla volta.
+
+    Ogni tile viene letto con un alone largo quanto la catena ne richiede (vedi FILTER_HALOS), elaborato e ritagliato,
+    quindi il risultato non ha giunture. I filtri con il bordo avvolto (WRAP_PADS) vengono eseguiti in passaggi a
+    parte, con l'alone oltre i bordi preso dal lato opposto dell'immagine, e coincidono con quelli sull'immagine
+    intera anche ai bordi; tra due passaggi il risultato intermedio sta in un memmap temporaneo accanto a destination
+    (o in memoria se destination non e' su disco). A differenza di run_chain un errore interrompe l'elaborazione, le
+    tolleranze di convergenza vengono ignorate e i filtri in frequenza consecutivi non vengono fusi.
+
+    Args:
+        source: array uint8 HxW o HxWxC in lettura, di solito un memmap (vedi open_image_array).
+        destination: array della stessa forma e tipo in cui scrivere il risultato (vedi create_image_array).
+        memory_budget: byte massimi per il tile in elaborazione e le copie di lavoro dei filtri.
+        progress: chiamata come progress(tile completati, tile totali), con i tile di tutti i passaggi.
+        grayscale: sorgente HxWx3 con i canali uguali (vedi is_grayscale_array): ogni tile viene filtrato in scala di
+            grigi e riscritto su tre canali, come fa il caricamento delle immagini in gui.py e batch.py.
+
+    Returns:
+        Numero di tile elaborati, in tutti i passaggi.
+    """
+    if source.shape != destination.shape:
+        raise ValueError(f"Forma di destinazione {destination.shape} diversa da quella di origine {source.shape}")
+
+    height, width = source.shape[:2]
+    plans = []
+    for pass_filters, pad in chain_passes(_without_tolerance(filters)):
+        tile_size, halo = plan_tiles(source.shape, pass_filters, memory_budget)
+        plans.append((build_chain(pass_filters, fuse_spectra=False),
+                      list(_pass_tiles(height, width, tile_size, halo, pad))))
+    total = sum(len(tiles) for _, tiles in plans)
+
+    done = 0
+    with _scratch_array(destination, len(plans)) as scratch:
+        for (chain, tiles), (pass_source, pass_destination) in zip(plans, _pass_targets(source, destination, scratch,
+                                                                                       len(plans))):
+            for core, index, offset in tiles:
+                check_cancelled(cancel_token)
+                _process_tile(chain, pass_source, pass_destination, core, index, offset, cancel_token, grayscale)
+
+                # le pagine scritte vengono scaricate su disco a ogni riga di tile
+                if core[3] == width and hasattr(pass_destination, 'flush'):
+                    pass_destination.flush()
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+    return total
+
+
+def configure_threads(threads):
+    """
+    Thread di OpenCV, della FFT e (per le librerie caricate dopo) di BLAS/OpenMP nel processo corrente: con un pool
+    di processi ognuno ne usa pochi, cosi' processi x thread non supera i core disponibili.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    cv2.setNumThreads(threads)
+    configure_fft(workers=threads)
+
+
+def _init_tile_worker(threads):
+    configure_threads(threads)
+    # ogni processo ha il suo stato casuale, altrimenti i rumori sarebbero uguali in tutti i tile
+    np.random.seed()
+
+
+def create_tile_pool(workers=None, threads_per_worker=1):
+    """
+    Pool di processi per run_chain_parallel, riutilizzabile per piu' immagini (l'avvio dei processi costa).
+    """
+    # i processi devono condividere il resource tracker del processo principale: con uno proprio, all'uscita
+    # rimuoverebbero i blocchi di memoria condivisa che hanno aperto
+    resource_tracker.ensure_running()
+    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=_init_tile_worker,
+                                   initargs=(threads_per_worker,))
+    # con fork i processi partono alla prima submit: si avviano subito, altrimenti erediterebbero la mappatura dei
+    # blocchi di memoria condivisa della prima immagine e la terrebbero per tutta la vita del pool
+    executor.submit(int).result()
+    return executor
+
+
+def _read_shared(name, shape, dtype, index):
+    # copia di una regione di un blocco di memoria condivisa; il blocco viene chiuso subito, senza viste rimaste
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return np.array(np.ndarray(shape, dtype=dtype, buffer=block.buf)[index])
+    finally:
+        block.close()
+
+
+def _write_shared(name, shape, dtype, index, values):
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        np.ndarray(shape, dtype=dtype, buffer=block.buf)[index] = values
+    finally:
+        block.close()
+
+
+def _run_shared_tile(input_name, output_name, shape, dtype, filters, core, index, offset):
+    # eseguito nei processi del pool: il tile viene letto e scritto nella memoria condivisa, senza pickling. I blocchi
+    # restano aperti solo durante la copia, cosi' nessun processo li tiene mappati dopo run_chain_parallel
+    y0, y1, x0, x1 = core
+    tile = _read_shared(input_name, shape, dtype, index)
+    result = _filter_region(build_chain(filters, fuse_spectra=False), tile, core, offset)
+    _write_shared(output_name, shape, dtype, np.s_[y0:y1, x0:x1], result)
+
+
+def _shared_block(shape, dtype):
+    return shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+
+
+def run_chain_parallel(image, filters, workers=None, memory_budget=DEFAULT_MEMORY_BUDGET, threads_per_worker=1,
+                       executor=None, cancel_token=None, progress=None):
+    """
+    Applica una catena di filtri dividendo l'immagine in tile con alone elaborati da un pool di processi.
+
+    Immagine di ingresso e risultato stanno in multiprocessing.shared_memory: ai processi arrivano solo i nomi dei
+    blocchi e le coordinate dei tile. Ogni processo usa threads_per_worker thread di OpenCV/FFT/BLAS. Il budget di
+    memoria viene diviso tra i processi; per il resto valgono le regole di run_chain_tiled (passaggi a parte per i
+    filtri con il bordo avvolto, tolleranze ignorate, errori che interrompono l'elaborazione, filtri globali su un
+    solo tile).
+
+    Args:
+        workers: processi del pool (anche con executor), usati per dividere il budget e scegliere i tile.
+        executor: pool creato con create_tile_pool, altrimenti ne viene creato uno con workers processi.
+        progress: chiamata come progress(tile completati, tile totali), con i tile di tutti i passaggi.
+
+    Returns:
+        L'immagine filtrata (nuovo array).
+
+    Raises:
+        FilterCancelled: se cancel_token viene annullato; i tile non ancora avviati vengono scartati.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    height, width = image.shape[:2]
+    plans = []
+    for pass_filters, pad in chain_passes(_without_tolerance(filters)):
+        tile_size, halo = plan_tiles(image.shape, pass_filters, memory_budget // workers, TILES_PER_WORKER * workers)
+        plans.append((pass_filters, list(_pass_tiles(height, width, tile_size, halo, pad))))
+    total = sum(len(tiles) for _, tiles in plans)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = create_tile_pool(workers, threads_per_worker)
+
+    # ingresso, risultato e, con piu' passaggi, il risultato intermedio
+    blocks = []
+    futures = []
+    try:
+        for _ in range(3 if len(plans) > 1 else 2):
+            blocks.append(_shared_block(image.shape, image.dtype))
+        _write_shared(blocks[0].name, image.shape, image.dtype, Ellipsis, image)
+        names = [block.name for block in blocks] + [None]
+
+        done = 0
+        for (pass_filters, tiles), (input_name, output_name) in zip(plans, _pass_targets(*names[:3], len(plans))):
+            futures = [executor.submit(_run_shared_tile, input_name, output_name, image.shape, image.dtype.str,
+                                       pass_filters, core, index, offset) for core, index, offset in tiles]
+
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                check_cancelled(cancel_token)
+                done += len(finished)
+                if progress is not None and finished:
+                    progress(done, total)
+
+        return _read_shared(blocks[1].name, image.shape, image.dtype, Ellipsis)
+    finally:
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def _tifffile():
+    # importato solo per i file TIFF
+    try:
+        import tifffile
+    except ImportError:
+        raise ValueError("Per i file TIFF e' necessario il pacchetto tifffile (pip install tifffile)")
+    return tifffile
+
+
+def open_image_array(path, shape=None, dtype=np.uint8):
+    """
+    Apre un'immagine su disco come memmap in sola lettura, senza caricarla in memoria.
+
+    Formati: .npy, .tif/.tiff non compressi (tifffile) e raw (qualsiasi altra estensione, con shape e dtype).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        return np.load(path, mmap_mode='r')
+    if extension in ('.tif', '.tiff'):
+        try:
+            return _tifffile().memmap(path, mode='r')
+        except ValueError as e:
+            raise ValueError(f"TIFF non mappabile in memoria (compresso o a tile?), convertirlo in .npy: {e}")
+    if shape is None:
+        raise ValueError(f"Per il file raw '{path}' e' necessario indicare la forma")
+    return np.memmap(path, dtype=dtype, mode='r', shape=tuple(shape))
+
+
+def create_image_array(path, shape, dtype=np.uint8):
+    """
+    Crea su disco un'immagine vuota come memmap in scrittura, negli stessi formati di open_image_array.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+    if extension in ('.tif', '.tiff'):
+        return _tifffile().memmap(path, shape=tuple(shape), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='w+', shape=tuple(shape))
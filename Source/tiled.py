@@ -0,0 +1,78 @@
+﻿"""
+Elaborazione a tile di immagini piu' grandi della memoria (lastre scansionate da 20000x20000 pixel e oltre): applica
+una configurazione salvata (FilterConfig/*.json) leggendo e scrivendo memmap .npy, raw o TIFF non compressi, con un
+budget di memoria per il tile in elaborazione. Non importa PyQt5.
+
+Esempio:
+    python tiled.py FilterConfig/GAUSSIANO_RESTAURO.json lastra.npy lastra_restaurata.npy --memory 1G
+    python tiled.py FilterConfig/Homomorphic.json lastra.raw lastra_restaurata.raw --shape 20000 20000 --memory 4G
+"""
+import argparse
+import time
+
+import cv2
+
+from tile_engine import DEFAULT_MEMORY_BUDGET, open_image_array, create_image_array, is_grayscale_array, \
+    run_chain_tiled
+from utils import load_filter_configuration
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    # "512M", "2G", "65536" -> byte
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Applica una configurazione di filtri a un'immagine molto grande, "
+                                                 "un tile alla volta.")
+    parser.add_argument("config", help="configurazione dei filtri (FilterConfig/*.json)")
+    parser.add_argument("input", help="immagine di ingresso: .npy, .tif/.tiff non compresso oppure raw")
+    parser.add_argument("output", help="immagine di uscita, nello stesso formato")
+    parser.add_argument("--memory", type=parse_size, default=DEFAULT_MEMORY_BUDGET,
+                        help="budget di memoria per il tile in elaborazione, es. 512M o 2G")
+    parser.add_argument("--shape", type=int, nargs='+', default=None,
+                        help="forma dell'immagine raw: altezza larghezza [canali]")
+    parser.add_argument("--threads", type=int, default=None, help="thread OpenCV")
+    args = parser.parse_args(argv)
+
+    filters = load_filter_configuration(args.config)
+    if filters is None:
+        return 1
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    try:
+        source = open_image_array(args.input, args.shape)
+        destination = create_image_array(args.output, source.shape, source.dtype)
+    except (OSError, ValueError) as e:
+        print(f"Errore durante l'apertura delle immagini: {e}")
+        return 1
+
+    start_time = time.perf_counter()
+
+    def progress(done, total):
+        print(f"[{done}/{total}] tile  {time.perf_counter() - start_time:.1f} s")
+
+    try:
+        # scala di grigi decisa sull'intera immagine, come al caricamento in gui.py e batch.py
+        grayscale = source.ndim == 3 and is_grayscale_array(source, args.memory)
+        tiles = run_chain_tiled(source, destination, filters, args.memory, progress=progress, grayscale=grayscale)
+    except ValueError as e:
+        print(f"Errore durante l'elaborazione: {e}")
+        return 1
+
+    del destination  # chiude il memmap e scarica le ultime pagine
+    elapsed = time.perf_counter() - start_time
+    height, width = source.shape[:2]
+    print(f"Completato: {width}x{height} in {tiles} tile, {elapsed:.1f} s "
+          f"({width * height / 1e6 / elapsed:.2f} MP/s). Risultato in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
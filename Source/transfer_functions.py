@@ -0,0 +1,237 @@
+﻿import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+# memoria massima occupata dalle maschere tenute in cache (LRU): il numero di maschere dipende dalla risoluzione
+TRANSFER_CACHE_BYTES = 256 * 1024 * 1024
+
+# esiti di is_hermitian tenuti in cache (solo booleani)
+HERMITIAN_CACHE_SIZE = 256
+
+# dominio in cui opera ciascun tipo di filtro: filtri consecutivi dello stesso dominio possono
+# moltiplicare le loro funzioni di trasferimento nello stesso spettro
+TRANSFER_DOMAINS = {
+    'notch': 'linear',
+    'homomorphic': 'log',
+    'wiener': 'linear',
+}
+
+# forme di PSF supportate dalla deconvoluzione di Wiener; psf_size e' sigma, lunghezza o raggio in pixel
+PSF_SHAPES = ('gaussian', 'motion', 'disk')
+
+
+def _centered_distance_grids(shape, scale):
+    # griglie (righe x 1) e (1 x colonne) delle distanze dal centro dello spettro traslato (fftshift);
+    # scale riporta le frequenze di una griglia estesa (padding a lunghezze veloci) a quella originale
+    rows, cols = shape
+    crow, ccol = rows // 2, cols // 2
+    di = (np.arange(rows, dtype=np.float64)[:, np.newaxis] - crow) * scale[0]
+    dj = (np.arange(cols, dtype=np.float64)[np.newaxis, :] - ccol) * scale[1]
+    return di, dj
+
+
+def _notch_mask(shape, scale, d0, u_k, v_k):
+    di, dj = _centered_distance_grids(shape, scale)
+
+    mask = np.ones(shape, np.float32)
+    for u, v in zip(u_k, v_k):
+        # distanze (broadcast) dal notch (u, v) e dal suo simmetrico (-u, -v)
+        duv = np.sqrt((di - u) ** 2 + (dj - v) ** 2)
+        duv_neg = np.sqrt((di + u) ** 2 + (dj + v) ** 2)
+        mask[(duv < d0) | (duv_neg < d0)] = 0
+
+    return mask
+
+
+def _homomorphic_mask(shape, scale, low, high, cutoff):
+    di, dj = _centered_distance_grids(shape, scale)
+
+    distance_squared = di ** 2 + dj ** 2
+    mask = high - (high - low) * np.exp(- distance_squared / (2 * (cutoff ** 2)))
+
+    return mask.astype(np.float32)
+
+
+def psf_radius(psf, psf_size):
+    # raggio in pixel oltre il quale la PSF e' (praticamente) nulla
+    if psf == 'gaussian':
+        return int(np.ceil(3 * psf_size))
+    if psf == 'motion':
+        return int(np.ceil(psf_size / 2))
+    if psf == 'disk':
+        return int(np.ceil(psf_size))
+    raise ValueError(f"PSF non valida: '{psf}' (ammesse: {', '.join(PSF_SHAPES)})")
+
+
+def _psf(shape, psf, psf_size, psf_angle):
+    # PSF normalizzata sulla griglia completa, centrata nell'origine con avvolgimento (indici negativi in fondo)
+    rows, cols = shape
+    di = ((np.arange(rows) + rows // 2) % rows - rows // 2).astype(np.float64)[:, np.newaxis]
+    dj = ((np.arange(cols) + cols // 2) % cols - cols // 2).astype(np.float64)[np.newaxis, :]
+
+    if psf == 'gaussian':
+        kernel = np.exp(-(di ** 2 + dj ** 2) / (2 * max(psf_size, 1e-3) ** 2))
+    elif psf == 'motion':
+        # segmento di lunghezza psf_size attraverso l'origine, angolo in gradi in senso antiorario
+        theta = np.deg2rad(psf_angle)
+        along = dj * np.cos(theta) - di * np.sin(theta)
+        across = dj * np.sin(theta) + di * np.cos(theta)
+        kernel = ((np.abs(across) <= 0.5) & (np.abs(along) <= psf_size / 2)).astype(np.float64)
+    elif psf == 'disk':
+        kernel = (di ** 2 + dj ** 2 <= psf_size ** 2).astype(np.float64)
+    else:
+        raise ValueError(f"PSF non valida: '{psf}' (ammesse: {', '.join(PSF_SHAPES)})")
+
+    # l'origine e' sempre inclusa: con dimensione 0 la PSF e' un impulso
+    return kernel / kernel.sum()
+
+
+def _wiener_mask(shape, scale, psf, psf_size, psf_angle, noise):
+    # la PSF e' in pixel: non dipende da scale (padding a lunghezze veloci)
+    transfer = np.fft.fft2(_psf(shape, psf, psf_size, psf_angle)).real
+
+    # PSF simmetrica rispetto all'origine: H e' reale e pari; la media con la sua riflessione la rende pari anche
+    # a meno degli arrotondamenti della FFT, cosi' la maschera si puo' usare con la FFT reale
+    transfer += np.roll(transfer[::-1, ::-1], 1, axis=(0, 1))
+    transfer *= 0.5
+
+    # W = conj(H) / (|H|^2 + rapporto rumore/segnale), con H reale
+    mask = transfer / (transfer ** 2 + noise)
+    return np.fft.fftshift(mask).astype(np.float32)
+
+
+_BUILDERS = {
+    'notch': _notch_mask,
+    'homomorphic': _homomorphic_mask,
+    'wiener': _wiener_mask,
+}
+
+
+class TransferCache:
+    """
+    Cache LRU delle maschere con un limite di memoria, come PrefixCache: una maschera piu' grande del limite non
+    viene memorizzata.
+    """
+
+    def __init__(self, budget_bytes=TRANSFER_CACHE_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            mask = self._entries.get(key)
+            if mask is not None:
+                self._entries.move_to_end(key)
+            return mask
+
+    def put(self, key, mask):
+        if mask.nbytes > self.budget_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._used_bytes -= self._entries.pop(key).nbytes
+
+            self._entries[key] = mask
+            self._used_bytes += mask.nbytes
+
+            while self._used_bytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._used_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used_bytes = 0
+
+
+_transfer_cache = TransferCache()
+
+
+def _build_transfer_function(filter_type, shape, params, layout, scale):
+    mask = _BUILDERS[filter_type](shape, scale, *params)
+
+    if layout == 'rfft':
+        # spettro non traslato, solo le colonne 0..cols // 2 prodotte da rfft2
+        # (vale solo per le maschere simmetriche rispetto all'origine, vedi is_hermitian)
+        mask = np.ascontiguousarray(np.fft.ifftshift(mask)[:, :shape[1] // 2 + 1])
+    elif layout == 'fft':
+        # spettro completo non traslato, come prodotto da fft2
+        mask = np.fft.ifftshift(mask)
+    return mask
+
+
+def _cached_transfer_function(filter_type, shape, params, layout, scale):
+    key = (filter_type, shape, params, layout, scale)
+    mask = _transfer_cache.get(key)
+    if mask is None:
+        mask = _build_transfer_function(filter_type, shape, params, layout, scale)
+        # la maschera e' condivisa tra le chiamate: sola lettura
+        mask.setflags(write=False)
+        _transfer_cache.put(key, mask)
+    return mask
+
+
+def _freeze(value):
+    # liste (es. u_k, v_k da JSON) -> tuple, per poterle usare come chiave della cache
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def transfer_function(filter_type, shape, *params, layout='shifted', scale=(1.0, 1.0)):
+    """
+    Restituisce la funzione di trasferimento di un filtro in frequenza.
+
+    Le maschere vengono costruite da griglie di distanza in broadcast e memorizzate in una cache LRU limitata
+    a TRANSFER_CACHE_BYTES, con chiave (filter_type, shape, parametri): rieseguire la catena dopo un undo o elaborare immagini della
+    stessa risoluzione non ricostruisce la maschera.
+
+    Args:
+        filter_type: 'notch' (parametri d0, u_k, v_k), 'homomorphic' (parametri low, high, cutoff) oppure 'wiener'
+            (parametri psf, psf_size, psf_angle, noise).
+        shape: (righe, colonne) dello spettro completo.
+        layout: 'shifted' (spettro completo traslato con fftshift), 'fft' (spettro completo non traslato) oppure
+            'rfft' (mezzo spettro non traslato).
+        scale: fattori (righe, colonne) che riportano le frequenze di una griglia estesa a quella originale.
+    """
+    return _cached_transfer_function(filter_type, tuple(shape), _freeze(params), layout, tuple(scale))
+
+
+@lru_cache(maxsize=HERMITIAN_CACHE_SIZE)
+def _cached_is_hermitian(filter_type, shape, params, scale):
+    # maschera temporanea, fuori dalla cache: per la FFT reale serve poi solo quella in layout 'rfft'
+    mask = _build_transfer_function(filter_type, shape, params, 'fft', scale)
+    # H(k) == H(-k): la maschera riflessa rispetto all'origine (indici -k mod N) deve coincidere
+    reflected = np.roll(mask[::-1, ::-1], 1, axis=(0, 1))
+    return bool(np.array_equal(mask, reflected))
+
+
+def is_hermitian(filter_type, shape, *params, scale=(1.0, 1.0)):
+    """
+    True se la maschera e' simmetrica rispetto all'origine dello spettro, cioe' se filtrando un'immagine reale il
+    risultato resta reale e si puo' usare la FFT reale. Non lo e', ad esempio, un notch con dimensioni pari che
+    tocca la riga o la colonna di Nyquist: il punto simmetrico cadrebbe fuori dalla griglia.
+    """
+    return _cached_is_hermitian(filter_type, tuple(shape), _freeze(params), tuple(scale))
+
+
+def notch_transfer_function(shape, d0, u_k, v_k, **kwargs):
+    return transfer_function('notch', shape, d0, u_k, v_k, **kwargs)
+
+
+def homomorphic_transfer_function(shape, low, high, cutoff, **kwargs):
+    return transfer_function('homomorphic', shape, low, high, cutoff, **kwargs)
+
+
+def wiener_transfer_function(shape, psf, psf_size, psf_angle, noise, **kwargs):
+    return transfer_function('wiener', shape, psf, psf_size, psf_angle, noise, **kwargs)
+
+
+def clear_transfer_function_cache():
+    _transfer_cache.clear()
+    _cached_is_hermitian.cache_clear()
@@ -1,45 +1,34 @@
-﻿from skimage.metrics import structural_similarity as ssim
-import numpy as np
-import cv2
+﻿import numpy as np
+import csv
 import json
+import os
 
 
-def calculate_psnr(original, restored):
-    return cv2.PSNR(original, restored)
+def format_filter_params(params):
+    if isinstance(params, dict):
+        return "; ".join([f"{key}={value}" for key, value in params.items()])
+    return str(params)
 
 
-def calculate_mse(original, restored):
-    mse_value = np.mean((original - restored) ** 2)
-    return mse_value
+def append_filter_results(csv_filename, rows):
+    """
+    Aggiunge al CSV dei risultati una riga per ogni filtro applicato.
 
+    Args:
+        rows: lista di (ID, nome file, filtri [(nome filtro, parametri)], (psnr, mse, ssim)).
+    """
+    file_exists = os.path.isfile(csv_filename)
 
-def calculate_ssim(original, restored):
-    if len(original.shape) == 2:
-        original = cv2.cvtColor(original, cv2.COLOR_GRAY2RGB)
-    elif original.shape[2] == 4:
-        original = cv2.cvtColor(original, cv2.COLOR_BGRA2BGR)
+    with open(csv_filename, mode='a', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
 
-    if len(restored.shape) == 2:
-        restored = cv2.cvtColor(restored, cv2.COLOR_GRAY2RGB)
-    elif restored.shape[2] == 4:
-        restored = cv2.cvtColor(restored, cv2.COLOR_BGRA2BGR)
+        if not file_exists:
+            writer.writerow(["ID", "NomeFile", "NomeFiltro", "Parametri", "PSNR", "MSE", "SSIM"])
 
-    if original.shape != restored.shape:
-        restored = cv2.resize(restored, (original.shape[1], original.shape[0]))
-
-    min_dim = min(original.shape[0], original.shape[1])
-
-    win_size = min(7, min_dim)
-
-    if win_size % 2 == 0:
-        win_size -= 1
-
-    if win_size < 3:
-        print("L'immagine è troppo piccola per calcolare l'SSIM. Impostazione di SSIM a 'N/A'.")
-        return "N/A"
-
-    ssim_value, _ = ssim(original, restored, full=True, channel_axis=-1, win_size=win_size)
-    return ssim_value
+        for image_id, image_name, filters, (psnr_value, mse_value, ssim_value) in rows:
+            for filter_name, params in filters:
+                writer.writerow([image_id, image_name, filter_name, format_filter_params(params),
+                                 psnr_value, mse_value, ssim_value])
 
 
 def is_grayscale(image):
@@ -52,10 +41,6 @@ def is_grayscale(image):
     return False
 
 
-def save_image(image, path):
-    cv2.imwrite(path, image)
-
-
 def save_filter_configuration(filters, file_path):
     try:
         with open(file_path, 'w') as f: